@@ -0,0 +1,40 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Benchmarks of the hot paths of the bot. They are kept out of the unit
+tests because their results depend on the machine they run on. Run a
+benchmark from the root of the repository with
+`python -m benchmarks.<name>`, it exits with a non-zero status if the
+measurements do not hold up.
+"""
+# Standard Library
+import logging
+import os
+import sys
+from timeit import timeit
+# Project Modules
+from database import DatabaseHandler
+from utils import utils
+
+
+def measure(func: callable, number: int) -> float:
+    """Return the average duration of a call to func in seconds"""
+    func()
+    return timeit(func, number=number) / number
+
+
+def check(condition: bool, message: str):
+    """Exit with the message if the condition of a benchmark fails"""
+    if not condition:
+        print("FAILED: {}".format(message))
+        sys.exit(1)
+    print("OK: {}".format(message))
+
+
+def open_database(directory: str, **kwargs) -> DatabaseHandler:
+    """Return a DatabaseHandler for a new database in directory"""
+    utils.STDOUT = True
+    logging.disable(logging.CRITICAL)
+    return DatabaseHandler(os.path.join(directory, "database.db"), **kwargs)
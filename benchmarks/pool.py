@@ -0,0 +1,69 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Reads completed by concurrent readers while a slow write is executing,
+with the read-only connection pool versus serialized on the writer.
+"""
+# Standard Library
+from tempfile import TemporaryDirectory
+from threading import Event, Thread
+import time
+# Project Modules
+from benchmarks import check, open_database
+
+DATE = "2018-01-01"
+WRITE_DURATION = 0.3
+READERS = 4
+
+
+def ingest(readers: int) -> (int, dict):
+    """
+    Return the number of reads completed by concurrent readers while
+    a slow write is executing and the handler metrics
+    """
+    with TemporaryDirectory() as directory:
+        db = open_database(directory, readers=readers)
+        for i in range(100):
+            db.insert_match("DM", DATE, "12:00:00", str(i))
+        # A write that is slowed down as if waiting on disk I/O
+        db.db.create_function("pause", 1, time.sleep)
+        done, reads = Event(), [0] * READERS
+
+        def reader(i: int):
+            while not done.is_set():
+                db.get_matches_count_by_day(DATE)
+                if not done.is_set():
+                    reads[i] += 1
+
+        def writer():
+            try:
+                db.exec_command("UPDATE Match SET map = pause(:duration) WHERE id = 1;", {"duration": WRITE_DURATION})
+            finally:
+                done.set()
+
+        threads = [Thread(target=writer)] + [Thread(target=reader, args=(i,)) for i in range(READERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        metrics = db.metrics()
+        db.close()
+    return sum(reads), metrics
+
+
+def main():
+    serialized, serialized_metrics = ingest(0)
+    pooled, pooled_metrics = ingest(READERS)
+    print("Reads during a {}s write: {} serialized, {} pooled".format(WRITE_DURATION, serialized, pooled))
+    print("Maximum lock wait: {:.3f}s serialized, {:.3f}s pooled".format(
+        serialized_metrics["lock_wait_max"], pooled_metrics["lock_wait_max"]))
+    check(serialized_metrics["lock_wait_max"] > WRITE_DURATION / 2, "serialized reads wait for the write")
+    check(pooled > max(10 * serialized, 10), "pooled reads continue during the write")
+    check(pooled_metrics["lock_wait_max"] < WRITE_DURATION / 2, "pooled reads do not wait for the write")
+    check(pooled_metrics["pool_peak"] <= READERS, "pool within {} connections".format(READERS))
+
+
+if __name__ == "__main__":
+    main()
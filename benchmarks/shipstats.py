@@ -0,0 +1,70 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Build time of ShipStats with the precompiled component effects versus
+deriving the component statistics from the assets on every build.
+"""
+# Standard Library
+import random
+# Project Modules
+from benchmarks import check, measure
+from data.components import COMPONENT_TYPES
+from parsing.assets import assets
+from parsing.ships import Ship
+from parsing.shipstats import ShipStats
+
+BUILDS = 20
+NUMBER = 20
+
+
+class LegacyShipStats(ShipStats):
+    """ShipStats deriving the component statistics from the assets on every build"""
+
+    def apply_comp_stats(self, comp):
+        ctg = COMPONENT_TYPES[comp.category]
+        data = assets.component(self.ship.ship_name, ctg, comp.index)
+        base = data["Base"]["Stats"].copy()
+        base.update(data["Stats"])
+        base["Cooldown"] = data["Base"]["Cooldown"]
+        self.stats[ctg] = base.copy()
+        for u in (u for u in comp.upgrades.keys() if comp.upgrades[u] is True):
+            i, s = u
+            upgrade = data["TalentTree"][i][s].copy()
+            upgrade["Target"] = upgrade["Target"].replace("0x00", "")
+            target = upgrade.pop("Target", None)
+            target = target if target != "Self" else ctg
+            upgrade.update(upgrade.pop("Stats", {}))
+            self.apply_stats(target, upgrade)
+        self.apply_stats("Ship", base)
+
+
+def get_builds(number: int) -> list:
+    """Return random fully upgraded builds supported by LegacyShipStats"""
+    random.seed(1)
+    ships = list()
+    while len(ships) < number:
+        ship = Ship.deserialize(Ship.random().serialize())
+        for component in (c for c in ship.components.values() if c is not None):
+            data = assets.component(ship.ship_name, COMPONENT_TYPES[component.category], component.index)
+            for tier, row in enumerate(data["TalentTree"]):
+                component.upgrades[(tier, random.randint(0, len(row) - 1))] = True
+        try:
+            LegacyShipStats(ship)
+        except KeyError:
+            continue
+        ships.append(ship)
+    return ships
+
+
+def main():
+    ships = get_builds(BUILDS)
+    legacy = measure(lambda: [LegacyShipStats(ship) for ship in ships], NUMBER) / BUILDS
+    precompiled = measure(lambda: [ShipStats(ship) for ship in ships], NUMBER) / BUILDS
+    print("ShipStats: legacy {:.2f}ms, precompiled {:.2f}ms per build".format(legacy * 1000, precompiled * 1000))
+    check(precompiled < legacy, "precompiled effects faster than the legacy calculation")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Latency budget of the Monte Carlo TTK simulation, which runs for the
+`build ttk simulate` Discord command.
+"""
+# Project Modules
+from benchmarks import check, measure
+from parsing.ships import Ship
+from parsing.shipops import simulate_time_to_kill
+from parsing.shipstats import get_ship_stats
+
+BUDGET = 0.25  # Seconds allowed for a full simulation
+NUMBER = 5
+
+BUILD = "Republic_NovaDive;primary/Laser Cannon/;secondary/Rocket Pods/;" \
+        "engine/Barrel Roll/;shields/Distortion Field/1;systems/EMP Field/;" \
+        "armor/Deflection Armor/;sensors/Communication Sensors/;" \
+        "thrusters/Speed Thrusters/;capacitor/Frequency Capacitor/;"
+
+
+def main():
+    source = get_ship_stats(Ship.deserialize(BUILD), ["df"])
+    target = get_ship_stats(Ship.stock("I2B"), [])
+    elapsed = measure(lambda: simulate_time_to_kill(source, target, 35.0, [], [], acc=True, seed=None), NUMBER)
+    print("Simulation: {:.1f}ms".format(elapsed * 1000))
+    check(elapsed < BUDGET, "simulation within {:.0f}ms".format(BUDGET * 1000))
+
+
+if __name__ == "__main__":
+    main()
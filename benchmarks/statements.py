@@ -0,0 +1,58 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Execution time of the hot path statements with bound parameters versus
+the formatted SQL they replaced.
+"""
+# Standard Library
+from tempfile import TemporaryDirectory
+from timeit import timeit
+# Project Modules
+from benchmarks import check, open_database
+from database import insert, select
+
+ITERATIONS = 5000
+
+LEGACY_GET_USER_ID = "SELECT id FROM User WHERE id = '{discord_id}';"
+LEGACY_GET_MATCH_ID = """
+    SELECT id FROM 'Match' WHERE server = '{server}' AND date = '{date}' AND idfmt = '{idfmt}';
+"""
+LEGACY_GET_CHARACTER_ID = "SELECT id FROM 'Character' WHERE name = '{name}' AND server = '{server}';"
+LEGACY_INSERT_RESULT = """
+    INSERT OR IGNORE INTO Result(match, char, assists, dmgd, dmgt, deaths, ship) VALUES
+        ({match}, {char}, {assists}, {dmgd}, {dmgt}, {deaths}, '{ship}');
+"""
+
+HOT_PATHS = (
+    ("get_user_in_database",
+     LEGACY_GET_USER_ID, select.GET_USER_ID, lambda i: dict(discord_id="@User#{}".format(i))),
+    ("get_match_id",
+     LEGACY_GET_MATCH_ID, select.GET_MATCH_ID, lambda i: dict(server="DM", date="2018-01-01", idfmt=str(i))),
+    ("get_character_id",
+     LEGACY_GET_CHARACTER_ID, select.GET_CHARACTER_ID, lambda i: dict(name="Char {}".format(i), server="DM")),
+    ("insert_result",
+     LEGACY_INSERT_RESULT, insert.INSERT_RESULT,
+     lambda i: dict(match=i, char=i, assists=1, dmgd=100, dmgt=1000, deaths=2, ship="Rycer")),
+)
+
+
+def main():
+    with TemporaryDirectory() as directory:
+        db = open_database(directory)
+        connection = db.db
+        for name, legacy, query, parameters in HOT_PATHS:
+            formatted = timeit(lambda: [
+                connection.execute(legacy.format(**parameters(i))).fetchall() for i in range(ITERATIONS)], number=1)
+            bound = timeit(lambda: [
+                connection.execute(query, parameters(i)).fetchall() for i in range(ITERATIONS)], number=1)
+            connection.rollback()
+            print("{}: {:.1f}us formatted, {:.1f}us bound".format(
+                name, formatted / ITERATIONS * 1e6, bound / ITERATIONS * 1e6))
+            check(bound < formatted, "{} bound faster than formatted".format(name))
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
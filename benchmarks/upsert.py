@@ -0,0 +1,77 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+
+Latency of an ingest message of a match with the upsert statements
+versus the lookups and updates they replaced.
+"""
+# Standard Library
+from functools import partial
+from tempfile import TemporaryDirectory
+import time
+# Project Modules
+from benchmarks import check, open_database
+from database import DatabaseHandler
+
+MATCHES = 100
+CHARACTERS = 4
+MATCH = ("DM", "2018-01-01", "12:00:00")
+
+
+def update_match_legacy(db: DatabaseHandler, server: str, date: str, start: str, id_fmt: str,
+                        score: float = None, map: str = None, end: str = None):
+    """Statements executed by update_match before the upsert"""
+    if db.get_match_id(server, date, id_fmt) is None:
+        db.insert_match(server, date, start, id_fmt)
+    match = db.get_match_id(server, date, id_fmt)
+    for column, value in (("score", score), ("end", end), ("map", map)):
+        if value is not None:
+            db.exec_command(
+                "UPDATE Match SET {0} = :{0} WHERE id = :match;".format(column), {column: value, "match": match})
+
+
+def insert_result_legacy(db: DatabaseHandler, character: str, server: str, date: str, start: str, id_fmt: str,
+                         assists: int, dmgd: int, dmgt: int, deaths: int, ship: str):
+    """Statements executed by insert_result before the upsert"""
+    char = db.get_character_id(server, character)
+    match = db.get_match_id(server, date, id_fmt)
+    if match is None:
+        db.insert_match(server, date, start, id_fmt)
+        match = db.get_match_id(server, date, id_fmt)
+    db.exec_command(
+        "INSERT OR IGNORE INTO Result VALUES (:match, :char, :assists, :dmgd, :dmgt, :deaths, :ship);",
+        dict(match=match, char=char, assists=assists, dmgd=dmgd, dmgt=dmgt, deaths=deaths, ship=ship))
+
+
+def ingest(update_match: callable, insert_result: callable) -> float:
+    """Return the mean latency of an ingest message of a match"""
+    messages = 0
+    start = time.perf_counter()
+    for i in range(MATCHES):
+        for j in range(CHARACTERS):
+            insert_result("Character {}".format(j), *MATCH, str(i), 1, 100, 1000, 2, "Quell")
+        update_match(*MATCH, str(i), map="tdm,km")
+        update_match(*MATCH, str(i), score=1.0 + i / 100)
+        update_match(*MATCH, str(i), end="12:10:00")
+        messages += CHARACTERS + 3
+    return (time.perf_counter() - start) / messages
+
+
+def main():
+    with TemporaryDirectory() as directory:
+        db = open_database(directory)
+        for i in range(CHARACTERS):
+            db.insert_character("Character {}".format(i), "DM", "IMP", "@TestUser#1111")
+        legacy = ingest(partial(update_match_legacy, db), partial(insert_result_legacy, db))
+        db.exec_command("DELETE FROM Result;")
+        db.exec_command("DELETE FROM Match;")
+        db.invalidate()
+        upsert = ingest(db.update_match, db.insert_result)
+        db.close()
+    print("Ingest message latency: {:.0f}us legacy, {:.0f}us upsert".format(legacy * 1e6, upsert * 1e6))
+    check(upsert < legacy, "upsert faster than the legacy statements")
+
+
+if __name__ == "__main__":
+    main()
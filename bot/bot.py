@@ -5,23 +5,24 @@ Copyright (C) 2018 RedFantom
 """
 # Standard Library
 import asyncio
+from io import BytesIO
 from typing import *
 import traceback
 # Packages
 from dateparser import parse as parse_date
 from discord.ext import commands
 from discord import \
-    User as DiscordUser, TextChannel as Channel, Message, Embed, Guild
+    User as DiscordUser, TextChannel as Channel, Message, Embed, Guild, File
 from discord.abc import PrivateChannel
 from raven import Client as RavenClient
 # Project Modules
 from bot import DiscordBotException
-from bot.embeds import embed_from_ship
+from bot.embeds import embed_from_ship, embeds_from_rolls
 from bot.func import *
 from bot.strings import *
 from bot.messages import *
 from data.servers import SERVER_NAMES
-from database import DatabaseHandler
+from database import AsyncDatabaseHandler
 from parsing.ships import Ship
 from server.discord import DiscordServer
 from settings import settings
@@ -56,7 +57,7 @@ class DiscordBot(object):
         "unregister": ((0,), "user.unregister"),
         "forgot_code": ((0,), "user.forgot_code"),
         # Data Retrieval
-        "period": ((1, 2), "overview.period"),
+        "period": ((1, 2, 3), "overview.period"),
         "day": ((0, 1), "overview.day"),
         "week": ((0,), "overview.week"),
         "matches": ((1, 2), "overview.matches"),
@@ -68,15 +69,22 @@ class DiscordBot(object):
         "scoreboard": ((0, 1), "scoreboards.parse", True),
         "build": (range(1, 20), "build.calculator"),
         "event": ((1, 2), "event", True),
+        # Maintenance
+        "admin": ((1,), "admin"),
     }
 
     DATES = {
-        "period": (True, True),
+        "period": (True, True, True),
         "day": (True,),
         "matches": (False, True),
         "results": (False, True, True),
     }
 
+    # Arguments of commands that are not parsed as dates
+    FLAGS = {
+        "period": ("daily",),
+    }
+
     PRIVATE = [
         "man",
         "servers",
@@ -99,16 +107,19 @@ class DiscordBot(object):
         "random",
         "strategy",
         "scoreboard",
-        "build"
+        "build",
+        "admin",
     ]
 
     NOT_REGISTERED_ALLOWED = ["register", "event", "help", "setup", "link"]
 
     EXCEPTION_CHANNEL = settings["exceptions"]["channel"]
 
-    def __init__(self, database: DatabaseHandler, server: DiscordServer, loop: asyncio.BaseEventLoop):
+    ADMIN_TIMEOUT = 300.0
+
+    def __init__(self, database: AsyncDatabaseHandler, server: DiscordServer, loop: asyncio.BaseEventLoop):
         """
-        :param database: DatabaseHandler instance
+        :param database: AsyncDatabaseHandler instance
         :param server: The server linked to this bot
         :param loop: The asyncio loop this bot is running in
         """
@@ -262,7 +273,7 @@ class DiscordBot(object):
             name = "{} {}".format(*args[1:])
         else:
             name = args[1]
-        owner = self.db.get_character_owner(server, name)
+        owner = await self.db.get_character_owner(server, name)
         if owner is None:
             await self.send_message(channel, UNKNOWN_CHARACTER.format(name, SERVER_NAMES[server]))
             return
@@ -274,7 +285,7 @@ class DiscordBot(object):
         server, date, start = args
         date = date.strftime(DATE_FORMAT)
         start = start.strftime(TIME_FORMAT)
-        results = self.db.get_match_results(server, date, start)
+        results = await self.db.get_match_results(server, date, start)
         self.logger.debug("Results retrieved: {}".format(results))
         if len(results) == 0:
             await self.send_message(channel, NO_RESULTS)
@@ -349,7 +360,7 @@ class DiscordBot(object):
         if not (isinstance(content, str) and len(content) > 1 and content[0] == settings["bot"]["prefix"]):
             return False
         tag = generate_tag(author)
-        if not self.db.get_user_in_database(tag) and "register" not in content:
+        if not await self.db.get_user_in_database(tag) and "register" not in content:
             await self.send_message(channel, NOT_REGISTERED)
             self.logger.debug("{} not in database.".format(tag))
             return False
@@ -467,13 +478,33 @@ class DiscordBot(object):
         if command in DiscordBot.DATES:
             dates = DiscordBot.DATES[command]
             for i, (arg, date) in enumerate(zip(args, dates)):
-                if date is True:
+                if date is True and arg not in DiscordBot.FLAGS.get(command, ()):
                     try:
                         args[i] = parse_date(arg)
                     except ValueError:
                         return False, False
         return command, args
 
+    async def admin(self, channel: Channel, user: DiscordUser, args: tuple):
+        """Maintenance bot commands, only available to the bot admin"""
+        if user.name != settings["bot"]["admin"]:
+            await self.send_message(channel, "Only the admin of this bot can use that command.")
+            return
+        command, = args
+        if command == "backfill":
+            rows = await self.db.backfill_match_daily(timeout=self.ADMIN_TIMEOUT)
+            await self.send_message(channel, "Rebuilt the daily match rollup with {} rows.".format(rows))
+        elif command == "metrics":
+            message = build_string_from_metrics(await self.db.metrics(), await self.db.query_metrics())
+            dump = await self.db.dump_metrics()
+            await channel.send(
+                DATABASE_METRICS.format(message), file=File(BytesIO(dump.encode()), "database_metrics.json"))
+        elif command == "slow":
+            await self.send_message(channel, SLOW_QUERIES.format(build_string_from_slow_queries(
+                await self.db.slow_queries())))
+        else:
+            await self.send_message(channel, INVALID_ARGS)
+
     async def event(self, channel: Channel, user: DiscordUser, args: tuple, message: Message):
         """Random ship event bot command"""
         command = args[0]
@@ -496,19 +527,21 @@ class DiscordBot(object):
             self.participants.remove(user.name)
             await self.send_message(channel, "{}, you are no longer participating.".format(user.mention))
         elif command == "roll":
-            for name in self.participants:
-                if name.strip() == "":
-                    continue
-                user = None
-                for member in message.guild.members:
-                    if name == member.name:
-                        user = member
-                mention = user.mention if user is not None else name
-                ship = Ship.random()
-                await self.send_message(
-                    channel, "{}, you are playing {}.".format(mention, ship.name),
-                    embed=embed_from_ship(ship, "Random ({}, {})".format(
-                        name, datetime.now().strftime("%H:%M")), False))
+            if len(args) == 2 and not args[1].isdigit():
+                await self.send_message(channel, "The seed of a roll should be a number.")
+                return
+            seed = int(args[1]) if len(args) == 2 else None
+            names = [name for name in self.participants if name.strip() != ""]
+            if len(names) == 0:
+                await self.send_message(channel, "There are no participants to roll for.")
+                return
+            members = {member.name: member for member in message.guild.members}
+            mentions = [members[name].mention if name in members else name for name in names]
+            rolls = list(zip(names, Ship.random_batch(len(names), seed)))
+            embeds = embeds_from_rolls(rolls, seed, datetime.now().strftime("%H:%M"))
+            await self.send_message(channel, "{}, your ships are ready.".format(", ".join(mentions)), embed=embeds[0])
+            for embed in embeds[1:]:
+                await self.send_message(channel, embed=embed)
         elif command == "dissolve" and user.name == settings["bot"]["admin"]:
             self.participants.clear()
             await self.send_message(channel, "The participant list has been cleared.")
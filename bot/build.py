@@ -3,7 +3,8 @@ Author: RedFantom
 License: GNU GPLv3 as in LICENSE
 Copyright (C) 2018 RedFantom
 """
-
+# Standard Library
+from functools import partial
 # Packages
 from discord import TextChannel as Channel, User as DiscordUser
 from discord.abc import PrivateChannel
@@ -13,10 +14,14 @@ from bot.messages import *
 from data.actives import ACTIVES
 from parsing.ships import Ship, lookup_crew, lookup_component
 from parsing.shipstats import \
-    ShipStats, \
+    get_ship_stats, \
     ActiveNotSupported, ActiveNotFound, ActiveNotAvailable
 from parsing.shipops import \
-    get_time_to_kill_acc, InfiniteShots, get_time_to_kill
+    get_time_to_kill_acc, InfiniteShots, get_time_to_kill, get_time_to_kill_matrix, get_time_to_kill_curve, \
+    simulate_time_to_kill
+from parsing.charts import render_ttk_matrix, render_ttk_curve
+from parsing.optimizer import optimize as optimize_builds, METRICS as OPTIMIZE_METRICS
+from data.ships import ship_tier_factions
 from utils import generate_tag
 
 BUILD_COMMANDS = {
@@ -28,12 +33,15 @@ BUILD_COMMANDS = {
     "delete": (1,),
     "lookup": (1,),
     "list": (0,),
-    "ttk": (2, 3, 4,),
+    "ttk": (1, 2, 3, 4, 5),
+    "optimize": (2, 3),
     "actives": (0,)
 }
 
 _list = list
 
+MATRIX_BUILDS = 24  # Maximum number of builds in a TTK matrix
+
 
 async def create(self, channel: Channel, user: DiscordUser, args: tuple):
     """
@@ -54,8 +62,8 @@ async def create(self, channel: Channel, user: DiscordUser, args: tuple):
         await self.send_message(channel,
             "That is not a valid ship base identifier. Check your command for typos and argument order.")
         return
-    data = ship.serialize()
-    number = self.db.insert_build(owner, name, data, public)
+    data = ship.encode()
+    number = await self.db.insert_build(owner, name, data, public)
     if number is None:
         await self.send_message(channel, "You already have a build with that name.")
         return
@@ -71,15 +79,15 @@ async def select(self, channel: Channel, user: DiscordUser, args: tuple):
     """
     build, element = args
     tag = generate_tag(user)
-    build = self.db.get_build_id(build, tag)
-    if not self.db.get_build_owner(build) == tag:
+    build = await self.db.get_build_id(build, tag)
+    if not await self.db.get_build_owner(build) == tag:
         await self.send_message(channel, "Shame on you. That build is not yours.")
         return
-    data = self.db.get_build_data(build)
+    data = await self.db.get_build_data(build)
     ship = Ship.deserialize(data)
     result = ship.update_element(element, None)
-    data = ship.serialize()
-    self.db.update_build_data(build, data)
+    data = ship.encode()
+    await self.db.update_build_data(build, data)
     await self.send_message(channel, result)
 
 
@@ -87,20 +95,17 @@ async def stats(self, channel: Channel, user: DiscordUser, args: tuple):
     """Show the statistics of a specific build"""
     build, = args
     build, actives = get_mod_from_build(build)
-    if not self.db.build_read_access(build, generate_tag(user)):
+    if not await self.db.build_read_access(build, generate_tag(user)):
         await self.send_message(channel, "You do not have access to that build.")
         return
     if not isinstance(channel, PrivateChannel) and user.display_name != "RedFantom":
         await self.send_message(channel, "I only want to do this in PM due to the large statistics list.")
         return
-    data = self.db.get_build_data(build)
-    name = self.db.get_build_name_id(build)
+    data = await self.db.get_build_data(build)
+    name = await self.db.get_build_name_id(build)
     ship = Ship.deserialize(data)
-    stats = ShipStats(ship)
-    if len(actives) != 0:
-        actives = stats.apply_actives(actives)
-    else:
-        actives = None
+    stats = get_ship_stats(ship, actives)
+    actives = list(stats.actives) if len(stats.actives) != 0 else None
     embed = embed_from_stats(stats, name, actives)
     await self.send_message(channel, embed=embed)
 
@@ -108,12 +113,12 @@ async def stats(self, channel: Channel, user: DiscordUser, args: tuple):
 async def show(self, channel: Channel, user: DiscordUser, args: tuple):
     """Show a build upon user request"""
     build, = args
-    if not self.db.build_read_access(build, generate_tag(user)):
+    if not await self.db.build_read_access(build, generate_tag(user)):
         await self.send_message(channel, "You do not have access to that build.")
         return
-    data = self.db.get_build_data(build)
+    data = await self.db.get_build_data(build)
     ship = Ship.deserialize(data)
-    name = self.db.get_build_name_id(build)
+    name = await self.db.get_build_name_id(build)
     embed = embed_from_ship(ship, name)
     await self.send_message(channel, embed=embed)
 
@@ -125,7 +130,7 @@ async def search(self, channel: Channel, user: DiscordUser, args: tuple):
 async def delete(self, channel: Channel, user: DiscordUser, args: tuple):
     """Delete a specific build owner by the user either by name or ID"""
     build, = args
-    name = self.db.delete_build(build, generate_tag(user))
+    name = await self.db.delete_build(build, generate_tag(user))
     await self.send_message(channel, BUILD_DELETE.format(name))
 
 
@@ -157,7 +162,7 @@ async def lookup(self, channel: Channel, user: DiscordUser, args: tuple):
 async def list(self, channel: Channel, user: DiscordUser, args: tuple):
     """List all the builds owned by a certain user"""
     tag = generate_tag(user)
-    builds = _list(self.db.get_builds_owner(tag))
+    builds = _list(await self.db.get_builds_owner(tag))
     if len(builds) == 0:
         await self.send_message(channel, "You have not created any builds.")
         return
@@ -175,13 +180,27 @@ def get_mod_from_build(build_id: str)->tuple:
     return build, actives
 
 
+TTK_ERRORS = {
+    InfiniteShots: "That scenario would take an incalculable amount of time. "
+                   "Check whether your distance is given in hundreds of metres.",
+    ZeroDivisionError: "Argh! Division by zero! Are you trying to use `Ion Cannon` to kill something?",
+    ActiveNotAvailable: "One of those actives is not available on the ship you requested it on.",
+    ActiveNotSupported: "That active ability is not supported by the calculator.",
+    ActiveNotFound: "One of the active abilities either does not exist or has not been implemented.",
+}
+
+
 async def ttk(self, channel: Channel, user: DiscordUser, args: tuple):
     """Calculate Time To Kill between two builds"""
-    tag = generate_tag(user)
-    acc = False
-    if len(args) >= 4:
-        acc = "evasion" in args
-        args = args[:3]
+    if args[0] in ("matrix", "curve"):
+        await globals()["ttk_{}".format(args[0])](self, channel, user, args[1:])
+        return
+    if len(args) == 1:
+        await self.send_message(channel, INVALID_ARGS)
+        return
+    # Flags may follow the distance in any order
+    acc, simulate = "evasion" in args[2:], "simulate" in args[2:]
+    args = args[:2] + tuple(arg for arg in args[2:] if arg not in ("evasion", "simulate"))[:1]
     # Build may be specified as build_id(active,active,active)
     if len(args) == 2:
         args += ("30",)
@@ -193,54 +212,184 @@ async def ttk(self, channel: Channel, user: DiscordUser, args: tuple):
     if not distance.isdigit() and "." not in distance:
         await self.send_message(channel, "Distance argument should be an integer [hundreds of metres].")
         return
+    builds = await get_ttk_builds(self, channel, user, source, target)
+    if builds is None:
+        return
+    (s_name, source, s_actives), (t_name, target, t_actives) = builds
+    distance = float(distance)
+    # Calculate TTK and handle errors
+    try:
+        args = (source, target, distance, s_actives, t_actives)
+        if simulate is True:
+            ttk = simulate_time_to_kill(*args, acc=acc)
+        else:
+            func = get_time_to_kill if acc is False else get_time_to_kill_acc
+            ttk = func(*args)
+    except Exception as e:
+        await handle_ttk_exception(self, channel, e)
+        return
+    if ttk is None:
+        await self.send_message(channel, "The source build does not have a PrimaryWeapon.")
+        return
+    if simulate is True:
+        embed = embed_from_ttk_distribution(ttk, s_name, t_name, source, target)
+    else:
+        embed = embed_from_ttk(ttk, s_name, t_name, source, target, acc)
+    await self.send_message(channel, embed=embed)
+
+
+async def get_ttk_builds(self, channel: Channel, user: DiscordUser, source: str, target: str) -> (tuple, None):
+    """
+    Load the source and target builds of a TTK calculation
+
+    :return: (name, Ship, actives) for the source and the target, or
+        None if the user was sent an error message
+    """
+    tag = generate_tag(user)
     (source, s_actives), (target, t_actives) = map(get_mod_from_build, (source, target))
     if not all(map(str.isdigit, (source, target))):
         await self.send_message(channel, "Those are not valid build identifiers.")
-        return
-    build_access = lambda x: self.db.build_read_access(x, tag)
+        return None
     try:
-        access = all(map(build_access, (source, target)))
+        access = await self.db.build_read_access(source, tag) and await self.db.build_read_access(target, tag)
     except ValueError:
         await self.send_message(channel, "I do not recognize one of those builds.")
-        return
+        return None
     if not access:
         await self.send_message(channel, "You do not have read access to one of those builds.")
-        return
+        return None
     # Load data required for calculations
-    s_name, t_name = map(self.db.get_build_name_id, (source, target))
-    source, target = map(self.db.get_build_data, (source, target))
+    s_name, t_name = await self.db.get_build_name_id(source), await self.db.get_build_name_id(target)
+    source, target = await self.db.get_build_data(source), await self.db.get_build_data(target)
     source, target = map(Ship.deserialize, (source, target))
-    distance = float(distance)
-    # Calculate TTK and handle errors
+    return (s_name, source, s_actives), (t_name, target, t_actives)
+
+
+async def handle_ttk_exception(self, channel: Channel, e: Exception):
+    """Inform the user of an error during a TTK calculation"""
+    for exception, message in TTK_ERRORS.items():
+        if isinstance(e, exception):
+            await self.send_message(channel, message)
+            return
+    await self.send_message(channel, "And... That's an error. Sorry.")
+    self.exception_handler(self.loop, {"message": "Error while doing TTK calculation", "exception": e})
+
+
+async def ttk_curve(self, channel: Channel, user: DiscordUser, args: tuple):
+    """
+    Calculate the Time To Kill between two builds over all distances
+    from point blank to long range of the source weapon
+
+    Command Arguments:
+        source: Source build, optionally with actives
+        target: Target build, optionally with actives
+        evasion, optional: Account for accuracy and evasion
+    """
+    if len(args) not in (2, 3) or (len(args) == 3 and args[2] != "evasion"):
+        await self.send_message(channel, INVALID_ARGS)
+        return
+    acc = len(args) == 3
+    builds = await get_ttk_builds(self, channel, user, *args[:2])
+    if builds is None:
+        return
+    (s_name, source, s_actives), (t_name, target, t_actives) = builds
     try:
-        args = (source, target, distance, s_actives, t_actives)
-        func = get_time_to_kill if acc is False else get_time_to_kill_acc
-        ttk = func(*args)
-    except InfiniteShots:
-        await self.send_message(channel, "That scenario would take an incalculable amount of time. "
-                                             "Check whether your distance is given in hundreds of metres.")
+        curve = get_time_to_kill_curve(source, target, s_actives, t_actives, acc=acc)
+    except Exception as e:
+        await handle_ttk_exception(self, channel, e)
         return
-    except ZeroDivisionError:
-        await self.send_message(
-            channel, "Argh! Division by zero! Are you trying to use `Ion Cannon` to kill something?")
+    if curve is None:
+        await self.send_message(channel, "The source build does not have a primary weapon.")
         return
-    except ActiveNotAvailable:
-        await self.send_message(
-            channel, "One of those actives is not available on the ship you requested it on.")
+    image = render_ttk_curve(curve)
+    url = await self.upload_image(image, "TTK Curve {} {}{}".format(*args[:2], " evasion" if acc else ""))
+    embed = embed_from_ttk_curve(curve, s_name, t_name, source, target, url)
+    await self.send_message(channel, embed=embed)
+
+
+async def ttk_matrix(self, channel: Channel, user: DiscordUser, args: tuple):
+    """
+    Calculate the Time To Kill of a set of builds against each other
+
+    Command Arguments:
+        builds, optional: `stock` for the stock hulls of all ships
+            (default) or `public` for the public builds
+        distance, optional: Distance in hundreds of metres
+        evasion, optional: Account for accuracy and evasion
+    """
+    builds, distance, acc, omitted = "stock", "30", False, False
+    for arg in args:
+        if arg in ("stock", "public"):
+            builds = arg
+        elif arg == "evasion":
+            acc = True
+        elif arg.replace(".", "", 1).isdigit():
+            distance = arg
+        else:
+            await self.send_message(channel, INVALID_ARGS)
+            return
+    if builds == "stock":
+        ships = [Ship.stock(base) for base in ship_tier_factions]
+        labels = [ship.name for ship in ships]
+    else:
+        public = _list(await self.db.get_public_builds())
+        omitted = len(public) > MATRIX_BUILDS
+        ships = [Ship.deserialize(data) for _, _, data in public[:MATRIX_BUILDS]]
+        labels = ["{}: {}".format(build, name)[:24] for build, name, _ in public[:MATRIX_BUILDS]]
+    if len(ships) == 0:
+        await self.send_message(channel, "There are no builds to calculate a matrix for.")
         return
-    except ActiveNotSupported:
-        await self.send_message(
-            channel, "That active ability is not supported by the calculator.")
+    # The statistics are calculated as a batch, builds with unsupported components are left empty
+    matrix = get_time_to_kill_matrix(ships, ships, float(distance), acc=acc)
+    image = render_ttk_matrix(matrix, labels, labels)
+    url = await self.upload_image(image, "TTK Matrix {} {}{}".format(builds, distance, " evasion" if acc else ""))
+    embed = embed_from_ttk_matrix(matrix, builds, url, omitted)
+    await self.send_message(channel, embed=embed)
+
+
+async def optimize(self, channel: Channel, user: DiscordUser, args: tuple):
+    """
+    Search for the best builds of a base ship against a target
+
+    Command Arguments:
+        base: r2s, i2s, etc. as ship identifier
+        target: Target build, optionally with actives, or a base ship
+            identifier for the stock ship
+        metric, optional: Key of the optimizer METRICS, ttk by default
+    """
+    base, target = args[:2]
+    metric = args[2] if len(args) == 3 else "ttk"
+    if metric not in OPTIMIZE_METRICS:
+        await self.send_message(channel, "Supported metrics are: {}.".format(", ".join(OPTIMIZE_METRICS)))
         return
-    except ActiveNotFound:
-        await self.send_message(
-            channel, "One of the active abilities either does not exist or has not been implemented.")
+    if Ship.from_base(base) is None:
+        await self.send_message(channel, "That is not a valid ship base identifier.")
         return
+    target, actives = get_mod_from_build(target)
+    if target.isdigit():
+        try:
+            access = await self.db.build_read_access(target, generate_tag(user))
+        except ValueError:
+            await self.send_message(channel, "I do not recognize that build.")
+            return
+        if not access:
+            await self.send_message(channel, "You do not have read access to that build.")
+            return
+        name, ship = await self.db.get_build_name_id(target), Ship.deserialize(await self.db.get_build_data(target))
+    else:
+        ship = Ship.stock(target)
+        if ship is None:
+            await self.send_message(channel, "The target should be a build or a ship base identifier.")
+            return
+        name = "Stock"
+    try:
+        stats = get_ship_stats(ship, actives)
     except Exception as e:
-        await self.send_message(channel, "And... That's an error. Sorry.")
-        self.exception_handler(self.loop, {"message": "Error while doing TTK calculation", "exception": e})
+        await handle_ttk_exception(self, channel, e)
         return
-    embed = embed_from_ttk(ttk, s_name, t_name, source, target, acc)
+    # The search blocks, so it is kept out of the event loop
+    result = await self.loop.run_in_executor(None, partial(optimize_builds, base, stats, metric))
+    embed = embed_from_optimize_result(result, name, ship)
     await self.send_message(channel, embed=embed)
 
 
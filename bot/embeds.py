@@ -5,9 +5,11 @@ Copyright (C) 2018 RedFantom
 """
 # Standard Library
 from collections import OrderedDict
+from math import isnan
 # Packages
 from discord import Embed
 from github import GitRelease
+import numpy as np
 # Project Modules
 from bot.static import EMBED_FOOTER
 from bot.strings import build_mine_string, get_value_string
@@ -16,13 +18,16 @@ from data.components import \
 from data import abilities
 from data import statistics as stats
 from parsing.ships import Ship, Component
-from parsing.shipstats import ShipStats
-from parsing.shipops import TimeToKill
+from parsing.shipstats import ShipStats, FrozenShipStats
+from parsing.optimizer import OptimizeResult, METRICS
+from parsing.shipops import TimeToKill, TimeToKillMatrix, TimeToKillCurve, TimeToKillDistribution
 from parsing.strategies import Strategy, Phase
 from utils.utils import setup_logger
 
 logger = setup_logger("Embeds", "embeds.log")
 
+ROLLS_PER_EMBED = 10
+
 component_colors = {
     "PrimaryWeapon": 0xffa500,
     "PrimaryWeapon2": 0xffa500,
@@ -120,6 +125,32 @@ def embed_from_ship(ship: Ship, name, crew=True) -> Embed:
     return embed
 
 
+def embeds_from_rolls(rolls: list, seed: (int, None), time: str) -> list:
+    """
+    Build embeds for the random builds of an event roll
+
+    Every embed holds up to ROLLS_PER_EMBED builds to stay within the
+    size limits of embeds.
+
+    :param rolls: List of (participant name, Ship)
+    """
+    embeds = list()
+    pages = range(0, len(rolls), ROLLS_PER_EMBED)
+    for page, start in enumerate(pages, start=1):
+        title = "Random Builds ({})".format(time)
+        if len(pages) > 1:
+            title += " {}/{}".format(page, len(pages))
+        description = "Seed: `{}`".format(seed) if seed is not None else None
+        embed = Embed(title=title, description=description, colour=0x646464)
+        for name, ship in rolls[start:start + ROLLS_PER_EMBED]:
+            value = "".join("{}: *{}*\n".format(key.capitalize(), component.name)
+                            for key, component in ship.components.items() if component is not None)
+            embed.add_field(name="{}: {}".format(name, ship.name), value=value, inline=False)
+        embed.set_footer(text="Upgrades are up to you.")
+        embeds.append(embed)
+    return embeds
+
+
 def embed_from_builds(builds: list, owner: str, private: bool) -> Embed:
     """Build a list of builds in embed form"""
     title = "Builds created by {}".format(owner.split("#")[0][1:])
@@ -145,8 +176,8 @@ def embed_from_release(release: GitRelease) -> Embed:
     return embed
 
 
-def embed_from_stats(shipstats: ShipStats, name: str, actives: list = None) -> Embed:
-    """Build a rich embed from a ShipStats instance"""
+def embed_from_stats(shipstats: (ShipStats, FrozenShipStats), name: str, actives: list = None) -> Embed:
+    """Build a rich embed from a ShipStats instance or snapshot"""
     fields = OrderedDict()
     stats_ship = shipstats["Ship"].copy()
     for stat, val in stats_ship.items():
@@ -216,6 +247,106 @@ def embed_from_ttk(ttk: TimeToKill, source_name: str, target_name: str, source:
     return embed
 
 
+def embed_from_ttk_distribution(ttk: TimeToKillDistribution, source_name: str, target_name: str,
+                                source: Ship, target: Ship) -> Embed:
+    """Build an embed from a simulated TTK distribution"""
+    title = "Time To Kill Simulation"
+    description = \
+        "**Source**: {} ({})\n".format(source_name, source.name) + \
+        "**Target**: {} ({})\n".format(target_name, target.name) + \
+        "**Distance**: {}m\n".format(ttk.distance * 100) + \
+        "**Weapon**: `{}`\n".format(ttk.weapon) + \
+        "Accuracy/Evasion **was{}** accounted for.\n".format("" if ttk.acc is True else " not") + \
+        "**Engagements simulated**: {}\n".format(len(ttk.time))
+    embed = Embed(title=title, description=description, colour=0xff2600)
+    embed.add_field(
+        name="Time Required",
+        value="*Median*: {:.1f}s\n".format(ttk.median) +
+              "*Fastest 10%*: {:.1f}s\n".format(ttk.p10) +
+              "*Slowest 10%*: {:.1f}s\n".format(ttk.p90))
+    embed.add_field(
+        name="Shots Required",
+        value="*Median*: {:.0f}\n".format(np.median(ttk.shots)) +
+              "*Range*: {} - {}\n".format(ttk.shots.min(), ttk.shots.max()))
+    if not all(len(actives) == 0 for actives in ttk.actives.values()):
+        value = "".join("*{}*: {}\n".format(key.capitalize(), ", ".join(active_list))
+                        for key, active_list in ttk.actives.items()
+                        if len(active_list) != 0)
+        embed.add_field(name="Active Abilities", value=value, inline=False)
+    embed.set_footer(text=EMBED_FOOTER)
+    return embed
+
+
+def embed_from_optimize_result(result: OptimizeResult, target_name: str, target: Ship) -> Embed:
+    """Build an embed listing the best builds found by the optimizer"""
+    title = "Build Optimizer"
+    description = \
+        "**Target**: {} ({})\n".format(target_name, target.name) + \
+        "**Metric**: {}\n".format(METRICS[result.metric].description) + \
+        "Evaluated **{}** builds in {:.1f}s. Pruning left {} of the {} fully upgraded builds.\n".format(
+            result.evaluated, result.elapsed, result.searched, result.total)
+    if result.complete is False:
+        description += "The time ran out, so better builds may exist.\n"
+    embed = Embed(title=title, description=description, colour=0xff2600)
+    unit = "{:.0f} health" if result.metric == "ehp" else "{:.1f}s"
+    for rank, (score, ship) in enumerate(result.candidates, start=1):
+        value = "".join(
+            "{}: *{}* ({})\n".format(key.capitalize(), component.name,
+                                     ship.build_upgrade_string(component.upgrades, component.type))
+            for key, component in ship.components.items() if component is not None)
+        embed.add_field(name="#{}: {}".format(rank, unit.format(score)), value=value, inline=False)
+    if len(result.candidates) == 0:
+        embed.add_field(name="Results", value="No builds could be evaluated.")
+    embed.set_footer(text=EMBED_FOOTER)
+    return embed
+
+
+def embed_from_ttk_curve(curve: TimeToKillCurve, source_name: str, target_name: str,
+                         source: Ship, target: Ship, image: str) -> Embed:
+    """Build an embed for a rendered TTK curve"""
+    title = "Time To Kill Curve"
+    description = \
+        "**Source**: {} ({})\n".format(source_name, source.name) + \
+        "**Target**: {} ({})\n".format(target_name, target.name) + \
+        "**Weapon**: `{}`\n".format(curve.weapon) + \
+        "Accuracy/Evasion **was{}** accounted for.\n".format("" if curve.acc is True else " not")
+    embed = Embed(title=title, description=description, colour=0xff2600)
+    valid = [(time, i) for i, time in enumerate(curve.time) if not isnan(time)]
+    if len(valid) != 0:
+        _, best = min(valid)
+        embed.add_field(
+            name="Fastest",
+            value="*Distance*: {:.0f}m\n".format(curve.distances[best] * 100) +
+                  "*Shots Required*: {:.0f}\n".format(curve.shots[best]) +
+                  "*Time Required*: {:.1f}s\n".format(curve.time[best]))
+    if not all(len(actives) == 0 for actives in curve.actives.values()):
+        value = "".join("*{}*: {}\n".format(key.capitalize(), ", ".join(active_list))
+                        for key, active_list in curve.actives.items()
+                        if len(active_list) != 0)
+        embed.add_field(name="Active Abilities", value=value, inline=False)
+    embed.set_image(url=image)
+    embed.set_footer(text=EMBED_FOOTER)
+    return embed
+
+
+def embed_from_ttk_matrix(matrix: TimeToKillMatrix, builds: str, image: str, omitted: bool) -> Embed:
+    """Build an embed for a rendered TTK matrix"""
+    title = "Time To Kill Matrix"
+    description = \
+        "**Builds**: {}\n".format("Stock hulls" if builds == "stock" else "Public builds") + \
+        "**Distance**: {}m\n".format(matrix.distance * 100) + \
+        "**Weapon**: `{}`\n".format(matrix.weapon) + \
+        "Accuracy/Evasion **was{}** accounted for.\n".format("" if matrix.acc is True else " not") + \
+        "Rows are the sources, columns the targets."
+    embed = Embed(title=title, description=description, colour=0xff2600)
+    embed.set_image(url=image)
+    footer = EMBED_FOOTER
+    if omitted is True:
+        footer = "Only the first builds are shown. " + footer
+    embed.set_footer(text=footer)
+    return embed
+
+
 def embed_from_phase_render(tag: str, image: str, strategy: Strategy, phase: Phase) -> Embed:
     """Build a Discord Embed from the given parameters"""
     description = phase.description
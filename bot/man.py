@@ -47,9 +47,11 @@ MANUAL = {
     "period": (
         "period",
         [("start", "Start date of the period", False, None),
-         ("end", "End date of the period", True, "today")],
+         ("end", "End date of the period", True, "today"),
+         ("daily", "Also show the matches registered on every day", True, None)],
         "Display the amount of matches registered for each server in a "
-        "given period in a table format."
+        "given period in a table format. With `daily`, the number of "
+        "matches of every day of the period is displayed as well."
     ),
     "servers": (
         "servers",
@@ -214,6 +216,12 @@ MANUAL = {
         "- search: Search for public builds with certain criteria. See\n"
         "    the manual of build_search for more information.\n"
         "- ttk: Calculate the Time-To-Kill of one build against another.\n"
+        "- ttk matrix: Render the Time-To-Kill of a set of builds against\n"
+        "    each other as a heatmap.\n"
+        "- ttk curve: Plot the Time-To-Kill of one build against another\n"
+        "    over all distances up to long range.\n"
+        "- optimize: Search for the best builds of a ship against a\n"
+        "    target build.\n"
         "```",
     "build create": (
         "build create",
@@ -264,13 +272,50 @@ MANUAL = {
     "build ttk": (
         "build ttk",
         [("source", "ID number of build that is the one doing the shooting", False, None),
-         ("target", "ID number of build that is the victim", False, None)],
+         ("target", "ID number of build that is the victim", False, None),
+         ("distance", "Distance in hundreds of metres", True, "30"),
+         ("evasion", "Flag to account for accuracy and evasion", True, ""),
+         ("simulate", "Flag to simulate many engagements shot by shot", True, "")],
         "Perform a Time-To-Kill calculation based upon the damage dealt "
         "by the PrimaryWeapon of the source build onto the target build. "
         "Shield piercing and other statistics are accounted for. Can "
         "only be performed on builds owned by you or builds that are "
         "public.\n"
-        "**Note**: Evasion is not considered in the calculation."
+        "With `simulate`, every shot of many engagements is rolled to hit "
+        "and to crit, and the median and the fastest and slowest 10% of "
+        "the time to kill are given instead of the average."
+    ),
+    "build ttk curve": (
+        "build ttk curve",
+        [("source", "ID number of build that is the one doing the shooting", False, None),
+         ("target", "ID number of build that is the victim", False, None),
+         ("evasion", "Flag to account for accuracy and evasion", True, "")],
+        "Calculate the Time-To-Kill of the PrimaryWeapon of the source "
+        "build onto the target build at every distance from point blank "
+        "to long range in one go, and plot the results to find the "
+        "sweet spot of the weapon."
+    ),
+    "build optimize": (
+        "build optimize",
+        [("base", "Base ship identifier, see `man build_global`", False, None),
+         ("target", "ID number of the target build, or a base ship identifier for its stock build", False, None),
+         ("metric", "`ttk`, `survival` or `ehp`", True, "ttk")],
+        "Search all fully upgraded builds of a base ship for the builds "
+        "that kill the target the fastest (`ttk`), survive the target the "
+        "longest (`survival`) or have the most effective health (`ehp`), "
+        "without crew. Components that cannot lead to a better build are "
+        "skipped, and the search is stopped after ten seconds."
+    ),
+    "build ttk matrix": (
+        "build ttk matrix",
+        [("builds", "`stock` for the stock hulls or `public` for public builds", True, "stock"),
+         ("distance", "Distance in hundreds of metres", True, "30"),
+         ("evasion", "Flag to account for accuracy and evasion", True, "")],
+        "Calculate the Time-To-Kill of every build in a set against every "
+        "other build and render the results as a heatmap. Every cell "
+        "shows the number of shots of the PrimaryWeapon of the build in "
+        "its row to kill the build in its column, coloured by the time "
+        "required."
     ),
     "strategy":
         "```markdown\n"
@@ -64,6 +64,27 @@ From {} to {}, I registered the following amount of matches on each server:
 ```
 """
 
+MATCH_COUNT_DAILY = """
+Matches registered on each day:
+```python
+{}
+```
+"""
+
+DATABASE_METRICS = """
+Database metrics since startup, the full dump is attached:
+```
+{}
+```
+"""
+
+SLOW_QUERIES = """
+Most recent slow database statements:
+```
+{}
+```
+"""
+
 MATCH_COUNT_WEEK = """
 During the last week, I registered the following amount of matches on each server:
 ```python
@@ -9,7 +9,7 @@ from datetime import datetime
 from discord import TextChannel as Channel, User as DiscordUser
 # Project Modules
 from bot.messages import *
-from bot.strings import build_string_from_servers, build_string_from_matches
+from bot.strings import build_string_from_servers, build_string_from_matches, build_strings_from_days
 from data.servers import SERVER_NAMES
 from utils.utils import DATE_FORMAT
 
@@ -19,30 +19,50 @@ async def day(self, channel: Channel, user: DiscordUser, args: tuple):
     day, = args if len(args) != 0 else datetime.now(),
     day = day.strftime(DATE_FORMAT)
     servers = {server: 0 for server in SERVER_NAMES.keys()}
-    servers.update(self.db.get_matches_count_by_day(day))
+    servers.update(await self.db.get_matches_count_by_day(day))
     message = build_string_from_servers(servers)
     message = MATCH_COUNT_DAY.format(day, message)
     await self.send_message(channel, message)
 
 
 async def period(self, channel: Channel, user: DiscordUser, args: tuple):
-    """Send the overview like that of a day for a period"""
+    """
+    Send the overview like that of a day for a period
+
+    With the daily flag, the number of matches of every day of the
+    period is sent as well.
+    """
+    daily = len(args) != 0 and args[-1] == "daily"
+    args = tuple(args[:-1] if daily else args)
+    if len(args) == 0:
+        await self.send_message(channel, INVALID_ARGS)
+        return
     if len(args) == 1:
         args += (datetime.now(),)
     start, end = args
+    if start is None or end is None:
+        await self.send_message(channel, INVALID_ARGS)
+        return
     start_s, end_s = map(lambda dt: dt.strftime(DATE_FORMAT), (start, end))
     if end <= start:
         await self.send_message(channel, INVALID_DATE_RANGE)
         return
-    servers = self.db.get_matches_count_by_period(start, end)
+    if daily:
+        days = await self.db.get_matches_count_by_period_by_day(start, end)
+        servers = {server: sum(counts[server] for counts in days.values()) for server in SERVER_NAMES.keys()}
+    else:
+        servers = await self.db.get_matches_count_by_period(start, end)
     message = build_string_from_servers(servers)
     message = MATCH_COUNT_PERIOD.format(start_s, end_s, message)
     await self.send_message(channel, message)
+    if daily:
+        for string in build_strings_from_days(days):
+            await self.send_message(channel, MATCH_COUNT_DAILY.format(string))
 
 
 async def week(self, channel: Channel, user: DiscordUser, args: tuple):
     """Send the overview like that of a day for the last week"""
-    servers = self.db.get_matches_count_by_week()
+    servers = await self.db.get_matches_count_by_week()
     message = build_string_from_servers(servers)
     await self.send_message(channel, MATCH_COUNT_WEEK.format(message))
 
@@ -57,7 +77,7 @@ async def matches(self, channel: Channel, user: DiscordUser, args: tuple):
         day = args[1].strftime(DATE_FORMAT)
     else:
         day = datetime.now().strftime(DATE_FORMAT)
-    matches = self.db.get_matches_by_day_by_server(server, day)
+    matches = await self.db.get_matches_by_day_by_server(server, day)
     if len(matches) == 0:
         await self.send_message(channel, NO_MATCHES_FOUND)
         return
@@ -36,7 +36,7 @@ async def strategy(self, channel: Channel, user: DiscordUser, args: tuple):
     tag = generate_tag(user)
 
     if command == "list":
-        strategies = self.db.get_strategies(tag)
+        strategies = await self.db.get_strategies(tag)
         if strategies is None or len(strategies) == 0:
             await self.send_message(channel, "You have uploaded no strategies.")
             return
@@ -46,14 +46,14 @@ async def strategy(self, channel: Channel, user: DiscordUser, args: tuple):
         return
 
     name = args[1]
-    strategy = self.db.get_strategy_data(tag, name)
+    strategy = await self.db.get_strategy_data(tag, name)
     if strategy is None:
         await self.send_message(channel, UNKNOWN_STRATEGY)
         return
     strategy = Strategy.deserialize(strategy)
 
     if command == "delete":
-        self.db.delete_strategy(tag, name)
+        await self.db.delete_strategy(tag, name)
         await self.send_message(channel, STRATEGY_DELETE.format(name))
 
     elif command == "show":
@@ -26,6 +26,60 @@ def build_string_from_servers(servers: dict):
     return message
 
 
+def build_strings_from_days(days: dict, length: int = 1800, width: int = 20) -> list:
+    """
+    Return formatted strings from a date: {server: match_count} dict
+
+    Every day is a row with the match count of each server and a bar
+    of its total. The rows are split into strings of at most length
+    characters.
+    """
+    servers = list(SERVER_NAMES.keys())
+    maximum = max([sum(counts.values()) for counts in days.values()] + [1])
+    header = "{:<10} |{}| total\n".format("date", "|".join("{:^5}".format(server) for server in servers))
+    strings, string = list(), header
+    for day, counts in days.items():
+        total = sum(counts.values())
+        row = "{:<10} |{}|{:>6} {}\n".format(
+            day, "|".join("{:>5}".format(counts[server]) for server in servers), total,
+            "#" * round(total / maximum * width))
+        if len(string) + len(row) > length:
+            strings.append(string)
+            string = header
+        string += row
+    strings.append(string)
+    return strings
+
+
+def build_string_from_metrics(metrics: dict, queries: dict, limit: int = 10) -> str:
+    """
+    Return a formatted string from the DatabaseHandler metrics and the
+    latency histograms of the statements with the most total time
+    """
+    message = "lock wait: {:.3f}s total, {:.1f}ms max over {} acquisitions\n".format(
+        metrics["lock_wait"], metrics["lock_wait_max"] * 1000, metrics["lock_acquisitions"])
+    if "pool_size" in metrics:
+        message += "pool: {pool_in_use}/{pool_size} in use, {pool_peak} peak, {pool_wait:.3f}s wait\n".format(**metrics)
+    message += "hit rate: {:.2f} characters, {:.2f} matches\n\n".format(
+        metrics["characters_hit_rate"], metrics["matches_hit_rate"])
+    message += "{:<44} {:>7} {:>8} {:>8} {:>8} {:>8}\n".format("statement (ms)", "count", "mean", "p95", "max", "rows")
+    ordered = sorted(queries.items(), key=lambda item: item[1]["total"], reverse=True)
+    for name, query in ordered[:limit]:
+        message += "{:<44} {:>7} {:>8.2f} {:>8.2f} {:>8.2f} {:>8}\n".format(
+            name[:44], query["count"], query["mean"] * 1000, query["p95"] * 1000, query["max"] * 1000, query["rows"])
+    return message
+
+
+def build_string_from_slow_queries(slow: list, limit: int = 5) -> str:
+    """Return a formatted string of the most recent slow statements and their query plans"""
+    message = str()
+    for query in slow[-limit:]:
+        message += "{} {} {:.1f}ms\n".format(query["time"], query["name"], query["duration"] * 1000)
+        for detail in query["plan"] or ("no query plan",):
+            message += "    {}\n".format(detail)
+    return message if message != "" else "No slow statements."
+
+
 def build_string_from_matches(matches: list):
     """Return a formatted string from a matches list"""
     string = str()
@@ -3,4 +3,6 @@ Author: RedFantom
 License: GNU GPLv3 as in LICENSE
 Copyright (C) 2018 RedFantom
 """
-from database.database import DatabaseHandler
+from database.database import DatabaseHandler, DatabaseTimeout
+from database.facade import AsyncDatabaseHandler
+from database.ingest import IngestQueue
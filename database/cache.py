@@ -0,0 +1,73 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from collections import OrderedDict
+from threading import Lock
+from time import monotonic
+
+
+class IdentityMap(object):
+    """
+    Bounded mapping of natural keys to database IDs
+
+    Entries expire ttl seconds after they were stored. When the map
+    holds size entries, the least recently used entry is evicted.
+    """
+
+    def __init__(self, size: int, ttl: float):
+        """
+        :param size: Maximum number of entries
+        :param ttl: Seconds after which an entry expires
+        """
+        self.size, self.ttl = size, ttl
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits, self.misses = 0, 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: tuple) -> (int, None):
+        """Return the ID for a key, or None if it is not in the map"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: tuple, value: int):
+        """Store the ID for a key"""
+        with self._lock:
+            self._entries[key] = (value, monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def discard_values(self, values: (list, set)):
+        """Remove the entries with any of the given IDs"""
+        values = set(values)
+        with self._lock:
+            for key in [key for key, (value, _) in self._entries.items() if value in values]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self, name: str) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "{}_size".format(name): len(self._entries),
+                "{}_hits".format(name): self.hits,
+                "{}_misses".format(name): self.misses,
+                "{}_hit_rate".format(name): self.hits / lookups if lookups != 0 else 0.0,
+            }
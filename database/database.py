@@ -4,35 +4,90 @@ License: GNU GPLv3 as in LICENSE
 Copyright (C) 2018 RedFantom
 """
 # Standard Library
-from contextlib import closing
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from contextlib import closing, contextmanager
+from datetime import date as Date, datetime, timedelta
+import json
+from math import ceil
 import sqlite3 as sql
-from threading import Lock
+from threading import Lock, local
+from time import perf_counter
 # Project Modules
 from bot import DiscordBotException
 from database import create, insert, select, delete
+from database.cache import IdentityMap
+from database.metrics import QueryMetrics
+from database.migrations import MIGRATIONS, BACKFILL_MATCH_DAILY
+from database.pool import ConnectionPool, TimedLock
 from data.servers import SERVER_NAMES
-from parsing.ships import Ship
+from parsing.ships import Ship, ENCODING_PREFIX
 from parsing.strategies import Strategy
 from utils import setup_logger
 from utils.utils import DATE_FORMAT
 
 
+DATABASE_READERS = 4
+DATABASE_TIMEOUT = 10.0
+DATABASE_DURABILITY = "full"
+DURABILITY_LEVELS = ("off", "normal", "full", "extra")
+STATEMENT_CACHE = 256
+IDENTITY_MAP_SIZE = 4096
+IDENTITY_MAP_TTL = 3600.0
+
+
+class DatabaseTimeout(DiscordBotException):
+    """A database call did not complete within its timeout"""
+
+    def __init__(self, name: str, timeout: float):
+        DiscordBotException.__init__(
+            self, "The database is too busy right now. Please try again later.", name, timeout)
+
+
 class DatabaseHandler(object):
     """
     Thread-safe database handler to allow the processing of queries
-    of multiple clients. Uses a Lock to make sure that only a single
-    call can be executed on the database at the same time.
+    of multiple clients. The database is in WAL mode, so that queries
+    can be executed on a pool of read-only connections while a single
+    writer connection executes commands. A Lock makes sure only a
+    single command is executed at the same time. Without readers, the
+    queries are executed on the writer connection under the Lock.
+
+    The IDs of characters and matches are kept in identity maps, so
+    the ingest commands do not look them up for every result. Code
+    that deletes characters or matches must invalidate the maps. IDs
+    read in a transaction are only added to the maps after commit.
+
+    The registered users and their hashed authentication codes are
+    kept in memory in full and written through by the methods that
+    change them, so validating a user does not query the database.
+    Changes made in a transaction are only written after commit.
     """
 
-    def __init__(self, file_name="database.db"):
+    def __init__(self, file_name="database.db", readers: int = DATABASE_READERS,
+                 durability: str = DATABASE_DURABILITY):
         """
         :param file_name: File name for the SQLite database
+        :param readers: Maximum number of read-only connections
+        :param durability: Synchronous level of the writer connection,
+            with 'normal' a commit does not wait for the disk, but a
+            power loss may roll back the last transactions
         """
+        if durability not in DURABILITY_LEVELS:
+            raise ValueError("Invalid durability level: {}".format(durability))
         # Attributes
         self._db = None
         self._file_name = file_name
-        self._db_lock = Lock()
+        self._durability = durability
+        self._local = local()
+        self._db_lock = TimedLock()
+        self._pool = ConnectionPool(file_name, readers, STATEMENT_CACHE) if readers > 0 else None
+        self._connections = dict()
+        self._connections_lock = Lock()
+        self._interrupted = set()
+        self._characters = IdentityMap(IDENTITY_MAP_SIZE, IDENTITY_MAP_TTL)
+        self._matches = IdentityMap(IDENTITY_MAP_SIZE, IDENTITY_MAP_TTL)
+        self._users = dict()
+        self._queries = QueryMetrics()
         # Build logger
         self.logger = setup_logger("DatabaseHandler", "database.log")
         self.debug, self.info, self.error = self.logger.debug, self.logger.info, self.logger.error
@@ -41,7 +96,9 @@ class DatabaseHandler(object):
 
     def init_db(self):
         """Initialize the database connection and tables"""
-        self._db = sql.connect(self._file_name)
+        self._db = sql.connect(self._file_name, check_same_thread=False, cached_statements=STATEMENT_CACHE)
+        self._db.execute("PRAGMA journal_mode = WAL;")
+        self._db.execute("PRAGMA synchronous = {};".format(self._durability.upper()))
         for table in ["SERVER", "USER", "CHARACTER", "MATCH", "RESULT", "BUILDS", "STRATEGIES"]:
             command = getattr(create, "CREATE_TABLE_{}".format(table))
             try:
@@ -50,42 +107,334 @@ class DatabaseHandler(object):
             except sql.OperationalError:
                 self.error("Failed to create table {}".format(table))
                 raise
+        self.migrate()
         self.exec_command(insert.INSERT_SERVERS)
+        self.migrate_builds()
+        self.load_users()
         return True
 
-    def exec_command(self, command: str, *args):
-        """Execute a command on the database"""
-        self.debug("Acquiring database lock.")
+    def load_users(self):
+        """Load the registered users and their hashed authentication codes"""
+        self._users = dict(self.exec_query(select.GET_USERS))
+
+    def migrate(self):
+        """
+        Apply the schema migrations newer than the user_version of the database
+
+        Every migration is applied in an explicit transaction, on a
+        connection without implicit transaction handling: the sqlite3
+        module of older Python versions commits before DDL statements,
+        which would leave a failed migration half-applied.
+        """
+        with self._db_lock, closing(sql.connect(self._file_name, isolation_level=None)) as connection:
+            for version, description, commands in MIGRATIONS:
+                connection.execute("BEGIN IMMEDIATE;")
+                try:
+                    current, = connection.execute("PRAGMA user_version;").fetchone()
+                    if version > current:
+                        for command in commands:
+                            connection.execute(command)
+                        connection.execute("PRAGMA user_version = {};".format(version))
+                except BaseException:
+                    connection.execute("ROLLBACK;")
+                    raise
+                connection.execute("COMMIT;")
+                if version > current:
+                    self.info("Applied migration {}: {}.".format(version, description))
+
+    def backfill_match_daily(self) -> int:
+        """Rebuild the MatchDaily rollup from the Match table and return its number of rows"""
+        with self.transaction() as connection:
+            for command in BACKFILL_MATCH_DAILY:
+                connection.execute(command)
+            rows, = connection.execute("SELECT COUNT(*) FROM MatchDaily;").fetchone()
+        self.info("Rebuilt the daily match rollup with {} rows.".format(rows))
+        return rows
+
+    def migrate_builds(self):
+        """Convert builds stored in the legacy text format to the compact encoding"""
+        builds = self.exec_query(select.GET_BUILDS_LEGACY, dict(prefix=ENCODING_PREFIX))
+        for build, data in builds:
+            try:
+                encoded = Ship.deserialize(data).encode()
+            except (KeyError, ValueError, IndexError) as e:
+                self.error("Failed to migrate build {}: {}".format(build, repr(e)))
+                continue
+            self.update_build_data(build, encoded)
+        if len(builds) != 0:
+            self.info("Migrated {} builds to the compact encoding.".format(len(builds)))
+
+    @property
+    def readers(self) -> int:
+        """Number of queries that can be executed in parallel"""
+        return self._pool.size if self._pool is not None else 0
+
+    @property
+    def in_transaction(self) -> bool:
+        """Whether this thread is executing a transaction"""
+        return getattr(self._local, "transaction", False)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Execute the commands and queries of this thread in a with-clause
+        in a single transaction on the writer connection
+
+        The transaction is committed at the end of the with-clause, or
+        rolled back if an exception is raised. A with-clause nested in
+        a transaction of the same thread is part of that transaction.
+        """
+        if self.in_transaction:
+            yield self.db
+            return
+        with self._db_lock:
+            self._local.transaction, self._local.pending, self._local.users = True, dict(), dict()
+            self._local.journal = list()
+            try:
+                self.db.execute("BEGIN;")
+                yield self.db
+            except BaseException:
+                self.db.rollback()
+                # The state of the handler is restored even if the call was interrupted
+                call, self._local.call = getattr(self._local, "call", None), None
+                try:
+                    self.invalidate()
+                finally:
+                    self._local.call = call
+                raise
+            else:
+                self.db.commit()
+                # Other threads may only see the IDs and users once they are committed
+                for identities, entries in self._local.pending.items():
+                    for key, value in entries.items():
+                        identities.put(key, value)
+                for user_id, code in self._local.users.items():
+                    self._put_user(user_id, code)
+            finally:
+                self._local.transaction, self._local.pending, self._local.users = False, None, None
+                self._local.journal = None
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Execute the commands and queries of this thread in a with-clause
+        in a savepoint of its transaction
+
+        If an exception is raised, only the statements of the with-clause
+        are rolled back and only the IDs and users it stored are
+        discarded, the other calls of the transaction are not affected.
+        """
+        if not self.in_transaction:
+            raise RuntimeError("A savepoint can only be created in a transaction")
+        journal = self._local.journal
+        mark = len(journal)
+        self.db.execute("SAVEPOINT call;")
+        try:
+            yield self.db
+        except BaseException:
+            # SQLite may have rolled back the whole transaction already
+            if self.db.in_transaction:
+                self.db.execute("ROLLBACK TO call;")
+                self.db.execute("RELEASE call;")
+            while len(journal) > mark:
+                entries, key, stored, previous = journal.pop()
+                if stored:
+                    entries[key] = previous
+                else:
+                    del entries[key]
+            raise
+        else:
+            self.db.execute("RELEASE call;")
+
+    def exec_command(self, command: str, parameters: (dict, tuple) = ()):
+        """Execute a command with bound parameters on the database"""
+        if self.in_transaction:
+            return self._exec_command(command, parameters)
         self._db_lock.acquire()
+        try:
+            r = self._exec_command(command, parameters)
+            self.db.commit()
+        finally:
+            self._db_lock.release()
+        return r
+
+    def _exec_command(self, command: str, parameters: (dict, tuple)) -> bool:
+        self.register(self.db)
         try:
             with self.cursor as cursor:
-                self.debug("Executing command: {}".format(command))
-                cursor.execute(command, *args)
-                self.debug("Executed command: {}".format(command))
+                self.debug("Executing command: %s, %s", command, parameters)
+                start = perf_counter()
+                cursor.execute(command, parameters)
+                self.record(self.db, command, parameters, perf_counter() - start, cursor.rowcount)
             r = True
         except sql.OperationalError as e:
             self.logger.error("Execution of command failed: {}.".format(e))
-            if str(e) == "unable to open database file":
+            # A failed command must roll back the transaction it is part of
+            if self.in_transaction or str(e) == "unable to open database file":
                 raise
             r = False
-        self.db.commit()
-        self._db_lock.release()
-        self.debug("Database lock released.")
+        finally:
+            self.unregister()
         return r
 
-    def exec_query(self, query: str):
-        """Execute a query on the database and return results"""
-        self._db_lock.acquire()
+    def exec_query(self, query: str, parameters: (dict, tuple) = ()):
+        """Execute a query with bound parameters on a reader connection and return results"""
+        if self.in_transaction:
+            return self._exec_query(self.db, query, parameters)
+        if self._pool is None:
+            with self._db_lock:
+                return self._exec_query(self.db, query, parameters)
+        with self._pool.connection() as connection:
+            return self._exec_query(connection, query, parameters)
+
+    def _exec_query(self, connection: sql.Connection, query: str, parameters: (dict, tuple)):
+        self.register(connection)
         try:
-            with self.cursor as cursor:
-                self.debug("Executing query: {}".format(query))
-                cursor.execute(query)
+            with closing(connection.cursor()) as cursor:
+                self.debug("Executing query: %s, %s", query, parameters)
+                start = perf_counter()
+                cursor.execute(query, parameters)
                 results = cursor.fetchall()
-                self.debug("Query results: {}".format(results))
+                self.record(connection, query, parameters, perf_counter() - start, len(results))
         finally:
-            self._db_lock.release()
+            self.unregister()
         return results
 
+    def record(self, connection: sql.Connection, statement: str, parameters: (dict, tuple),
+               duration: float, rows: int):
+        """Record the latency of a statement and the query plan of a slow statement"""
+        name = self._queries.get_name(statement)
+        if not self._queries.record(name, duration, rows):
+            return
+        try:
+            plan = [row[-1] for row in connection.execute("EXPLAIN QUERY PLAN " + statement, parameters)]
+        except sql.Error:
+            plan = None
+        self._queries.record_slow(name, duration, statement, plan)
+        self.logger.warning("Slow statement %s took %.3fs: %s", name, duration, plan)
+
+    @contextmanager
+    def interruptible(self):
+        """
+        Make the statements of this thread in a with-clause a single
+        call that can be interrupted with the token yielded
+        """
+        token = object()
+        with self._connections_lock:
+            self._connections[token] = None
+        self._local.call = token
+        try:
+            yield token
+        finally:
+            self._local.call = None
+            with self._connections_lock:
+                del self._connections[token]
+                self._interrupted.discard(token)
+
+    def register(self, connection: sql.Connection):
+        """Register the connection of a statement of an interruptible call"""
+        token = getattr(self._local, "call", None)
+        if token is None:
+            return
+        with self._connections_lock:
+            if token in self._interrupted:
+                raise sql.OperationalError("interrupted")
+            self._connections[token] = connection
+
+    def unregister(self):
+        token = getattr(self._local, "call", None)
+        if token is not None:
+            with self._connections_lock:
+                self._connections[token] = None
+
+    def interrupt(self, token: object):
+        """
+        Abort the statement executing for an interruptible call, and
+        any statement the call executes after it
+
+        A call that has completed is not interrupted, so it can never
+        interrupt a later call executed on the same thread.
+        """
+        with self._connections_lock:
+            if token not in self._connections:
+                return
+            self._interrupted.add(token)
+            if self._connections[token] is not None:
+                self._connections[token].interrupt()
+
+    def invalidate(self):
+        """Clear the identity maps and reload the users, required after a rollback"""
+        for name in ("pending", "users", "journal"):
+            entries = getattr(self._local, name, None)
+            if entries is not None:
+                entries.clear()
+        self._characters.clear()
+        self._matches.clear()
+        self.load_users()
+
+    def get_identity(self, identities: IdentityMap, key: tuple) -> (int, None):
+        """Return an ID from an identity map or from the pending IDs of the transaction of this thread"""
+        pending = getattr(self._local, "pending", None)
+        if pending is not None and key in pending.get(identities, {}):
+            return pending[identities][key]
+        return identities.get(key)
+
+    def put_identity(self, identities: IdentityMap, key: tuple, value: int):
+        """Store an ID in an identity map, or in a transaction until it is committed"""
+        if self.in_transaction:
+            self._journal(self._local.pending.setdefault(identities, dict()), key, value)
+        else:
+            identities.put(key, value)
+
+    def put_user(self, user_id: str, code: (str, None)):
+        """Store the hashed code of a user, or remove the user if None, in a transaction once it is committed"""
+        if self.in_transaction:
+            self._journal(self._local.users, user_id, code)
+        else:
+            self._put_user(user_id, code)
+
+    def _put_user(self, user_id: str, code: (str, None)):
+        if code is None:
+            self._users.pop(user_id, None)
+        else:
+            self._users[user_id] = code
+
+    def _journal(self, entries: dict, key, value):
+        """Store a pending entry of the transaction of this thread, so that a savepoint can restore it"""
+        self._local.journal.append((entries, key, key in entries, entries.get(key)))
+        entries[key] = value
+
+    def metrics(self) -> dict:
+        """Return the lock-wait, connection pool and identity map metrics"""
+        metrics = self._db_lock.metrics()
+        if self._pool is not None:
+            metrics.update(self._pool.metrics())
+        metrics.update(self._characters.metrics("characters"))
+        metrics.update(self._matches.metrics("matches"))
+        return metrics
+
+    def query_metrics(self) -> dict:
+        """Return the latency histograms of the statements by name"""
+        return self._queries.histograms()
+
+    def slow_queries(self) -> list:
+        """Return the slow statements with their query plans, oldest first"""
+        return list(self._queries.slow)
+
+    def dump_metrics(self) -> str:
+        """Return all metrics and the slow statement log as JSON"""
+        return json.dumps({
+            "handler": self.metrics(),
+            "queries": self.query_metrics(),
+            "slow": self.slow_queries(),
+        }, indent=2)
+
+    def close(self):
+        """Close all connections to the database"""
+        if self._pool is not None:
+            self._pool.close()
+        self.db.close()
+
     @property
     def db(self) -> sql.Connection:
         return self._db
@@ -98,143 +447,125 @@ class DatabaseHandler(object):
 
     def insert_character(self, name: str, server: str, faction: str, owner: str):
         """Insert a new character into the database"""
-        command = insert.INSERT_CHARACTER.format(name=name, server=server, faction=faction, owner=owner)
-        self.exec_command(command)
+        with self.transaction():
+            self.exec_command(insert.INSERT_CHARACTER, dict(name=name, server=server, faction=faction, owner=owner))
+            self.get_character_id(server, name)
 
     def insert_user(self, user_id: str, code: str):
         """Insert a new Discord user into the database"""
         self.info("Inserting a new user into the Database: {}".format(user_id))
         date = datetime.now().strftime(DATE_FORMAT)
-        command = insert.INSERT_USER.format(discord=user_id, code=code, last=date)
-        self.exec_command(command)
+        if self.exec_command(insert.INSERT_USER, dict(discord=user_id, code=code, last=date)):
+            self.put_user(user_id, code)
 
     def update_auth_code(self, user_id: str, code: str):
-        """Update the authentication code of a user in the database"""
+        """Update the hashed authentication code of a user in the database"""
         self.info("Updating authentication code of {}.".format(user_id))
-        command = insert.UPDATE_CODE.format(discord=user_id, code=code)
-        self.exec_command(command)
+        if self.exec_command(insert.UPDATE_CODE, dict(discord=user_id, code=code)) and user_id in self._users:
+            self.put_user(user_id, code)
 
     def update_user_date(self, user_id: str, date: str):
         """Update the date the user last inserted data into the database"""
         if isinstance(date, datetime):
             date = datetime.strftime(date, DATE_FORMAT)
         self.info("Updating the date {} last inserted data to {}".format(user_id, date))
-        command = insert.UPDATE_USER_LAST.format(tag=user_id, date=date)
-        self.exec_command(command)
+        self.exec_command(insert.UPDATE_USER_LAST, dict(tag=user_id, date=date))
 
     def insert_match(self, server: str, date: str, start: str, id_fmt: str):
         """Insert a new match into the database"""
-        command = insert.INSERT_MATCH.format(
-            server=server, start=start, date=date, idfmt=id_fmt)
-        self.exec_command(command)
+        self.exec_command(insert.INSERT_MATCH, dict(server=server, start=start, date=date, idfmt=id_fmt))
 
     def update_match(self, server: str, date: str, start: str, id_fmt: str,
                      score: float = None, map: str = None, end: str = None):
-        """Insert the match score into the database"""
-        if self.get_match_id(server, date, id_fmt) is None:
-            self.logger.debug("Match {}, {}, {} was not in database, inserting now...")
-            self.insert_match(server, date, start, id_fmt)
-        match = self.get_match_id(server, date, id_fmt)
-        commands = list()
-        kwargs = {
-            "match": match,
-            "map": map,
-            "score": score,
-            "end": end
-        }
-        if score is not None:
-            commands.append(insert.UPDATE_MATCH_SCORE.format(**kwargs))
-        if end is not None:
-            commands.append(insert.UPDATE_MATCH_END.format(**kwargs))
-        if map is not None:
-            commands.append(insert.UPDATE_MATCH_MAP.format(**kwargs))
-        for command in commands:
-            self.exec_command(command)
+        """Insert the match or update the given attributes of the match"""
+        self.exec_command(insert.UPSERT_MATCH, dict(
+            server=server, date=date, start=start, idfmt=id_fmt, score=score, map=map, end=end))
 
     def insert_result(self, character: str, server: str, date: str, start: str, id_fmt: str,
                       assists: int, dmgd: int, dmgt: int, deaths: int, ship: str):
         """Insert the result of a given character into the database"""
-        self.debug("Inserting result of {} on server {} for match start {}.".format(character, server, start))
-        char = self.get_character_id(server, character)
-        if char is None:
-            self.error("Character '{}' is not known on this server '{}'.".format(character, server))
-            return False
-        match_id = self.get_match_id(server, date, id_fmt)
-        if match_id is None:
-            self.insert_match(server, date, start, id_fmt)
-            match_id = self.get_match_id(server, date, id_fmt)
-        command = insert.INSERT_RESULT.format(
-            match=match_id, char=char, assists=assists, dmgd=dmgd, dmgt=dmgt, deaths=deaths, ship=ship)
-        self.exec_command(command)
+        self.debug("Inserting result of %s on server %s for match start %s.", character, server, start)
+        with self.transaction():
+            char = self.get_character_id(server, character)
+            if char is None:
+                self.error("Character '{}' is not known on this server '{}'.".format(character, server))
+                return False
+            match = self.get_match_id(server, date, id_fmt)
+            if match is None:
+                self.insert_match(server, date, start, id_fmt)
+                match = self.get_match_id(server, date, id_fmt)
+            self.exec_command(insert.INSERT_RESULT, dict(
+                match=match, char=char, assists=assists, dmgd=dmgd, dmgt=dmgt, deaths=deaths, ship=ship))
 
     def insert_build(self, owner: str, name: str, data: str, public: bool) -> (int, None):
         """Insert a new build into the database"""
         if self.get_build_id(name, owner, required=False) is not None:
             return None
-        self.exec_command(insert.INSERT_BUILD.format(owner=owner, name=name, public=int(public), data=data))
+        self.exec_command(insert.INSERT_BUILD, dict(owner=owner, name=name, public=int(public), data=data))
         return self.get_build_id(name, owner)
 
     def update_build_data(self, build: (int, str), data: str):
         """Update an existing build in the database"""
-        self.exec_command(insert.UPDATE_BUILD_DATA.format(build=build, data=data))
+        self.exec_command(insert.UPDATE_BUILD_DATA, dict(build=build, data=data))
 
     def update_build_public(self, build: (int, str), public: bool):
-        self.exec_command(insert.UPDATE_BUILD_PUBLIC.format(build=build, public=int(public)))
+        self.exec_command(insert.UPDATE_BUILD_PUBLIC, dict(build=build, public=int(public)))
 
     def get_match_id(self, server: str, date: str, id_fmt: str):
-        """Return the match ID from the database"""
-        self.logger.debug("Retrieving match id: {}, {}, {}".format(server, date, id_fmt))
-        query = select.GET_MATCH_ID.format(server=server, date=date, idfmt=id_fmt)
-        result = self.exec_query(query)
+        """Return the match ID from the identity map or the database"""
+        match = self.get_identity(self._matches, (server, date, id_fmt))
+        if match is not None:
+            return match
+        self.debug("Retrieving match id: %s, %s, %s", server, date, id_fmt)
+        result = self.exec_query(select.GET_MATCH_ID, dict(server=server, date=date, idfmt=id_fmt))
         if len(result) == 0:
             return None
         match, = result[0]
+        self.put_identity(self._matches, (server, date, id_fmt), match)
         return match
 
     def get_character_id(self, server, name):
-        """Return the ID of a given character"""
-        query = select.GET_CHARACTER_ID.format(name=name, server=server)
-        result = self.exec_query(query)
+        """Return the ID of a given character from the identity map or the database"""
+        char = self.get_identity(self._characters, (server, name))
+        if char is not None:
+            return char
+        result = self.exec_query(select.GET_CHARACTER_ID, dict(name=name, server=server))
         if len(result) == 0:
             return None
         char, = result[0]
+        self.put_identity(self._characters, (server, name), char)
         return char
 
     def get_auth_code(self, discord: str):
-        """Return the authentication code for a given Discord user"""
-        result = self.exec_query(select.GET_AUTH_CODE.format(discord=discord))
-        if len(result) == 0:
-            return None
-        auth, = result[0]
-        return auth
+        """Return the hashed authentication code for a given Discord user"""
+        return self._users.get(discord)
 
     def get_character_ids(self, discord: str):
         """Return a list of all character IDs of a Discord user"""
-        result = self.exec_query(select.GET_CHARACTER_IDS.format(discord_id=discord))
+        result = self.exec_query(select.GET_CHARACTER_IDS, dict(discord_id=discord))
         characters = list()
         for char, in result:
             characters.append(char)
         return characters
 
     def delete_user(self, tag: str):
-        """Delete a Discord User from the database"""
+        """Delete a Discord User with all results, characters and strategies in a single transaction"""
         self.logger.info("Removing {} from database.".format(tag))
-        characters = self.get_character_ids(tag)
-        for character in characters:
-            self.exec_command(delete.DELETE_RESULTS_CHARACTER.format(char_id=character))
-        self.exec_command(delete.DELETE_CHARACTERS.format(discord_id=tag))
-        self.exec_command(delete.DELETE_USER.format(discord_id=tag))
-        for strategy in self.get_strategies(tag):
-            self.delete_strategy(tag, strategy)
+        with self.transaction() as connection:
+            characters = self.get_character_ids(tag)
+            for command in (delete.DELETE_RESULTS_USER, delete.DELETE_CHARACTERS,
+                            delete.DELETE_STRATEGIES, delete.DELETE_USER):
+                connection.execute(command, dict(discord_id=tag))
+        self._characters.discard_values(characters)
+        self.put_user(tag, None)
 
     def get_user_in_database(self, tag: str) -> bool:
         """Return whether a certain Discord user is in the database"""
-        result = self.exec_query(select.GET_USER_ID.format(discord_id=tag))
-        return len(result) != 0
+        return tag in self._users
 
     def get_user_accessed_valid(self, tag: str):
         """Return whether the user has contributed data recently enough"""
-        result = self.exec_query(select.GET_USER_LAST.format(discord=tag))
+        result = self.exec_query(select.GET_USER_LAST, dict(discord=tag))
         if len(result) == 0:
             return None
         last = datetime.strptime(result[0][0], DATE_FORMAT)
@@ -243,7 +574,7 @@ class DatabaseHandler(object):
 
     def get_character_owner(self, server: str, name: str):
         """Return the owner tag of a given character"""
-        result = self.exec_query(select.GET_CHARACTER_OWNER.format(name=name, server=server))
+        result = self.exec_query(select.GET_CHARACTER_OWNER, dict(name=name, server=server))
         if len(result) == 0:
             return None
         tag, = result[0]
@@ -251,57 +582,68 @@ class DatabaseHandler(object):
 
     def get_server_in_database(self, server: str):
         """Return whether a server is present in the database"""
-        query = "SELECT id FROM Server WHERE 'name' = '{server}' OR id = '{server}';".format(
-            server=server)
-        result = self.exec_query(query)
+        result = self.exec_query(select.GET_SERVER_ID, dict(server=server))
         return len(result) != 0
 
     def get_matches_count_by_day(self, day: (datetime, str)):
         """Return a dictionary of server: match_count"""
         day = day.strftime(DATE_FORMAT) if isinstance(day, datetime) else day
-        query = select.GET_MATCHES_COUNT_FOR_DAY_BY_SERVER.format(date=day)
-        results = self.exec_query(query)
+        results = self.exec_query(select.GET_MATCHES_COUNT_FOR_DAY_BY_SERVER, dict(date=day))
         servers = dict()
         for server, count in results:
             servers[server] = count
         return servers
 
-    def get_matches_count_by_period(self, start: datetime, end: datetime):
+    @staticmethod
+    def get_period_days(start: (datetime, Date), end: (datetime, Date)) -> list:
+        """Return the dates of the days of a period, from start until end"""
+        days = max(ceil((end - start) / timedelta(days=1)), 0)
+        return [(start + timedelta(days=i)).strftime(DATE_FORMAT) for i in range(days)]
+
+    def get_matches_count_by_period(self, start: (datetime, Date), end: (datetime, Date)):
         """Return a dictionary of server: match_count for a given period"""
         servers = {server: 0 for server in SERVER_NAMES.keys()}
-        while start < end:
-            match_count = self.get_matches_count_by_day(start)
-            for server in servers.keys():
-                servers[server] += match_count[server] if server in match_count else 0
-            start += timedelta(days=1)
+        days = self.get_period_days(start, end)
+        if len(days) == 0:
+            return servers
+        query = select.GET_MATCHES_COUNT_FOR_PERIOD_BY_SERVER
+        for server, count in self.exec_query(query, dict(start=days[0], end=days[-1])):
+            if server in servers:
+                servers[server] = count
         return servers
 
+    def get_matches_count_by_period_by_day(self, start: (datetime, Date), end: (datetime, Date)) -> dict:
+        """Return an OrderedDict of date: {server: match_count} for every day of a given period"""
+        dates = self.get_period_days(start, end)
+        days = OrderedDict((day, {server: 0 for server in SERVER_NAMES.keys()}) for day in dates)
+        if len(days) == 0:
+            return days
+        query = select.GET_MATCHES_COUNT_FOR_PERIOD_BY_DAY
+        for day, server, count in self.exec_query(query, dict(start=dates[0], end=dates[-1])):
+            if server in days[day]:
+                days[day][server] = count
+        return days
+
     def get_matches_count_by_week(self):
         """Return a dictionary of server: match_count for this week"""
         today = datetime.now().date()
-        servers = {server: 0 for server in SERVER_NAMES.keys()}
-        for i in range(7):
-            current = today - timedelta(days=i)
-            match_count = self.get_matches_count_by_day(current)
-            for server in servers.keys():
-                servers[server] += match_count[server] if server in match_count else 0
-        return servers
+        return self.get_matches_count_by_period(today - timedelta(days=6), today + timedelta(days=1))
 
     def get_matches_by_day_by_server(self, server: str, date: str):
         """Return a list of matches for a given server"""
-        return self.exec_query(select.GET_MATCHES_FOR_DAY_FOR_SERVER.format(server=server, date=date))
+        return self.exec_query(select.GET_MATCHES_FOR_DAY_FOR_SERVER, dict(server=server, date=date))
 
     def get_match_results(self, server: str, date: str, start: str):
         """Return the results of players participating in a match"""
-        return self.exec_query(select.GET_MATCH_RESULTS.format(server=server, date=date, start=start))
+        return self.exec_query(select.GET_MATCH_RESULTS, dict(server=server, date=date, start=start))
 
     def get_build_id(self, name: str, owner: str, required=True):
         """Return the build ID and whether its public"""
         if name.isdigit():
             name = int(name)
-            results = self.exec_query(select.GET_BUILD_BY_ID.format(build=name))
+            results = self.exec_query(select.GET_BUILD_BY_ID, dict(build=name))
         else:
-            results = self.exec_query(select.GET_BUILD_BY_NAME.format(name=name, owner=owner))
+            results = self.exec_query(select.GET_BUILD_BY_NAME, dict(name=name, owner=owner))
         if len(results) == 0:
             if not required:
                 return None
@@ -318,7 +660,7 @@ class DatabaseHandler(object):
         """Return the data (bytes) of a build"""
         if isinstance(build, str):
             build = int(build)
-        results = self.exec_query(select.GET_BUILD_DATA.format(build=build))
+        results = self.exec_query(select.GET_BUILD_DATA, dict(build=build))
         if len(results) == 0:
             return None
         data, = results[0]
@@ -328,7 +670,7 @@ class DatabaseHandler(object):
         """Return the tag of the build owner"""
         if isinstance(build, str):
             build = int(build)
-        results = self.exec_query(select.GET_BUILD_OWNER.format(build=build))
+        results = self.exec_query(select.GET_BUILD_OWNER, dict(build=build))
         if len(results) == 0:
             raise DiscordBotException("That build does not exist.")
         tag, = results[0]
@@ -338,7 +680,7 @@ class DatabaseHandler(object):
         return self.get_build_owner(build) == owner
 
     def build_read_access(self, build: (int, str), user: str):
-        public = self.exec_query(select.GET_BUILD_PUBLIC.format(build=build))
+        public = self.exec_query(select.GET_BUILD_PUBLIC, dict(build=build))
         if len(public) == 0:
             raise DiscordBotException("That build does not exist.")
         public, = public[0]
@@ -354,7 +696,7 @@ class DatabaseHandler(object):
 
     def get_builds_owner(self, owner: str):
         """Return all builds of an owner in (build, name, data, public)"""
-        results = self.exec_query(select.GET_BUILDS_BY_OWNER.format(owner=owner))
+        results = self.exec_query(select.GET_BUILDS_BY_OWNER, dict(owner=owner))
         for result in results:
             build, name, data, public = result
             yield build, name, data, public
@@ -369,7 +711,7 @@ class DatabaseHandler(object):
         return self.get_build_name_id(build)
 
     def get_build_name_id(self, build):
-        results = self.exec_query(select.GET_BUILD_NAME.format(build=build))
+        results = self.exec_query(select.GET_BUILD_NAME, dict(build=build))
         if len(results) == 0:
             raise DiscordBotException("That build does not exist.")
         name, = results[0]
@@ -382,32 +724,28 @@ class DatabaseHandler(object):
         if self.get_build_owner(build) != owner:
             raise DiscordBotException("Shame on you. You are not the owner of that build.")
         name = self.get_build_name(build, owner)
-        self.exec_command(delete.DELETE_BUILD_BY_ID.format(build=build))
+        self.exec_command(delete.DELETE_BUILD_BY_ID, dict(build=build))
         return name
 
     def insert_strategy(self, owner: str, strategy: Strategy):
         """Insert a Strategy into the database"""
         name, data = strategy.name, strategy.serialize().encode()
-        command = insert.INSERT_STRATEGY.format(owner=owner, name=name)
-        return self.exec_command(command, (data,))
+        return self.exec_command(insert.INSERT_STRATEGY, dict(owner=owner, name=name, data=data))
 
     def get_strategies(self, owner: str):
         """Return all strategies owned by a certain client"""
-        query = select.GET_STRATEGIES.format(owner=owner)
-        r = self.exec_query(query)
+        r = self.exec_query(select.GET_STRATEGIES, dict(owner=owner))
         if len(r) == 0:
             return None
         return tuple(a[0] for a in r)
 
     def get_strategy_data(self, owner: str, name: str):
         """Return the serialized strategy data"""
-        query = select.GET_STRATEGY_DATA.format(owner=owner, name=name)
-        r = self.exec_query(query)
+        r = self.exec_query(select.GET_STRATEGY_DATA, dict(owner=owner, name=name))
         if len(r) == 0:
             return None
         return r[0][0].decode()
 
     def delete_strategy(self, owner, name):
         """Delete a strategy given a strategy name and owner"""
-        command = delete.DELETE_STRATEGY.format(owner=owner, name=name)
-        return self.exec_command(command)
+        return self.exec_command(delete.DELETE_STRATEGY, dict(owner=owner, name=name))
@@ -0,0 +1,98 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from types import GeneratorType
+# Project Modules
+from database.database import DatabaseHandler, DatabaseTimeout, DATABASE_TIMEOUT
+from database.ingest import IngestQueue
+from utils import setup_logger
+
+
+class AsyncDatabaseHandler(object):
+    """
+    Awaitable facade of a DatabaseHandler
+
+    Every method of the DatabaseHandler is available as a coroutine
+    function that executes the call on dedicated threads, so a slow
+    query never blocks the event loop. There is a thread for every
+    reader connection of the handler and one for the writer. Ingest
+    calls are grouped into transactions by the IngestQueue, with the
+    same timeout.
+
+    Usage:
+        db = AsyncDatabaseHandler(DatabaseHandler())
+        owner = await db.get_build_owner(build)
+        data = await db.get_build_data(build, timeout=2.0)
+        await db.ingest.insert_result(character, server, ...)
+    """
+
+    # Methods that only read the memory of the handler are called directly
+    IN_MEMORY = ("get_user_in_database", "get_auth_code")
+
+    def __init__(self, handler: DatabaseHandler, timeout: float = DATABASE_TIMEOUT):
+        """
+        :param handler: DatabaseHandler to execute the calls with
+        :param timeout: Default number of seconds a call may take
+        """
+        self.handler = handler
+        self.timeout = timeout
+        self.executor = ThreadPoolExecutor(max_workers=handler.readers + 1)
+        self.ingest = IngestQueue(handler, timeout=timeout)
+        self.logger = setup_logger("AsyncDatabaseHandler", "database.log")
+
+    def __getattr__(self, name: str):
+        """Return a coroutine function for a DatabaseHandler method"""
+        func = getattr(self.handler, name)
+        if not callable(func):
+            return func
+
+        async def call(*args, timeout: float = None, **kwargs):
+            if name in self.IN_MEMORY:
+                return func(*args, **kwargs)
+            return await self.run(func, *args, timeout=timeout, **kwargs)
+
+        call.__name__, call.__doc__ = name, func.__doc__
+        return call
+
+    def execute(self, tokens: list, func: callable, *args, **kwargs):
+        """Execute an interruptible call, consuming the generators that query lazily"""
+        with self.handler.interruptible() as token:
+            tokens.append(token)
+            result = func(*args, **kwargs)
+            if isinstance(result, GeneratorType):
+                result = list(result)
+        return result
+
+    async def run(self, func: callable, *args, timeout: float = None, **kwargs):
+        """
+        Execute a function on the database thread and return its result
+
+        Calls that are still queued when the timeout expires are never
+        executed, a query that is running is interrupted.
+
+        :param timeout: Number of seconds the call may take, including
+            the time it is queued, the default timeout if None
+        :raises DatabaseTimeout: The call did not complete in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        tokens = list()
+        future = self.executor.submit(self.execute, tokens, func, *args, **kwargs)
+        try:
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            # Only the statement of this call is interrupted, never a later call on the same thread
+            if len(tokens) != 0:
+                self.handler.interrupt(tokens[0])
+            self.logger.error("Database call {} timed out after {}s.".format(func.__name__, timeout))
+            raise DatabaseTimeout(func.__name__, timeout)
+
+    def close(self):
+        """Wait for all pending calls and close the database connection"""
+        self.ingest.close()
+        self.executor.shutdown(wait=True)
+        self.handler.close()
@@ -0,0 +1,164 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+import asyncio
+from concurrent.futures import Future
+from queue import Empty, Queue
+from threading import Thread
+from time import perf_counter
+# Project Modules
+from database.database import DatabaseHandler, DatabaseTimeout, DATABASE_TIMEOUT
+from utils import setup_logger
+
+
+INGEST_BATCH = 256
+INGEST_DELAY = 0.05
+
+
+class IngestQueue(object):
+    """
+    Group-commit write queue for the ingest commands of the DiscordServer
+
+    Calls of DatabaseHandler methods are executed in order of
+    submission on a thread of their own. The calls are grouped into a
+    single transaction, which is committed when it holds INGEST_BATCH
+    calls or INGEST_DELAY seconds have passed since its first call.
+    Every call is executed in a savepoint, so a call that fails does
+    not roll back the other calls in its transaction.
+
+    An awaited call that is still queued when its timeout expires is
+    never executed, a call that is executing is interrupted.
+
+    Usage:
+        ingest = IngestQueue(DatabaseHandler())
+        await ingest.insert_result(character, server, ...)
+        await ingest.update_match(server, ..., timeout=2.0)
+    """
+
+    FLUSH = object()
+    STOP = object()
+
+    def __init__(self, handler: DatabaseHandler, size: int = INGEST_BATCH, delay: float = INGEST_DELAY,
+                 timeout: float = DATABASE_TIMEOUT):
+        """
+        :param handler: DatabaseHandler to execute the calls with
+        :param size: Maximum number of calls in a transaction
+        :param delay: Maximum number of seconds a call waits for other
+            calls to be grouped with
+        :param timeout: Default number of seconds an awaited call may
+            take, including the time it waits for its commit
+        """
+        self.handler = handler
+        self.size, self.delay, self.timeout = size, delay, timeout
+        self.batches, self.calls = 0, 0
+        self.logger = setup_logger("IngestQueue", "database.log")
+        self._tokens = dict()  # Future: interruptible token of the call executing
+        self._queue = Queue()
+        self._thread = Thread(target=self.run, name="Ingest", daemon=True)
+        self._thread.start()
+
+    def __getattr__(self, name: str):
+        """Return a coroutine function that submits a DatabaseHandler method"""
+        func = getattr(self.handler, name)
+
+        async def call(*args, timeout: float = None, **kwargs):
+            return await self.await_call(func, *args, timeout=timeout, **kwargs)
+
+        call.__name__, call.__doc__ = name, func.__doc__
+        return call
+
+    def submit(self, func: callable, *args, **kwargs) -> Future:
+        """Queue a call, the Future is done once its transaction is committed"""
+        future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    async def await_call(self, func: callable, *args, timeout: float = None, **kwargs):
+        """
+        Queue a call and return its result once it is committed
+
+        :param timeout: Number of seconds the call may take, the default
+            timeout if None
+        :raises DatabaseTimeout: The call was not committed in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        future = self.submit(func, *args, **kwargs)
+        try:
+            # A call that is still queued is cancelled with the wrapping future
+            return await asyncio.wait_for(asyncio.wrap_future(future), timeout)
+        except asyncio.TimeoutError:
+            token = self._tokens.get(future)
+            if token is not None:
+                self.handler.interrupt(token)
+            self.logger.error("Ingest call {} timed out after {}s.".format(func.__name__, timeout))
+            raise DatabaseTimeout(func.__name__, timeout)
+
+    def flush(self):
+        """Commit all queued calls and wait until they are done"""
+        future = Future()
+        self._queue.put((future, self.FLUSH, (), {}))
+        future.result()
+
+    def close(self):
+        """Commit all queued calls and stop the ingest thread"""
+        self._queue.put((None, self.STOP, (), {}))
+        self._thread.join()
+
+    def run(self):
+        """Group the queued calls into transactions until stopped"""
+        stop = False
+        while not stop:
+            batch = [self._queue.get()]
+            deadline = perf_counter() + self.delay
+            while len(batch) < self.size and batch[-1][1] not in (self.FLUSH, self.STOP):
+                timeout = deadline - perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except Empty:
+                    break
+            stop = batch[-1][1] is self.STOP
+            self.execute([call for call in batch if call[1] not in (self.FLUSH, self.STOP)])
+            for future, func, _, _ in batch:
+                if func is self.FLUSH:
+                    future.set_result(None)
+
+    def execute_call(self, future: Future, func: callable, *args, **kwargs):
+        """Execute an interruptible call in a savepoint of the transaction of the batch"""
+        with self.handler.interruptible() as token:
+            self._tokens[future] = token
+            try:
+                with self.handler.savepoint():
+                    return func(*args, **kwargs)
+            finally:
+                del self._tokens[future]
+
+    def execute(self, batch: list):
+        """Execute the calls of a batch that were not cancelled in a single transaction"""
+        batch = [call for call in batch if call[0].set_running_or_notify_cancel()]
+        if len(batch) == 0:
+            return
+        results = list()
+        try:
+            with self.handler.transaction() as connection:
+                for future, func, args, kwargs in batch:
+                    try:
+                        results.append((future, self.execute_call(future, func, *args, **kwargs), None))
+                    except Exception as e:
+                        if not connection.in_transaction:
+                            raise  # SQLite rolled back the whole transaction
+                        results.append((future, None, e))
+        except Exception as e:
+            self.logger.error("Commit of a batch of {} calls failed: {}".format(len(batch), repr(e)))
+            results = [(future, None, e) for future, _, _, _ in batch]
+        self.batches += 1
+        self.calls += len(batch)
+        for future, result, exception in results:
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(result)
@@ -5,15 +5,15 @@ Copyright (C) 2018 RedFantom
 """
 
 INSERT_USER = """
-    INSERT INTO User(id, code, last) VALUES ('{discord}', '{code}', '{last}');
+    INSERT INTO User(id, code, last) VALUES (:discord, :code, :last);
 """
 
 UPDATE_CODE = """
-    UPDATE User SET code = '{code}' WHERE id = '{discord}';
+    UPDATE User SET code = :code WHERE id = :discord;
 """
 
 UPDATE_HOME = """
-    UPDATE User SET home = '{discord}' WHERE id = '{home}';
+    UPDATE User SET home = :discord WHERE id = :home;
 """
 
 INSERT_SERVERS = """
@@ -27,48 +27,46 @@ INSERT_SERVERS = """
 
 INSERT_CHARACTER = """
     INSERT OR IGNORE INTO Character(name, server, faction, owner) VALUES 
-        ('{name}', '{server}', '{faction}', '{owner}');
+        (:name, :server, :faction, :owner);
 """
 
 INSERT_MATCH = """
     INSERT OR IGNORE INTO 'Match'('server', 'date', 'start', 'idfmt') values 
-        ('{server}', '{date}', '{start}', '{idfmt}');
+        (:server, :date, :start, :idfmt);
 """
 
-UPDATE_MATCH_SCORE = """
-    UPDATE Match SET score = {score} WHERE id = {match}; 
-"""
-
-UPDATE_MATCH_END = """
-    UPDATE Match SET end = '{end}' WHERE id = {match};
-"""
-
-UPDATE_MATCH_MAP = """
-    UPDATE Match SET map = '{map}' WHERE id = {match};
+# Attributes that are NULL are left unchanged for an existing match
+UPSERT_MATCH = """
+    INSERT INTO 'Match'('server', 'date', 'start', 'idfmt', 'score', 'map', 'end') VALUES
+        (:server, :date, :start, :idfmt, :score, :map, :end)
+    ON CONFLICT (server, date, idfmt) DO UPDATE SET
+        score = COALESCE(excluded.score, score),
+        map = COALESCE(excluded.map, map),
+        end = COALESCE(excluded.end, end);
 """
 
 INSERT_RESULT = """
     INSERT OR IGNORE INTO Result(match, char, assists, dmgd, dmgt, deaths, ship) VALUES 
-        ({match}, {char}, {assists}, {dmgd}, {dmgt}, {deaths}, '{ship}');
+        (:match, :char, :assists, :dmgd, :dmgt, :deaths, :ship);
 """
 
 INSERT_BUILD = """
     INSERT INTO Builds(owner, name, data, public) VALUES
-        ('{owner}', '{name}', '{data}', {public});
+        (:owner, :name, :data, :public);
 """
 
 UPDATE_BUILD_DATA = """
-    UPDATE Builds SET data = '{data}' WHERE build = {build};
+    UPDATE Builds SET data = :data WHERE build = :build;
 """
 
 UPDATE_BUILD_PUBLIC = """
-    UPDATE Builds SET public = {public} WHERE build = {build};
+    UPDATE Builds SET public = :public WHERE build = :build;
 """
 
 UPDATE_USER_LAST = """
-    UPDATE User SET last = '{date}' WHERE id = '{tag}'
+    UPDATE User SET last = :date WHERE id = :tag
 """
 
 INSERT_STRATEGY = """
-    INSERT OR REPLACE INTO Strategies(owner, name, data) VALUES ('{owner}', '{name}', ?);
+    INSERT OR REPLACE INTO Strategies(owner, name, data) VALUES (:owner, :name, :data);
 """
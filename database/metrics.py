@@ -0,0 +1,117 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from bisect import bisect_left
+from collections import deque
+from datetime import datetime
+from threading import Lock
+# Project Modules
+from database import create, delete, insert, migrations, select
+
+
+# Upper bounds of the latency buckets in seconds, the last bucket is unbounded
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_LOG = 64
+ADHOC = "adhoc"
+
+
+def get_statement_names() -> dict:
+    """Return a dictionary of the SQL statements of the database modules and their names"""
+    names = dict()
+    for module in (create, delete, insert, migrations, select):
+        prefix = module.__name__.split(".")[-1]
+        for name, value in vars(module).items():
+            if not name.isupper():
+                continue
+            for statement in (value if isinstance(value, tuple) else (value,)):
+                if isinstance(statement, str):
+                    names[statement] = "{}.{}".format(prefix, name)
+    return names
+
+
+class Histogram(object):
+    """Latency histogram of a single statement"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count, self.total, self.max, self.rows = 0, 0.0, 0.0, 0
+
+    def add(self, duration: float, rows: int):
+        self.buckets[bisect_left(LATENCY_BUCKETS, duration)] += 1
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.rows += max(rows, 0)
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket that holds the quantile, at most the maximum"""
+        rank, seen = q * self.count, 0
+        for i, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count != 0:
+                return min(LATENCY_BUCKETS[i], self.max) if i < len(LATENCY_BUCKETS) else self.max
+        return 0.0
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "total": self.total,
+            "mean": self.total / self.count if self.count != 0 else 0.0,
+            "max": self.max,
+            "p50": self.quantile(0.50),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "rows": self.rows,
+            "buckets": list(self.buckets),
+        }
+
+
+class QueryMetrics(object):
+    """
+    Latency histograms per named statement and a log of slow statements
+
+    Statements are named after their constant in the database modules,
+    other statements are grouped under ADHOC.
+    """
+
+    def __init__(self, threshold: float = SLOW_QUERY_THRESHOLD, size: int = SLOW_QUERY_LOG):
+        """
+        :param threshold: Seconds after which a statement is slow
+        :param size: Number of slow statements that are kept
+        """
+        self.threshold = threshold
+        self.names = get_statement_names()
+        self.slow = deque(maxlen=size)
+        self._histograms = dict()
+        self._lock = Lock()
+
+    def get_name(self, statement: str) -> str:
+        return self.names.get(statement, ADHOC)
+
+    def record(self, name: str, duration: float, rows: int) -> bool:
+        """Record the execution of a statement and return whether it was slow"""
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.add(duration, rows)
+        return duration > self.threshold
+
+    def record_slow(self, name: str, duration: float, statement: str, plan: list):
+        """Add a slow statement and its query plan to the log"""
+        self.slow.append({
+            "time": datetime.now().isoformat(),
+            "name": name,
+            "duration": duration,
+            "statement": " ".join(statement.split()),
+            "plan": plan,
+        })
+
+    def histograms(self) -> dict:
+        """Return the histograms by statement name"""
+        with self._lock:
+            return {name: histogram.to_dict() for name, histogram in self._histograms.items()}
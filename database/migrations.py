@@ -0,0 +1,112 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+
+# Schema migrations applied in order by DatabaseHandler.migrate
+#
+# Every migration is a tuple of (version, description, commands). The
+# user_version of the database is set to the version of the last applied
+# migration. New migrations must be appended with a higher version, and
+# should be idempotent in case they are applied to a database that was
+# changed by hand.
+
+CREATE_INDEXES_MATCH = (
+    # Match counts by day: WHERE date = ? GROUP BY server
+    """
+    CREATE INDEX IF NOT EXISTS MatchDateServer ON 'Match'(date, server);
+    """,
+    # Matches of a server by day and results of a match by start
+    """
+    CREATE INDEX IF NOT EXISTS MatchServerDateStart ON 'Match'(server, date, start, end, map, score);
+    """,
+)
+
+CREATE_INDEXES_CHARACTER = (
+    """
+    CREATE INDEX IF NOT EXISTS CharacterOwner ON 'Character'(owner);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS ResultChar ON 'Result'(char);
+    """,
+)
+
+CREATE_INDEXES_BUILDS = (
+    """
+    CREATE INDEX IF NOT EXISTS BuildsOwnerName ON 'Builds'(owner, name, public);
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS BuildsPublic ON 'Builds'(public);
+    """,
+)
+
+CREATE_TABLE_MATCH_DAILY = (
+    """
+    CREATE TABLE IF NOT EXISTS MatchDaily(
+        date TEXT NOT NULL,
+        server TEXT REFERENCES Server(id) NOT NULL,
+        matches INTEGER NOT NULL DEFAULT 0,
+        tdm INTEGER NOT NULL DEFAULT 0,
+        dom INTEGER NOT NULL DEFAULT 0,
+        scored INTEGER NOT NULL DEFAULT 0,
+        score REAL NOT NULL DEFAULT 0.0,
+        PRIMARY KEY (date, server)
+    ) WITHOUT ROWID;
+    """,
+    # The triggers execute in the transaction of the command that
+    # changes the Match table, so the rollup is always consistent
+    """
+    CREATE TRIGGER IF NOT EXISTS MatchDailyInsert AFTER INSERT ON 'Match' BEGIN
+        INSERT INTO MatchDaily(date, server, matches, tdm, dom, scored, score) VALUES (
+            NEW.date, NEW.server, 1, IFNULL(NEW.map, '') LIKE 'tdm,%', IFNULL(NEW.map, '') LIKE 'dom,%',
+            NEW.score IS NOT NULL, COALESCE(NEW.score, 0.0))
+        ON CONFLICT (date, server) DO UPDATE SET
+            matches = matches + excluded.matches, tdm = tdm + excluded.tdm, dom = dom + excluded.dom,
+            scored = scored + excluded.scored, score = score + excluded.score;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS MatchDailyUpdate AFTER UPDATE OF date, server, map, score ON 'Match' BEGIN
+        UPDATE MatchDaily SET
+            matches = matches - 1, tdm = tdm - (IFNULL(OLD.map, '') LIKE 'tdm,%'), dom = dom - (IFNULL(OLD.map, '') LIKE 'dom,%'),
+            scored = scored - (OLD.score IS NOT NULL), score = score - COALESCE(OLD.score, 0.0)
+        WHERE date = OLD.date AND server = OLD.server;
+        INSERT INTO MatchDaily(date, server, matches, tdm, dom, scored, score) VALUES (
+            NEW.date, NEW.server, 1, IFNULL(NEW.map, '') LIKE 'tdm,%', IFNULL(NEW.map, '') LIKE 'dom,%',
+            NEW.score IS NOT NULL, COALESCE(NEW.score, 0.0))
+        ON CONFLICT (date, server) DO UPDATE SET
+            matches = matches + excluded.matches, tdm = tdm + excluded.tdm, dom = dom + excluded.dom,
+            scored = scored + excluded.scored, score = score + excluded.score;
+    END;
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS MatchDailyDelete AFTER DELETE ON 'Match' BEGIN
+        UPDATE MatchDaily SET
+            matches = matches - 1, tdm = tdm - (IFNULL(OLD.map, '') LIKE 'tdm,%'), dom = dom - (IFNULL(OLD.map, '') LIKE 'dom,%'),
+            scored = scored - (OLD.score IS NOT NULL), score = score - COALESCE(OLD.score, 0.0)
+        WHERE date = OLD.date AND server = OLD.server;
+    END;
+    """,
+)
+
+BACKFILL_MATCH_DAILY = (
+    """
+    DELETE FROM MatchDaily;
+    """,
+    """
+    INSERT INTO MatchDaily(date, server, matches, tdm, dom, scored, score)
+        SELECT date, server, COUNT(id), COALESCE(SUM(map LIKE 'tdm,%'), 0), COALESCE(SUM(map LIKE 'dom,%'), 0),
+            COUNT(score), COALESCE(SUM(score), 0.0)
+        FROM 'Match' GROUP BY date, server;
+    """,
+)
+
+MIGRATIONS = (
+    (1, "Indexes for matches by day and server", CREATE_INDEXES_MATCH),
+    (2, "Indexes for characters and results by owner", CREATE_INDEXES_CHARACTER),
+    (3, "Indexes for builds by owner, name and public", CREATE_INDEXES_BUILDS),
+    (4, "Daily rollup of matches by server", CREATE_TABLE_MATCH_DAILY + BACKFILL_MATCH_DAILY),
+)
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
@@ -0,0 +1,122 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+import sqlite3 as sql
+from threading import Lock, Semaphore
+from time import perf_counter
+
+
+class TimedLock(object):
+    """Lock that keeps track of the time spent waiting to acquire it"""
+
+    def __init__(self):
+        self._lock = Lock()
+        self.acquisitions, self.wait, self.max_wait = 0, 0.0, 0.0
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *args):
+        self.release()
+
+    def acquire(self):
+        start = perf_counter()
+        self._lock.acquire()
+        wait = perf_counter() - start
+        self.acquisitions += 1
+        self.wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def release(self):
+        self._lock.release()
+
+    def metrics(self) -> dict:
+        return {
+            "lock_acquisitions": self.acquisitions,
+            "lock_wait": self.wait,
+            "lock_wait_max": self.max_wait,
+        }
+
+
+class ConnectionPool(object):
+    """
+    Bounded pool of read-only connections to a database in WAL mode
+
+    Connections are opened when there is no idle connection and less
+    than size connections are in use, otherwise the acquiring thread
+    waits until a connection is returned to the pool.
+    """
+
+    def __init__(self, file_name: str, size: int, statements: int = 128, timeout: float = 5.0):
+        """
+        :param file_name: File name of the SQLite database
+        :param size: Maximum number of connections
+        :param statements: Size of the prepared statement cache of a connection
+        :param timeout: Seconds a connection waits for a database lock
+        """
+        self._file_name, self.size, self._timeout = file_name, size, timeout
+        self._statements = statements
+        self._idle = LifoQueue()
+        self._slots = Semaphore(size)
+        self._lock = Lock()
+        self.opened, self.in_use, self.peak = 0, 0, 0
+        self.acquisitions, self.wait = 0, 0.0
+
+    def connect(self) -> sql.Connection:
+        """Open a new read-only connection"""
+        connection = sql.connect(
+            self._file_name, timeout=self._timeout, check_same_thread=False, cached_statements=self._statements)
+        connection.execute("PRAGMA query_only = ON;")
+        with self._lock:
+            self.opened += 1
+        return connection
+
+    @contextmanager
+    def connection(self) -> sql.Connection:
+        """Acquire a connection for the duration of a with-clause"""
+        start = perf_counter()
+        self._slots.acquire()
+        try:
+            try:
+                connection = self._idle.get_nowait()
+            except Empty:
+                connection = self.connect()
+            with self._lock:
+                self.acquisitions += 1
+                self.wait += perf_counter() - start
+                self.in_use += 1
+                self.peak = max(self.peak, self.in_use)
+            try:
+                yield connection
+            finally:
+                with self._lock:
+                    self.in_use -= 1
+                self._idle.put(connection)
+        finally:
+            self._slots.release()
+
+    def close(self):
+        """Close all idle connections"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except Empty:
+                break
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "pool_size": self.size,
+                "pool_opened": self.opened,
+                "pool_in_use": self.in_use,
+                "pool_peak": self.peak,
+                "pool_utilization": self.in_use / self.size,
+                "pool_acquisitions": self.acquisitions,
+                "pool_wait": self.wait,
+            }
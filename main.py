@@ -7,8 +7,9 @@ Copyright (C) 2018 RedFantom
 import asyncio
 from traceback import format_exc
 # Project Modules
-from database import DatabaseHandler
+from database import AsyncDatabaseHandler, DatabaseHandler
 from bot.bot import DiscordBot
+from parsing.assets import assets
 from server import DiscordServer
 from settings import settings
 from utils.utils import setup_logger
@@ -33,7 +34,8 @@ async def run_bot(bot: DiscordBot, token: str):
 
 if __name__ == '__main__':
     loop = asyncio.get_event_loop()
-    database = DatabaseHandler()
+    assets.load()  # No command should have to unpickle the assets
+    database = AsyncDatabaseHandler(DatabaseHandler())
     host, port = settings["server"]["domain"], settings["server"]["port"]
     server = DiscordServer(database, loop, host, port)
     bot = DiscordBot(database, server, loop)
@@ -45,4 +47,4 @@ if __name__ == '__main__':
     except KeyboardInterrupt:
         pass
     finally:
-        database.db.close()
+        database.close()
@@ -0,0 +1,438 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from collections import namedtuple
+from collections.abc import Mapping
+from contextlib import closing
+import os
+import pickle
+import sqlite3 as sql
+from threading import Lock
+from time import perf_counter
+from types import MappingProxyType
+# Project Modules
+from data.components import COMPONENTS
+from utils.utils import get_assets_directory, setup_logger
+
+
+logger = setup_logger("Assets", "assets.log")
+
+ASSET_DATABASE = "assets.sqlite"
+ASSET_FORMAT = 2  # Stored in PRAGMA user_version, bump upon schema change
+SOURCES = ("ships", "companions", "crew", "components", "categories")
+
+CREATE_TABLES = (
+    "CREATE TABLE Ship(fqn TEXT PRIMARY KEY, categories TEXT NOT NULL, data BLOB NOT NULL);",
+    "CREATE TABLE Component("
+    "   ship TEXT, category TEXT, idx INTEGER, name TEXT NOT NULL, data BLOB NOT NULL,"
+    "   PRIMARY KEY(ship, category, idx)) WITHOUT ROWID;",
+    "CREATE TABLE Crew(name TEXT PRIMARY KEY, data BLOB NOT NULL);",
+    "CREATE TABLE Companion("
+    "   faction TEXT, category TEXT, name TEXT, data BLOB NOT NULL,"
+    "   PRIMARY KEY(faction, category, name)) WITHOUT ROWID;",
+    "CREATE TABLE ComponentInfo("
+    "   category TEXT, name TEXT, data BLOB NOT NULL,"
+    "   PRIMARY KEY(category, name)) WITHOUT ROWID;",
+    "CREATE TABLE Category(faction TEXT PRIMARY KEY, data BLOB NOT NULL);",
+    "CREATE TABLE ComponentStats("
+    "   ship TEXT, category TEXT, idx INTEGER, position INTEGER, stat TEXT NOT NULL, value REAL NOT NULL,"
+    "   PRIMARY KEY(ship, category, idx, position)) WITHOUT ROWID;",
+    "CREATE TABLE Effect("
+    "   ship TEXT, category TEXT, idx INTEGER, tier INTEGER, side INTEGER, position INTEGER,"
+    "   target TEXT NOT NULL, stat TEXT NOT NULL, multiplicative INTEGER NOT NULL, value REAL NOT NULL,"
+    "   PRIMARY KEY(ship, category, idx, tier, side, position)) WITHOUT ROWID;",
+)
+
+GET_SHIP_INDEX = "SELECT fqn, categories FROM Ship ORDER BY rowid;"
+GET_CREW_INDEX = "SELECT name FROM Crew ORDER BY rowid;"
+GET_SHIP = "SELECT data FROM Ship WHERE fqn = ?;"
+GET_COMPONENT = "SELECT data FROM Component WHERE ship = ? AND category = ? AND idx = ?;"
+GET_COMPONENTS = "SELECT data FROM Component WHERE ship = ? AND category = ? ORDER BY idx;"
+GET_CREW_MEMBER = "SELECT data FROM Crew WHERE name = ?;"
+GET_COMPANION = "SELECT data FROM Companion WHERE faction = ? AND category = ? AND name = ?;"
+GET_COMPONENT_INFO = "SELECT data FROM ComponentInfo WHERE category = ? AND name = ?;"
+GET_CATEGORIES = "SELECT data FROM Category WHERE faction = ?;"
+GET_COMPONENT_STATS = "SELECT stat, value FROM ComponentStats WHERE ship = ? AND category = ? AND idx = ? " \
+                      "ORDER BY position;"
+GET_EFFECTS = "SELECT tier, side, target, stat, multiplicative, value FROM Effect " \
+              "WHERE ship = ? AND category = ? AND idx = ? ORDER BY tier, side, position;"
+
+BASE = (-1, -1)  # Upgrade key of the effect of the base statistics on the Ship
+STAT_ALIASES = {"Cooldown_Time": "Cooldown"}
+
+# Precompiled statistics of a component, with the effects of its
+# upgrades and base statistics as tuples of (targets, stat, multiplicative,
+# value) in the order ShipStats applies them
+ComponentEffects = namedtuple("ComponentEffects", ("base", "ship", "upgrades"))
+
+
+def get_asset_database_path() -> str:
+    """Return an absolute path to the indexed asset database"""
+    return os.path.join(get_assets_directory(), ASSET_DATABASE)
+
+
+def resolve_effect_target(target: str, category: str) -> tuple:
+    """Return the categories an upgrade target applies to, like ShipStats.apply_stat_ctg"""
+    target = target.replace("0x00", "")  # Inconsistency in data files
+    if target == "Self":
+        target = category
+    if target == "":
+        return "Ship",
+    if target[-1] == "s":
+        return target[:-1], target[:-1] + "2"
+    return target,
+
+
+def resolve_effects(targets: tuple, stats: dict) -> list:
+    """Return (targets, stat, multiplicative, value) tuples for a dictionary of statistics"""
+    effects = list()
+    for stat, value in stats.items():
+        stat = STAT_ALIASES.get(stat, stat)
+        effects.append((targets, stat.replace("[Pc]", "").replace("[Pb]", ""), "[Pc]" in stat, value))
+    return effects
+
+
+def compile_component(category: str, component: dict) -> (dict, list, dict):
+    """Return the base statistics, the effect on the Ship and the upgrade effects of a component"""
+    base = component["Base"]["Stats"].copy()
+    base.update(component["Stats"])
+    base["Cooldown"] = component["Base"]["Cooldown"]
+    upgrades = dict()
+    for tier, row in enumerate(component["TalentTree"]):
+        for side, upgrade in enumerate(row):
+            upgrades[(tier, side)] = resolve_effects(
+                resolve_effect_target(upgrade["Target"], category), upgrade["Stats"])
+    return base, resolve_effects(("Ship",), base), upgrades
+
+
+def needs_conversion(file_name: str) -> bool:
+    """Return whether the asset database is missing or outdated"""
+    if not os.path.exists(file_name):
+        return True
+    modified = os.path.getmtime(file_name)
+    for name in SOURCES:
+        if os.path.getmtime(os.path.join(get_assets_directory(), "{}.db".format(name))) > modified:
+            return True
+    with closing(sql.connect(file_name)) as db:
+        version, = db.execute("PRAGMA user_version;").fetchone()
+    return version != ASSET_FORMAT
+
+
+def convert_assets(file_name: str = None) -> str:
+    """
+    Convert the pickled asset databases into an indexed SQLite database
+
+    Every ship, component, crew member and companion is stored as a
+    separately pickled record, keyed by ship FQN and component index,
+    so that only the records required are ever loaded. The statistics of
+    the components and the effects of their upgrades are resolved into
+    flat tables, so they are not derived again for every build. The database is
+    written to a temporary file first and then moved into place, so
+    other processes never open a partially written database.
+    """
+    file_name = file_name or get_asset_database_path()
+    temp = file_name + ".tmp"
+    if os.path.exists(temp):
+        os.remove(temp)
+    sources = dict()
+    for name in SOURCES:
+        with open(os.path.join(get_assets_directory(), "{}.db".format(name)), "rb") as fi:
+            sources[name] = pickle.load(fi)
+    dumps = pickle.dumps
+    with closing(sql.connect(temp)) as db:
+        for command in CREATE_TABLES:
+            db.execute(command)
+        for fqn, ship in sources["ships"].items():
+            categories = [key for key in ship if key in COMPONENTS]
+            record = {key: value for key, value in ship.items() if key not in categories}
+            db.execute("INSERT INTO Ship VALUES (?, ?, ?);", (fqn, ",".join(categories), dumps(record)))
+            for category in categories:
+                db.executemany("INSERT INTO Component VALUES (?, ?, ?, ?, ?);", (
+                    (fqn, category, i, component["Name"], dumps(component))
+                    for i, component in enumerate(ship[category])))
+                for i, component in enumerate(ship[category]):
+                    base, effects, upgrades = compile_component(category, component)
+                    db.executemany("INSERT INTO ComponentStats VALUES (?, ?, ?, ?, ?, ?);", (
+                        (fqn, category, i, position, stat, value)
+                        for position, (stat, value) in enumerate(base.items())))
+                    upgrades[BASE] = effects
+                    db.executemany("INSERT INTO Effect VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?);", (
+                        (fqn, category, i, tier, side, position, ",".join(targets), stat, mul, value)
+                        for (tier, side), effects in upgrades.items()
+                        for position, (targets, stat, mul, value) in enumerate(effects)))
+        db.executemany("INSERT INTO Crew VALUES (?, ?);", (
+            (name, dumps(member)) for name, member in sources["crew"].items()))
+        for faction, roles in sources["companions"].items():
+            for role in roles:
+                for category, members in role.items():
+                    # Only the first companion with a name is ever used
+                    db.executemany("INSERT OR IGNORE INTO Companion VALUES (?, ?, ?, ?);", (
+                        (faction, category, member["Name"], dumps(member)) for member in members))
+        for category, components in sources["components"].items():
+            db.executemany("INSERT INTO ComponentInfo VALUES (?, ?, ?);", (
+                (category, name, dumps(component)) for name, component in components.items()))
+        db.executemany("INSERT INTO Category VALUES (?, ?);", (
+            (faction, dumps(categories)) for faction, categories in sources["categories"].items()))
+        db.execute("PRAGMA user_version = {};".format(ASSET_FORMAT))
+        db.commit()
+    os.replace(temp, file_name)
+    logger.info("Converted asset databases into {}.".format(file_name))
+    return file_name
+
+
+class ShipRecord(Mapping):
+    """
+    Read-only mapping with the same keys as a ships.db entry
+
+    The ship statistics and properties are loaded with the record, but
+    the component lists are only fetched when a category is accessed.
+    """
+
+    def __init__(self, store, fqn: str, data: dict, categories: tuple):
+        self._store = store
+        self._data = data
+        self._categories = categories
+        self.fqn = fqn
+
+    def __getitem__(self, key):
+        if key in self._categories:
+            return self._store.components(self.fqn, key)
+        return self._data[key]
+
+    def __contains__(self, key):
+        return key in self._categories or key in self._data
+
+    def __iter__(self):
+        yield from self._data
+        yield from self._categories
+
+    def __len__(self):
+        return len(self._data) + len(self._categories)
+
+
+class ShipsTable(Mapping):
+    """Read-only mapping of ship FQN: ShipRecord"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, fqn: str):
+        return self._store.ship(fqn)
+
+    def __contains__(self, fqn):
+        return fqn in self._store.ship_index
+
+    def __iter__(self):
+        return iter(self._store.ship_index)
+
+    def __len__(self):
+        return len(self._store.ship_index)
+
+
+class CrewTable(Mapping):
+    """Read-only mapping of crew member name: data, in crew.db order"""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __getitem__(self, name: str):
+        return self._store.crew_member(name)
+
+    def __contains__(self, name):
+        return name in self._store.crew_index
+
+    def __iter__(self):
+        return iter(self._store.crew_index)
+
+    def __len__(self):
+        return len(self._store.crew_index)
+
+
+class AssetStore(object):
+    """
+    Process-wide store of the asset data
+
+    The data is read from an indexed SQLite database that is generated
+    from the pickled asset databases if required. Records are fetched
+    only when first requested, after which the same object is returned
+    to every caller. As the data is shared by all requests, it must be
+    treated as read-only: copy anything that is to be modified.
+
+    The database is opened read-only and memory-mapped, so that
+    multiple worker processes share the same pages. Caches of data
+    derived from the records register a listener, which is called
+    whenever the records are dropped, as they are reloaded from a
+    possibly converted database upon the next access.
+
+    :attribute load_times: record kind: seconds spent loading records
+    :attribute hits: record kind: number of accesses served from memory
+    :attribute misses: record kind: number of records loaded
+    """
+
+    KINDS = ("ship", "component", "components", "crew", "companion", "component_info", "categories", "effects")
+    MMAP_SIZE = 16 * 1024 * 1024
+
+    def __init__(self, file_name: str = None):
+        """
+        :param file_name: Path to the asset database, generated if it
+            does not exist or is outdated
+        """
+        self._file_name = file_name
+        self._db = None
+        self._lock = Lock()
+        self._records = dict()
+        self._ship_index = dict()  # fqn: tuple of component categories
+        self._crew_index = tuple()
+        self._listeners = list()
+        self.ships = ShipsTable(self)
+        self.crew = CrewTable(self)
+        self.load_times = {kind: 0.0 for kind in self.KINDS}
+        self.hits = {kind: 0 for kind in self.KINDS}
+        self.misses = {kind: 0 for kind in self.KINDS}
+
+    def load(self):
+        """Open the asset database, converting the assets if required"""
+        with self._lock:
+            if self._db is not None:
+                return
+            start = perf_counter()
+            file_name = self._file_name or get_asset_database_path()
+            if needs_conversion(file_name):
+                convert_assets(file_name)
+            db = sql.connect("file:{}?mode=ro".format(file_name), uri=True, check_same_thread=False)
+            db.execute("PRAGMA mmap_size = {};".format(self.MMAP_SIZE))
+            self._ship_index = {
+                fqn: tuple(categories.split(",")) for fqn, categories in db.execute(GET_SHIP_INDEX)}
+            self._crew_index = tuple(name for name, in db.execute(GET_CREW_INDEX))
+            self._db = db
+        logger.info("Opened asset database in {:.3f}s.".format(perf_counter() - start))
+
+    def add_listener(self, callback: callable):
+        """Register a callable without arguments to be called when the records are dropped"""
+        self._listeners.append(callback)
+
+    def _notify(self):
+        """Call the listeners, as all data derived from the records is outdated"""
+        for callback in self._listeners:
+            callback()
+
+    @property
+    def ship_index(self) -> dict:
+        """Dictionary of ship FQN: component categories, in ships.db order"""
+        if self._db is None:
+            self.load()
+        return self._ship_index
+
+    @property
+    def crew_index(self) -> tuple:
+        """Crew member names in crew.db order"""
+        if self._db is None:
+            self.load()
+        return self._crew_index
+
+    def close(self):
+        """Close the asset database and drop all loaded records"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+            self._db = None
+            self._records.clear()
+        self._notify()
+
+    def _fetch(self, kind: str, key: tuple, query: str, many=False):
+        """Return a record, loading it from the database if required"""
+        record = self._records.get((kind, key))
+        if record is not None:
+            self.hits[kind] += 1
+            return record
+        if self._db is None:
+            self.load()
+        start = perf_counter()
+        with self._lock:
+            rows = self._db.execute(query, key).fetchall()
+        if many is True:
+            record = [pickle.loads(data) for data, in rows]
+        elif len(rows) == 0:
+            raise KeyError("Asset record not found: {}, {}".format(kind, key))
+        else:
+            record = pickle.loads(rows[0][0])
+        self._records[(kind, key)] = record
+        self.load_times[kind] += perf_counter() - start
+        self.misses[kind] += 1
+        return record
+
+    def ship(self, fqn: str) -> ShipRecord:
+        """Return the ShipRecord for a ship FQN"""
+        record = self._records.get(("ship", (fqn,)))
+        if record is not None:
+            self.hits["ship"] += 1
+            return record
+        if fqn not in self.ship_index:
+            raise KeyError(fqn)
+        data = self._fetch("ship", (fqn,), GET_SHIP)
+        # Replace the raw data record with the mapping around it
+        record = self._records[("ship", (fqn,))] = ShipRecord(self, fqn, data, self.ship_index[fqn])
+        return record
+
+    def components(self, fqn: str, category: str) -> list:
+        """Return the list of component data for a category of a ship"""
+        return self._fetch("components", (fqn, category), GET_COMPONENTS, many=True)
+
+    def component(self, fqn: str, category: str, index: int) -> dict:
+        """Return the data of a single component of a ship"""
+        return self._fetch("component", (fqn, category, index), GET_COMPONENT)
+
+    def effects(self, fqn: str, category: str, index: int) -> ComponentEffects:
+        """Return the precompiled ComponentEffects of a single component of a ship"""
+        key = (fqn, category, index)
+        record = self._records.get(("effects", key))
+        if record is not None:
+            self.hits["effects"] += 1
+            return record
+        if self._db is None:
+            self.load()
+        start = perf_counter()
+        with self._lock:
+            base = self._db.execute(GET_COMPONENT_STATS, key).fetchall()
+            rows = self._db.execute(GET_EFFECTS, key).fetchall()
+        if len(base) == 0:
+            raise KeyError("Asset record not found: effects, {}".format(key))
+        upgrades = dict()
+        for tier, side, targets, stat, mul, value in rows:
+            upgrades.setdefault((tier, side), list()).append((tuple(targets.split(",")), stat, bool(mul), value))
+        upgrades = {upgrade: tuple(effects) for upgrade, effects in upgrades.items()}
+        record = ComponentEffects(MappingProxyType(dict(base)), upgrades.pop(BASE, ()), upgrades)
+        self._records[("effects", key)] = record
+        self.load_times["effects"] += perf_counter() - start
+        self.misses["effects"] += 1
+        return record
+
+    def crew_member(self, name: str) -> dict:
+        """Return the crew.db data of a crew member"""
+        return self._fetch("crew", (name,), GET_CREW_MEMBER)
+
+    def companion(self, faction: str, category: str, name: str) -> dict:
+        """Return the companions.db data of a crew member"""
+        return self._fetch("companion", (faction, category, name), GET_COMPANION)
+
+    def component_info(self, category: str, name: str) -> dict:
+        """Return the components.db data of a component"""
+        return self._fetch("component_info", (category, name), GET_COMPONENT_INFO)
+
+    def ship_categories(self, faction: str) -> list:
+        """Return the categories.db data of a faction"""
+        return self._fetch("categories", (faction,), GET_CATEGORIES)
+
+    def statistics(self) -> dict:
+        """Return a dictionary of record kind: (load time, hits, misses)"""
+        return {kind: (self.load_times[kind], self.hits[kind], self.misses[kind]) for kind in self.KINDS}
+
+
+assets = AssetStore()
+
+
+if __name__ == '__main__':
+    print("Written {}".format(convert_assets()))
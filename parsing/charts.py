@@ -0,0 +1,123 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Packages
+from PIL import Image, ImageDraw, ImageFont
+import numpy as np
+# Project Modules
+from parsing.shipops import TimeToKillMatrix, TimeToKillCurve
+from utils.utils import setup_logger
+
+
+logger = setup_logger("Charts", "render.log")
+
+BACKGROUND, FOREGROUND, INVALID = (54, 57, 63), (220, 221, 222), (90, 90, 90)
+FAST, SLOW = np.array((46, 204, 113)), np.array((231, 76, 60))
+CELL = (40, 18)
+PADDING = 6
+PLOT = (640, 320)
+LINE, GRID, MARKER = (66, 134, 244), (80, 84, 92), (46, 204, 113)
+
+
+def get_text_size(font: ImageFont.ImageFont, text: str) -> tuple:
+    """Return the size of a text rendered with a font"""
+    return font.getmask(text).size
+
+
+def get_time_colors(time: np.ndarray) -> np.ndarray:
+    """Return an RGB colour per time, from green for fast to red for slow"""
+    colors = np.empty(time.shape + (3,), dtype=np.uint8)
+    colors[...] = INVALID
+    valid = np.isfinite(time)
+    if valid.any():
+        low, high = time[valid].min(), time[valid].max()
+        scale = (time[valid] - low) / (high - low) if high > low else np.zeros(valid.sum())
+        colors[valid] = FAST + (SLOW - FAST) * scale[:, np.newaxis]
+    return colors
+
+
+def render_ttk_matrix(matrix: TimeToKillMatrix, sources: list, targets: list) -> Image.Image:
+    """
+    Render a TimeToKillMatrix as a heatmap
+
+    Every cell shows the number of shots for the source in its row to
+    kill the target in its column, coloured by the time to kill.
+    """
+    font = ImageFont.load_default()
+    label_w = max(get_text_size(font, label)[0] for label in sources) + 2 * PADDING
+    label_h = max(get_text_size(font, label)[0] for label in targets) + 2 * PADDING
+    (cell_w, cell_h), (rows, columns) = CELL, matrix.shots.shape
+    footer = get_text_size(font, "T")[1] * 2 + 3 * PADDING
+    size = (label_w + columns * cell_w + PADDING, label_h + rows * cell_h + footer)
+    image = Image.new("RGB", size, BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    for row, label in enumerate(sources):
+        draw.text((PADDING, label_h + row * cell_h + 3), label, font=font, fill=FOREGROUND)
+    for column, label in enumerate(targets):
+        # Column labels are drawn vertically to keep the columns narrow
+        text = Image.new("RGB", (label_h, cell_w), BACKGROUND)
+        ImageDraw.Draw(text).text((PADDING, 3), label, font=font, fill=FOREGROUND)
+        image.paste(text.rotate(90, expand=True), (label_w + column * cell_w, 0))
+    colors = get_time_colors(matrix.time)
+    for (row, column), shots in np.ndenumerate(matrix.shots):
+        x, y = label_w + column * cell_w, label_h + row * cell_h
+        draw.rectangle((x, y, x + cell_w - 2, y + cell_h - 2), fill=tuple(colors[row, column].tolist()))
+        text = "{:.0f}".format(shots) if np.isfinite(shots) else "-"
+        w, h = get_text_size(font, text)
+        draw.text((x + (cell_w - w) // 2, y + (cell_h - h) // 2 - 1), text, font=font, fill=(0, 0, 0))
+    y = label_h + rows * cell_h + PADDING
+    valid = matrix.time[np.isfinite(matrix.time)]
+    legend = "Shots to kill at {}m{}".format(
+        int(matrix.distance * 100), " with evasion" if matrix.acc is True else "")
+    draw.text((PADDING, y), legend, font=font, fill=FOREGROUND)
+    if len(valid) != 0:
+        legend = "Time to kill: {:.1f}s (green) to {:.1f}s (red)".format(valid.min(), valid.max())
+        draw.text((PADDING, y + get_text_size(font, "T")[1] + PADDING), legend, font=font, fill=FOREGROUND)
+    return image
+
+
+def render_ttk_curve(curve: TimeToKillCurve) -> Image.Image:
+    """
+    Render a TimeToKillCurve as a line plot of the time to kill against
+    the distance, with the weapon ranges and the fastest distance marked
+    """
+    font = ImageFont.load_default()
+    text_h = get_text_size(font, "T")[1]
+    (plot_w, plot_h), margin = PLOT, 6 * PADDING
+    image = Image.new("RGB", (plot_w + 2 * margin, plot_h + 2 * margin + 2 * text_h), BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    valid = np.isfinite(curve.time)
+    if not valid.any():
+        draw.text((margin, margin), "No time to kill within range", font=font, fill=FOREGROUND)
+        return image
+    x_max = float(curve.distances[-1]) or 1.0
+    y_max = float(curve.time[valid].max()) * 1.1
+
+    def to_pixels(distance: float, time: float) -> tuple:
+        return margin + distance / x_max * plot_w, margin + plot_h - time / y_max * plot_h
+
+    for i in range(5):
+        time = y_max * i / 4
+        _, y = to_pixels(0, time)
+        draw.line((margin, y, margin + plot_w, y), fill=GRID)
+        draw.text((PADDING, y - text_h // 2), "{:.1f}s".format(time), font=font, fill=FOREGROUND)
+    for label, distance in zip(("PB", "Mid", "Long"), curve.ranges):
+        x, _ = to_pixels(distance, 0)
+        draw.line((x, margin, x, margin + plot_h), fill=GRID)
+        text = "{} {:.0f}m".format(label, distance * 100)
+        draw.text((x - get_text_size(font, text)[0] // 2, margin + plot_h + PADDING), text, font=font, fill=FOREGROUND)
+    # Segments without a valid time to kill are left out
+    points = [to_pixels(d, t) if v else None for d, t, v in zip(curve.distances, curve.time, valid)]
+    for start, end in zip(points[:-1], points[1:]):
+        if start is not None and end is not None:
+            draw.line(start + end, fill=LINE, width=2)
+    best = int(np.nanargmin(curve.time))
+    x, y = to_pixels(curve.distances[best], curve.time[best])
+    draw.ellipse((x - 4, y - 4, x + 4, y + 4), fill=MARKER)
+    legend = "Fastest: {:.1f}s ({:.0f} shots) at {:.0f}m{}".format(
+        curve.time[best], curve.shots[best], curve.distances[best] * 100,
+        ", with evasion" if curve.acc is True else "")
+    draw.text((margin, margin + plot_h + 2 * PADDING + text_h), legend, font=font, fill=FOREGROUND)
+    return image
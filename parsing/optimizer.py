@@ -0,0 +1,296 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from collections import namedtuple
+from functools import reduce
+import heapq
+from itertools import product
+from multiprocessing import get_context, TimeoutError as PoolTimeoutError
+from operator import mul
+from time import time as now
+# Project Modules
+from data.components import COMPONENTS, COMP_TYPES_REVERSE
+from parsing.ships import Ship, Component
+from parsing.shipstats import ShipStats, FrozenShipStats
+from parsing.shipops import \
+    get_time_to_kill_array, WEAPON_STATS, TARGET_STATS, RANGES, DMG_MODS, \
+    BASE_DMG, SH_MOD, HULL_MOD, SH_PIERCING, SPS, CRIT_CHANCE, CRIT_MOD, ARMOR_PEN, \
+    SH_HEALTH, HULL_HEALTH, BLEED_THROUGH, DMG_REDUCTION
+from parsing.shipvectors import vectors
+from utils.utils import setup_logger
+# Packages
+import numpy as np
+
+
+logger = setup_logger("Optimizer", "optimizer.log")
+
+OPTIMIZE_BUDGET = 10.0  # Seconds
+OPTIMIZE_DISTANCE = 30.0  # Hundreds of metres, the default of build ttk
+OPTIMIZE_RESULTS = 5
+OPTIMIZE_BATCH = 256  # Candidates scored at once
+OPTIMIZE_WORKERS = 4
+TASKS_PER_WORKER = 4
+POOL_THRESHOLD = 1024  # Smaller search spaces are searched faster than the pool starts
+
+Metric = namedtuple("Metric", ("name", "category", "stats", "description"))
+Option = namedtuple("Option", ("index", "upgrades"))
+Candidate = namedtuple("Candidate", ("score", "build"))
+OptimizeResult = namedtuple("OptimizeResult", (
+    "candidates", "metric", "evaluated", "total", "searched", "complete", "elapsed"))
+
+# Direction of every statistic that can affect the metric: 1 if more is better
+WEAPON_DIRECTIONS = {stat: 1 for stat in RANGES + DMG_MODS + [
+    BASE_DMG, SH_MOD, HULL_MOD, SH_PIERCING, SPS, CRIT_CHANCE, CRIT_MOD, ARMOR_PEN]}
+SHIP_DIRECTIONS = {SH_HEALTH: 1, HULL_HEALTH: 1, BLEED_THROUGH: -1, DMG_REDUCTION: 1}
+
+METRICS = {
+    "ttk": Metric("ttk", "PrimaryWeapon", WEAPON_DIRECTIONS,
+                  "Lowest time to kill the target with the PrimaryWeapon"),
+    "survival": Metric("survival", "Ship", SHIP_DIRECTIONS,
+                       "Longest time for the PrimaryWeapon of the target to kill the build"),
+    "ehp": Metric("ehp", "Ship", SHIP_DIRECTIONS,
+                  "Highest effective health: hull corrected for damage reduction plus shields"),
+}
+
+
+def get_options(ship: Ship, category: str) -> list:
+    """
+    Return the fully upgraded component options in a category
+
+    Every tier of the talent tree is enabled, choosing one side of the
+    tiers that offer two.
+    """
+    options = list()
+    for index, component in enumerate(ship.data.get(category, ())):
+        for sides in product(*(range(len(row)) for row in component["TalentTree"])):
+            options.append(Option(index, tuple(enumerate(sides))))
+    return options
+
+
+def build_component(ship: Ship, category: str, option: Option) -> Component:
+    """Return a Component instance for an option"""
+    component = Component(ship.data[category][option.index], option.index, COMP_TYPES_REVERSE[category])
+    for upgrade in option.upgrades:
+        component.upgrades[upgrade] = True
+    return component
+
+
+def get_metric_vector(stats: ShipStats, metric: Metric) -> tuple:
+    """Return the statistics relevant to a metric, signed so more is better"""
+    values = stats[metric.category] if metric.category in stats else {}
+    return tuple(direction * values.get(stat, np.nan) for stat, direction in metric.stats.items())
+
+
+def prune_options(ship: Ship, category: str, options: list, metric: Metric) -> list:
+    """
+    Remove the options that are dominated for a metric
+
+    Every option is placed on the base ship on its own. An option is
+    dominated if another option is at least as good for every statistic
+    that affects the metric, in which case it can only lead to a worse
+    build, assuming the metric is monotonic in these statistics. Of a
+    set of equal options, only the first is kept. Options that the
+    statistics cannot be calculated for are removed.
+    """
+    metric_vectors = list()
+    for option in options:
+        candidate = Ship.deserialize(ship.serialize())
+        candidate[category] = build_component(ship, category, option)
+        try:
+            vector = np.array(get_metric_vector(ShipStats(candidate), metric))
+        except (KeyError, IndexError):  # Unsupported components, such as mines
+            continue
+        metric_vectors.append((option, np.nan_to_num(vector, nan=-np.inf)))
+    remaining = list()
+    for i, (option, vector) in enumerate(metric_vectors):
+        dominated = any(
+            np.all(other >= vector) and (np.any(other > vector) or j < i)
+            for j, (_, other) in enumerate(metric_vectors) if j != i)
+        if not dominated:
+            remaining.append(option)
+    return remaining
+
+
+def get_search_space(base: str, metric: Metric) -> (Ship, list, int):
+    """
+    Return the stock ship, the pruned options per category and the
+    size of the unpruned search space
+
+    :return: Ship, list of (category, options), total candidates
+    """
+    ship = Ship.stock(base)
+    space, total = list(), 1
+    for category in COMPONENTS:
+        if category not in ship.data:
+            continue
+        options = get_options(ship, category)
+        total *= len(options)
+        space.append((category, prune_options(ship, category, options, metric)))
+    return ship, space, total
+
+
+def get_target_stats(target: FrozenShipStats) -> dict:
+    """Return the statistics of the target used by the metrics as plain floats"""
+    weapon = target["PrimaryWeapon"] if "PrimaryWeapon" in target else {}
+    return {
+        "PrimaryWeapon": {stat: float(weapon.get(stat, np.nan)) for stat in WEAPON_STATS},
+        "Ship": {stat: float(target["Ship"].get(stat, np.nan)) for stat in TARGET_STATS},
+    }
+
+
+def score_candidates(candidates: np.ndarray, metric: str, target: dict, distance: float) -> np.ndarray:
+    """
+    Score a batch of candidates for a metric
+
+    :param candidates: Statistics matrices of the StatVectors
+    :return: Array of scores, lower is better, infinite if the metric
+        cannot be calculated for a candidate
+    """
+    if metric == "ttk":
+        source = vectors.get_stat_arrays(candidates, "PrimaryWeapon", WEAPON_STATS)
+        _, score = get_time_to_kill_array(source, target["Ship"], np.float64(distance))
+    elif metric == "survival":
+        ships = vectors.get_stat_arrays(candidates, "Ship", TARGET_STATS)
+        _, score = get_time_to_kill_array(target["PrimaryWeapon"], ships, np.float64(distance))
+        score = -score
+    else:
+        ships = vectors.get_stat_arrays(candidates, "Ship", TARGET_STATS)
+        score = -(ships[HULL_HEALTH] / (1 - ships[DMG_REDUCTION]) + ships[SH_HEALTH])
+    return np.where(np.isnan(score), np.inf, score)
+
+
+def search(ship_name: str, space: list, prefix: tuple, metric: str, target: dict,
+           distance: float, k: int, deadline: float) -> (list, int, bool):
+    """
+    Search all builds that start with the given options, depth-first
+
+    The statistics matrices of the components that candidates share
+    are only calculated once, and the complete candidates are scored in
+    batches. Runs in a worker process of the optimizer.
+
+    :param space: List of (category, options) for all categories
+    :param prefix: Options chosen for the first categories
+    :param deadline: Time at which the search is abandoned
+    :return: top-k (score, choices), candidates evaluated, completed
+    """
+    ship = Ship(ship_name)
+    best, batch, evaluated = list(), list(), 0
+    # Compile all options first, so the matrices of all candidates have the same columns
+    components = dict()
+    for depth, (category, options) in enumerate(space):
+        for i, option in enumerate(options):
+            try:
+                vectors.compile_component(ship_name, category, option.index)
+            except (KeyError, IndexError):
+                continue
+            components[(depth, i)] = build_component(ship, category, option)
+    for stat in WEAPON_STATS + TARGET_STATS:
+        vectors.column(stat)
+
+    def flush():
+        nonlocal evaluated
+        scores = score_candidates(np.stack([values for values, _ in batch]), metric, target, distance)
+        for score, (_, choices) in zip(scores, batch):
+            if np.isfinite(score):
+                # Negated so the heap keeps the k lowest scores
+                item = (-float(score), choices)
+                (heapq.heappush if len(best) < k else heapq.heappushpop)(best, item)
+        evaluated += len(batch)
+        batch.clear()
+
+    def recurse(values: np.ndarray, depth: int, choices: tuple) -> bool:
+        indices = (prefix[depth],) if depth < len(prefix) else range(len(space[depth][1]))
+        indices = [i for i in indices if (depth, i) in components]
+        # The options of a category are added to the statistics of their parent as a batch
+        children = vectors.add_components(values, ship_name, [components[(depth, i)] for i in indices])
+        for i, child in zip(indices, children):
+            if depth < len(space) - 1:
+                if recurse(child, depth + 1, choices + (i,)) is False:
+                    return False
+                continue
+            # The compound statistics are not required, none of the metrics use them
+            batch.append((child, choices + (i,)))
+            if len(batch) >= OPTIMIZE_BATCH:
+                flush()
+                if now() >= deadline:
+                    return False
+        return True
+
+    complete = recurse(vectors.compile_hull(ship_name), 0, ())
+    if len(batch) != 0:
+        flush()
+    return sorted((-score, choices) for score, choices in best), evaluated, complete
+
+
+def get_prefixes(space: list, tasks: int) -> list:
+    """Split the search space into at least the given number of tasks"""
+    depth, count = 0, 1
+    while depth < len(space) and count < tasks:
+        count *= len(space[depth][1])
+        depth += 1
+    return list(product(*(range(len(options)) for _, options in space[:depth])))
+
+
+def optimize(base: str, target: FrozenShipStats, metric: str, distance: float = OPTIMIZE_DISTANCE,
+             k: int = OPTIMIZE_RESULTS, budget: float = OPTIMIZE_BUDGET,
+             workers: int = OPTIMIZE_WORKERS) -> (OptimizeResult, None):
+    """
+    Search the fully upgraded builds of a base ship for the best builds
+    for a metric against a target
+
+    The options that are dominated in their category are pruned first,
+    after which the remaining builds are searched by a pool of worker
+    processes. The search stops when the time budget runs out, so the
+    result may be incomplete.
+
+    :param base: Base ship identifier (r1s, i2b, etc.)
+    :param target: Statistics of the target build
+    :param metric: Key of METRICS
+    :param workers: Number of worker processes, zero to search in
+        the calling process. Small search spaces are always searched
+        in the calling process.
+    :return: OptimizeResult, None if the base is invalid
+    """
+    start = now()
+    deadline = start + budget
+    if Ship.from_base(base) is None:
+        return None
+    ship, space, total = get_search_space(base, METRICS[metric])
+    searched = reduce(mul, (len(options) for _, options in space), 1)
+    target = get_target_stats(target)
+    prefixes = get_prefixes(space, workers * TASKS_PER_WORKER)
+    args = (ship.ship_name, space)
+    kwargs = {"metric": metric, "target": target, "distance": distance, "k": k, "deadline": deadline}
+    results = list()
+    if workers == 0 or searched < POOL_THRESHOLD:
+        for prefix in prefixes:
+            if now() >= deadline:
+                break
+            results.append(search(*args, prefix, **kwargs))
+    else:
+        # Workers are spawned rather than forked, as the bot runs threads
+        # The pool is terminated at the end of the with-clause, so tasks
+        # that are still queued or running at the deadline are stopped
+        with get_context("spawn").Pool(workers) as pool:
+            tasks = [pool.apply_async(search, args + (prefix,), kwargs) for prefix in prefixes]
+            for task in tasks:
+                try:
+                    results.append(task.get(timeout=max(deadline - now(), 0) + 1.0))
+                except PoolTimeoutError:
+                    break
+    complete = len(results) == len(prefixes) and all(done for _, _, done in results)
+    best = heapq.nsmallest(k, (item for found, _, _ in results for item in found))
+    candidates = list()
+    for score, choices in best:
+        candidate = Ship(ship.ship_name)
+        for (category, options), i in zip(space, choices):
+            candidate[category] = build_component(candidate, category, options[i])
+        candidates.append(Candidate(abs(score), candidate))
+    evaluated = sum(count for _, count, _ in results)
+    elapsed = now() - start
+    logger.info("Optimized {} for {}: {} of {} candidates in {:.1f}s.".format(
+        base, metric, evaluated, searched, elapsed))
+    return OptimizeResult(candidates, metric, evaluated, total, searched, complete, elapsed)
@@ -0,0 +1,127 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from bisect import bisect_left
+from threading import Lock
+# Project Modules
+from data import abilities
+from data.actives import ACTIVES
+from data.components import COMP_SHORT_HAND, COMP_TYPES_REVERSE, SHIP_KEY_TO_SH
+from parsing.assets import assets
+
+
+class PrefixIndex(object):
+    """
+    Sorted array of the identifiers of a sequence of items
+
+    Every item may have multiple identifiers. Finding a prefix returns
+    the position of the first item in the sequence that has an
+    identifier starting with that prefix, which is the item a linear
+    scan of the sequence would find.
+    """
+
+    def __init__(self, identifiers: list):
+        """
+        :param identifiers: Tuple of identifiers for every item
+        """
+        entries = sorted((identifier, i) for i, strings in enumerate(identifiers) for identifier in strings)
+        self.keys = [identifier for identifier, _ in entries]
+        self.positions = [i for _, i in entries]
+
+    def find(self, prefix: str) -> (int, None):
+        """Return the position of the first item with the prefix"""
+        start, position = bisect_left(self.keys, prefix), None
+        for i in range(start, len(self.keys)):
+            if not self.keys[i].startswith(prefix):
+                break
+            if position is None or self.positions[i] < position:
+                position = self.positions[i]
+        return position
+
+
+class ComponentIndex(object):
+    """Index of the identifiers of the components in a category of abilities"""
+
+    def __init__(self, components: dict):
+        """
+        :param components: Dictionary of short hand: component name
+        """
+        self.exact = dict(components)
+        self.names = list(components.values())
+        self.prefixes = PrefixIndex([(key, value.lower()) for key, value in components.items()])
+        self.initials = dict()
+        for name in self.names:
+            self.initials.setdefault(str().join(word[0].lower() for word in name.split(" ")), name)
+
+    def identify(self, shorthand: str) -> (str, None):
+        """Return the component name for a lower case identifier"""
+        if shorthand in self.exact:
+            return self.exact[shorthand]
+        position = self.prefixes.find(shorthand)
+        if position is not None:
+            return self.names[position]
+        return self.initials.get(shorthand)
+
+
+COMPONENT_INDEXES = {
+    category: ComponentIndex(getattr(abilities, category))
+    for category in set(key.replace("2", str()) for key in COMP_TYPES_REVERSE.values())}
+CATEGORY_NAMES = list(COMP_SHORT_HAND.values())
+CATEGORY_INDEX = PrefixIndex([(name.lower(),) for name in CATEGORY_NAMES])
+
+ACTIVE_KEYS = list(ACTIVES.keys())
+ACTIVE_INDEX = PrefixIndex([(key,) for key in ACTIVE_KEYS])
+ACTIVE_INITIALS = dict()
+for i, key in enumerate(ACTIVE_KEYS):
+    ACTIVE_INITIALS.setdefault("".join(l for l in key if l.isupper()).lower(), i)
+
+
+class CrewIndex(object):
+    """Index of the crew member names, built when first used"""
+
+    def __init__(self):
+        self._names, self._index = None, None
+        self._lock = Lock()
+
+    def find(self, name: str) -> (str, None):
+        """Return the first crew member name starting with a lower case name"""
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._names = list(assets.crew.keys())
+                    self._index = PrefixIndex([(member.lower(),) for member in self._names])
+        position = self._index.find(name)
+        return self._names[position] if position is not None else None
+
+
+crew_index = CrewIndex()
+
+
+def resolve_component(category: str, shorthand: str) -> (str, None):
+    """Return the component name for a category key and lower case identifier"""
+    index = COMPONENT_INDEXES.get(category)
+    if index is None:
+        raise AttributeError("Invalid component category: {}".format(category))
+    return index.identify(shorthand)
+
+
+def resolve_category(category: str) -> (str, None):
+    """Return the FQN category for a category identifier"""
+    if category in COMP_SHORT_HAND:
+        return COMP_SHORT_HAND[category]
+    if category in SHIP_KEY_TO_SH:
+        return COMP_SHORT_HAND[SHIP_KEY_TO_SH[category]]
+    position = CATEGORY_INDEX.find(category.lower())
+    return CATEGORY_NAMES[position] if position is not None else None
+
+
+def resolve_active(active: str) -> (str, None):
+    """
+    Return the ACTIVES key for an active identifier, which is the first
+    key that starts with it or has matching initials
+    """
+    positions = [p for p in (ACTIVE_INDEX.find(active), ACTIVE_INITIALS.get(active.lower())) if p is not None]
+    return ACTIVE_KEYS[min(positions)] if len(positions) != 0 else None
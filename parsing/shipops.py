@@ -9,8 +9,11 @@ from collections import namedtuple
 from math import ceil, floor
 # Project Modules
 from parsing.ships import Ship
-from parsing.shipstats import ShipStats
+from parsing.shipstats import FrozenShipStats, get_ship_stats
+from parsing.shipvectors import vectors
 from utils.utils import setup_logger
+# Packages
+import numpy as np
 
 RANGES = ["Weapon_Range_Point_Blank", "Weapon_Range_Mid", "Weapon_Range_Long"]
 DMG_MODS = ["pbRangeDamMulti", "midRangeDamMulti", "longRangeDamMulti"]
@@ -20,11 +23,29 @@ SH_PIERCING = "Weapon_Shield_Piercing"
 SPS = "Weapon_Rate_of_Fire"
 CRIT_CHANCE, CRIT_MOD = "Crit_Chance", "Crit_Damage_Multiplier"
 SH_HEALTH, HULL_HEALTH = "Shields_Max_Power_(Capacity)", "Max_Health"
+ARMOR_PEN, BLEED_THROUGH = "Weapon_Armor_Penetration", "Shield_Bleed_Through"
+DMG_REDUCTION, EVASION = "Ship_Damage_Reduction", "Ship_Evasion"
+BASE_DMG, BASE_ACC = "Weapon_Base_Damage", "Weapon_Base_Accuracy"
+
+# Statistics required for the TTK calculations of the source weapon and target ship
+WEAPON_STATS = RANGES + DMG_MODS + ACC_MODS + [
+    BASE_DMG, BASE_ACC, SH_MOD, HULL_MOD, SH_PIERCING, SPS, CRIT_CHANCE, CRIT_MOD, ARMOR_PEN]
+TARGET_STATS = [SH_HEALTH, HULL_HEALTH, BLEED_THROUGH, DMG_REDUCTION, EVASION]
 
 
 logger = setup_logger("shipops", "ships.log")
 
 TimeToKill = namedtuple("TimeToKill", ("shots", "time", "distance", "weapon", "actives", "args"))
+TimeToKillMatrix = namedtuple("TimeToKillMatrix", ("shots", "time", "distance", "weapon", "acc"))
+TimeToKillCurve = namedtuple("TimeToKillCurve", ("shots", "time", "distances", "ranges", "weapon", "actives", "acc"))
+
+TimeToKillDistribution = namedtuple("TimeToKillDistribution", (
+    "shots", "time", "median", "p10", "p90", "distance", "weapon", "actives", "acc"))
+
+CURVE_POINTS = 121
+SIMULATION_ENGAGEMENTS = 20000
+SIMULATION_CHUNK = 32  # Number of shots sampled at once for every engagement
+SIMULATION_MAX_SHOTS = 2048
 
 
 class InfiniteShots(ValueError):
@@ -89,11 +110,11 @@ def get_time_to_kill(source: Ship, target: Ship, distance: float,
                      source_act: list, target_act: list, key="PrimaryWeapon", hit=1.0
                      ) -> (TimeToKill, None):
     """Calculate the time to kill of one ship against another"""
-    actives = dict()
-    if not isinstance(source, ShipStats) and not isinstance(target, ShipStats):  # acc optimization
-        source, target = ShipStats(source), ShipStats(target)
-        actives["source"] = source.apply_actives(source_act)
-        actives["target"] = target.apply_actives(target_act)
+    if not isinstance(source, FrozenShipStats):
+        source = get_ship_stats(source, source_act)
+    if not isinstance(target, FrozenShipStats):
+        target = get_ship_stats(target, target_act)
+    actives = {"source": list(source.actives), "target": list(target.actives)}
     # Get the base statistics
     if key not in source:
         return None
@@ -118,10 +139,10 @@ def get_time_to_kill_acc(
         source: Ship, target: Ship, distance: float, source_act: list, target_act: list,
         key="PrimaryWeapon") -> (TimeToKill, None):
     """Calculate the time to kill with evasion/accuracy correction"""
-    source, target = map(ShipStats, (source, target))
-    actives = dict()
-    actives["source"] = source.apply_actives(source_act)
-    actives["target"] = source.apply_actives(target_act)
+    if not isinstance(source, FrozenShipStats):
+        source = get_ship_stats(source, source_act)
+    if not isinstance(target, FrozenShipStats):
+        target = get_ship_stats(target, target_act)
     evs = target["Ship"]["Ship_Evasion"]
     acc = get_range_adjusted_acc(source[key], distance)
     hit = min(acc - evs, 1)
@@ -195,3 +216,239 @@ def get_time_to_kill_stats(hull_d_reg, hull_d_crit, sh_d_reg, sh_d_crit, sps,
     average_ttk = average_shots / sps
     # end
     return average_ttk, average_shots
+
+
+# Vectorized versions of the TTK calculations. The statistics are given
+# as dictionaries of arrays rather than of numbers, so that the TTK of
+# many sources, targets and distances is calculated at once through
+# broadcasting. Scenarios that raise InfiniteShots or ZeroDivisionError
+# in the scalar functions are NaN in the results instead.
+
+
+def get_stat_arrays(snapshots: list, category: str, keys: list, shape: tuple = (-1,)) -> dict:
+    """
+    Return a dictionary of statistic: array of its value per snapshot
+
+    :param snapshots: ShipStats instances or snapshots, or None
+    :param category: Category to take the statistics from
+    :param keys: Statistics to include
+    :param shape: Shape of the arrays, for broadcasting
+    :return: Arrays of floats, NaN if the statistic is not available
+    """
+    stats = [snapshot[category] if snapshot is not None and category in snapshot else {}
+             for snapshot in snapshots]
+    return {key: np.array([s.get(key, np.nan) for s in stats], dtype=np.float64).reshape(shape) for key in keys}
+
+
+def get_batch_arrays(builds: list, category: str, keys: list, shape: tuple = (-1,)) -> dict:
+    """Return get_stat_arrays for a list of Ships, or of their statistics"""
+    if all(build is None or isinstance(build, Ship) for build in builds):
+        return vectors.get_stat_arrays(vectors.compile_batch(builds), category, keys, shape)
+    return get_stat_arrays(builds, category, keys, shape)
+
+
+def linear_array(point1: tuple, point2: tuple, x: np.ndarray) -> np.ndarray:
+    """Vectorized linear, with points of arrays"""
+    (x1, y1), (x2, y2) = point1, point2
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return y1 + (x - x1) * ((y2 - y1) / (x2 - x1))
+
+
+def interpolate_range_array(stats: dict, values: tuple, distance: np.ndarray) -> np.ndarray:
+    """Return the values at the range points interpolated to the distance"""
+    ranges = tuple(stats[key] for key in RANGES)
+    point1, point2, point3 = tuple(zip(ranges, values))
+    pb, mid, long = ranges
+    return np.select(
+        [distance <= pb, distance <= mid, distance <= long],
+        [values[0], linear_array(point1, point2, distance), linear_array(point2, point3, distance)],
+        np.nan)
+
+
+def get_range_adjusted_dmg_array(stats: dict, distance: np.ndarray) -> tuple:
+    """Vectorized get_range_adjusted_dmg, NaN beyond long range"""
+    base_dmg = stats[BASE_DMG]
+    range_dmgs = tuple(base_dmg * stats[key] for key in DMG_MODS)
+    base_dmg = interpolate_range_array(stats, range_dmgs, distance)
+    return base_dmg * stats[HULL_MOD], base_dmg * stats[SH_MOD]
+
+
+def get_range_adjusted_acc_array(stats: dict, distance: np.ndarray) -> np.ndarray:
+    """Vectorized get_range_adjusted_acc, NaN beyond long range"""
+    base_acc = stats[BASE_ACC]
+    range_accs = tuple(base_acc + stats[key] for key in ACC_MODS)
+    return interpolate_range_array(stats, range_accs, distance)
+
+
+def get_crit_adjusted_damage_array(stats: dict, hull_dmg: np.ndarray, sh_dmg: np.ndarray) -> tuple:
+    """Vectorized get_crit_adjusted_damage"""
+    chance, mod = stats[CRIT_CHANCE], stats[CRIT_MOD]
+    mod = np.where(mod < 1.0, mod + 1.0, mod)
+    return mod * hull_dmg, mod * sh_dmg, chance
+
+
+def get_time_to_kill_stats_array(hull_d_reg, hull_d_crit, sh_d_reg, sh_d_crit, sps,
+                                 crit_chance, sh_piercing, target_hull, target_shields) -> tuple:
+    """
+    Vectorized get_time_to_kill_stats
+
+    The scenarios in which get_time_to_kill_stats raises an exception
+    are NaN in the results.
+    """
+    avg_h = hull_d_reg * (1 - crit_chance) + hull_d_crit * crit_chance
+    avg_s = sh_d_reg * (1 - crit_chance) + sh_d_crit * crit_chance
+    with np.errstate(divide="ignore", invalid="ignore"):
+        avg_s_through = avg_s * (1 - sh_piercing)
+        shield_shots = np.floor(target_shields / avg_s_through)
+        pierced = shield_shots * sh_piercing * avg_h >= target_hull
+        shield_shot = np.where(pierced, np.ceil(target_hull / (avg_h * sh_piercing)), shield_shots)
+        hull_shot = np.where(pierced, 0.0, np.ceil(
+            target_hull - shield_shots * sh_piercing * avg_h -
+            (1 - (target_shields - shield_shot * avg_s * (1 - sh_piercing)) / avg_s)) / avg_h)
+        border_shot = np.where(
+            ~pierced & (1 - (target_shields - shield_shot * avg_s * (1 - sh_piercing)) / hull_shot > 0), 1.0, 0.0)
+        average_shots = shield_shot + border_shot + hull_shot
+        average_ttk = average_shots / sps
+    invalid = (avg_h == 0) | (avg_s_through == 0) | (sps == 0) | \
+        (pierced & (sh_piercing == 0)) | (~pierced & (hull_shot == 0)) | ~np.isfinite(average_ttk)
+    return np.where(invalid, np.nan, average_ttk), np.where(invalid, np.nan, average_shots)
+
+
+def get_time_to_kill_array(source: dict, target: dict, distance: np.ndarray, acc: bool = False) -> tuple:
+    """
+    Vectorized get_time_to_kill and get_time_to_kill_acc
+
+    :param source: WEAPON_STATS arrays of the source weapons
+    :param target: TARGET_STATS arrays of the target ships
+    :param distance: Distance array [hundreds of metres]
+    :param acc: Whether to correct for accuracy and evasion
+    :return: Arrays of the number of shots and the time to kill
+    """
+    hit = 1.0
+    if acc is True:
+        hit = np.minimum(get_range_adjusted_acc_array(source, distance) - target[EVASION], 1)
+        hit = np.where(hit > 0, hit, np.nan)
+    hull_d_reg, sh_d_reg = get_range_adjusted_dmg_array(source, distance)
+    hull_d_crit, sh_d_crit, crit_chance = get_crit_adjusted_damage_array(source, hull_d_reg, sh_d_reg)
+    target_hull, target_shields = target[HULL_HEALTH] / hit, target[SH_HEALTH] / 2 / hit
+    bleedthrough, sh_piercing = target[BLEED_THROUGH], source[SH_PIERCING]
+    sh_piercing = bleedthrough + sh_piercing - bleedthrough * sh_piercing
+    target_hull = np.where(source[ARMOR_PEN] == 0.0, target_hull / (1 - target[DMG_REDUCTION]), target_hull)
+    avg_ttk, avg_shots = get_time_to_kill_stats_array(
+        hull_d_reg, hull_d_crit, sh_d_reg, sh_d_crit, source[SPS], crit_chance, sh_piercing,
+        target_hull, target_shields)
+    return np.ceil(avg_shots), avg_ttk
+
+
+def get_time_to_kill_matrix(sources: list, targets: list, distance: float,
+                            key="PrimaryWeapon", acc=False) -> TimeToKillMatrix:
+    """
+    Calculate the time to kill of every source against every target
+
+    Builds are given as Ship instances, of which the statistics are
+    calculated as a batch by the StatVectors, or as the ShipStats
+    instances or snapshots of the builds.
+
+    :param sources: N Ships or statistics of the sources
+    :param targets: M Ships or statistics of the targets
+    :return: TimeToKillMatrix with N x M arrays, NaN where the time to
+        kill cannot be calculated or the source lacks the weapon
+    """
+    source = get_batch_arrays(sources, key, WEAPON_STATS, (-1, 1))
+    target = get_batch_arrays(targets, "Ship", TARGET_STATS, (1, -1))
+    shots, time = get_time_to_kill_array(source, target, np.float64(distance), acc)
+    return TimeToKillMatrix(shots, time, distance, key, acc)
+
+
+def get_time_to_kill_curve(source: Ship, target: Ship, source_act: list, target_act: list,
+                           key="PrimaryWeapon", acc=False, distances: np.ndarray = None) -> (TimeToKillCurve, None):
+    """
+    Calculate the time to kill of one ship against another over a range
+    of distances
+
+    :param distances: Distances to calculate the TTK for, from zero to
+        the long range of the weapon by default
+    :return: TimeToKillCurve, None if the source does not have the weapon
+    """
+    if not isinstance(source, FrozenShipStats):
+        source = get_ship_stats(source, source_act)
+    if not isinstance(target, FrozenShipStats):
+        target = get_ship_stats(target, target_act)
+    if key not in source:
+        return None
+    ranges = tuple(source[key][stat] for stat in RANGES)
+    if distances is None:
+        distances = np.linspace(0.0, ranges[-1], CURVE_POINTS)
+    shots, time = get_time_to_kill_array(
+        get_stat_arrays([source], key, WEAPON_STATS), get_stat_arrays([target], "Ship", TARGET_STATS),
+        np.asarray(distances, dtype=np.float64), acc)
+    actives = {"source": list(source.actives), "target": list(target.actives)}
+    return TimeToKillCurve(shots, time, distances, ranges, source.ship[key].name, actives, acc)
+
+
+def simulate_time_to_kill(source: Ship, target: Ship, distance: float, source_act: list, target_act: list,
+                          key="PrimaryWeapon", acc=False, engagements=SIMULATION_ENGAGEMENTS,
+                          seed: int = None) -> (TimeToKillDistribution, None):
+    """
+    Simulate the time to kill of one ship against another
+
+    Instead of the expected damage per shot, every shot of every
+    engagement is sampled to hit or miss (from accuracy minus evasion,
+    if acc is True) and to be a critical hit or not. While the shields
+    are up, they absorb the part of the damage that does not pierce
+    them, as in get_time_to_kill_stats. The shots are sampled in chunks for all engagements at once.
+
+    :return: TimeToKillDistribution with the shots and time of every
+        engagement, None if the source does not have the weapon
+    """
+    if not isinstance(source, FrozenShipStats):
+        source = get_ship_stats(source, source_act)
+    if not isinstance(target, FrozenShipStats):
+        target = get_ship_stats(target, target_act)
+    if key not in source:
+        return None
+    weapon = get_stat_arrays([source], key, WEAPON_STATS, ())
+    ship = get_stat_arrays([target], "Ship", TARGET_STATS, ())
+    hull_d_reg, sh_d_reg = get_range_adjusted_dmg_array(weapon, np.float64(distance))
+    hull_d_crit, sh_d_crit, crit_chance = get_crit_adjusted_damage_array(weapon, hull_d_reg, sh_d_reg)
+    hit = 1.0
+    if acc is True:
+        hit = min(get_range_adjusted_acc_array(weapon, np.float64(distance)) - ship[EVASION], 1)
+    if np.isnan(hull_d_reg) or not hit > 0:
+        raise InfiniteShots()
+    bleedthrough, sh_piercing = ship[BLEED_THROUGH], weapon[SH_PIERCING]
+    sh_piercing = bleedthrough + sh_piercing - bleedthrough * sh_piercing
+    if hull_d_reg == 0 or sh_d_reg * (1 - sh_piercing) == 0:
+        raise ZeroDivisionError
+    hull = ship[HULL_HEALTH]
+    if weapon[ARMOR_PEN] == 0.0:
+        hull /= 1 - ship[DMG_REDUCTION]
+    rng = np.random.default_rng(seed)
+    shields, hull = np.full(engagements, ship[SH_HEALTH] / 2), np.full(engagements, hull)
+    shots = np.zeros(engagements, dtype=np.int64)
+    alive = np.arange(engagements)
+    while len(alive) != 0:
+        if shots[alive[0]] >= SIMULATION_MAX_SHOTS:
+            raise InfiniteShots()
+        size = (len(alive), SIMULATION_CHUNK)
+        hits = rng.random(size) < hit
+        crits = rng.random(size) < crit_chance
+        sh_dmg = np.where(crits, sh_d_crit, sh_d_reg) * hits
+        hull_dmg = np.where(crits, hull_d_crit, hull_d_reg) * hits
+        absorbed = sh_dmg * (1 - sh_piercing)
+        shields_left = shields[alive, np.newaxis] - np.cumsum(absorbed, axis=1)
+        shields_before = np.hstack((shields[alive, np.newaxis], shields_left[:, :-1]))
+        # Fraction of every shot absorbed by the shields, the rest hits the hull
+        absorbed = np.clip(np.divide(
+            shields_before, absorbed, out=np.ones(size), where=absorbed > 0), 0, 1)
+        hull_left = hull[alive, np.newaxis] - np.cumsum(
+            hull_dmg * (absorbed * sh_piercing + 1 - absorbed), axis=1)
+        dead = hull_left <= 0
+        killed = dead.any(axis=1)
+        shots[alive] += np.where(killed, np.argmax(dead, axis=1) + 1, SIMULATION_CHUNK)
+        shields[alive], hull[alive] = shields_left[:, -1], hull_left[:, -1]
+        alive = alive[~killed]
+    time = shots / weapon[SPS]
+    p10, median, p90 = np.percentile(time, (10, 50, 90))
+    actives = {"source": list(source.actives), "target": list(target.actives)}
+    return TimeToKillDistribution(shots, time, median, p10, p90, distance, source.ship[key].name, actives, acc)
@@ -5,27 +5,61 @@ License: GNU GPLv3 as in LICENSE
 Copyright (C) 2016-2018 RedFantom
 """
 # Standard Library
-from os import path
-import pickle as pickle
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from collections.abc import MutableMapping
+from functools import lru_cache
 import random
+from struct import Struct, error as StructError
 # Project Modules
 from data import abilities
 from data.components import *
 from data.ships import ship_names, ships_names_reverse, ship_tier_factions
-from utils.utils import get_assets_directory, setup_logger
+from parsing.assets import assets
+from parsing.resolver import crew_index, resolve_category, resolve_component
+from utils.utils import setup_logger
 
 
 logger = setup_logger("Ship", "ship.log")
 
+# Compact build encoding: ship index, then per component category the
+# component index (plus one, zero if not set) and the upgrade bitmask,
+# then per crew role the crew member index (plus one, zero if not set).
+# The components are in COMPONENTS order, the ships and crew members
+# sorted by name, so the order never depends on the order of a dict.
+ENCODING_PREFIX = "~1"
+CREW_ROLES = ("Engineering", "Offensive", "Tactical", "Defensive", "CoPilot")
+UPGRADE_BITS = tuple((level, side) for level in range(5) for side in range(2))
+UPGRADE_MASKS = {upgrade: 1 << i for i, upgrade in enumerate(UPGRADE_BITS)}
+DEFAULT_UPGRADES = ((0, 0), (1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (4, 0), (4, 1))
+COMPONENT_KEYS_ORDERED = tuple(COMP_TYPES_REVERSE[category] for category in COMPONENTS)
+COMPONENT_SLOTS = {key: i for i, key in enumerate(COMPONENT_KEYS_ORDERED)}
+CREW_SLOTS = {role: i for i, role in enumerate(CREW_ROLES)}
+# Upgrade string letter of every upgrade per component type
+UPGRADE_STRINGS = {
+    kind: tuple((UPGRADE_MASKS[(level, side)], str(level + 1) if (
+        kind == "major" and level < 3) or (kind == "middle" and level < 2) or kind == "minor"
+        else "LR"[side]) for level, side in upgrades)
+    for kind, upgrades in abilities.upgrades.items()}
+ENCODING = Struct(">B{0}B{0}H{1}B".format(len(COMPONENT_TYPES), len(CREW_ROLES)))
+
+
+@lru_cache()
+def get_encoding_tables() -> (list, dict, list, dict):
+    """Return the ship FQNs and crew names and their indexes for the build encoding"""
+    ships, crew = sorted(assets.ship_index), sorted(assets.crew_index)
+    return ships, {fqn: i for i, fqn in enumerate(ships)}, crew, {name: i for i, name in enumerate(crew)}
+
+
+assets.add_listener(get_encoding_tables.cache_clear)
+
 
 def get_ship_category(ship_name: str):
     """Return the ship category for a given ship name"""
-    with open(path.join(get_assets_directory(), "categories.db"), "rb") as fi:
-        categories = pickle.load(fi)
     ship_name = ship_name if ship_name not in ship_names else ship_names[ship_name]
     faction = ship_name.split("_")[0]
     ship_name = ship_name.replace("Imperial_", "").replace("Republic_", "")
-    categories = categories[faction]
+    categories = assets.ship_categories(faction)
     for category in categories:
         ships = categories[category]["Ships"]
         for ship in ships:
@@ -35,9 +69,66 @@ def get_ship_category(ship_name: str):
 
 
 def load_ship_data()->dict:
-    with open(path.join(get_assets_directory(), "ships.db"), "rb") as f:
-        ships_data = pickle.load(f)
-    return ships_data
+    """Return the shared (read-only) mapping of ship FQN: ship data"""
+    return assets.ships
+
+
+class ComponentSlots(MutableMapping):
+    """Dictionary interface to the components of a Ship by category key"""
+
+    __slots__ = ("_slots",)
+
+    def __init__(self, slots: list):
+        self._slots = slots
+
+    def __getitem__(self, key: str):
+        return self._slots[COMPONENT_SLOTS[key]]
+
+    def __setitem__(self, key: str, component):
+        self._slots[COMPONENT_SLOTS[key]] = component
+
+    def __delitem__(self, key: str):
+        raise TypeError("Component categories cannot be removed")
+
+    def __contains__(self, key):
+        return key in COMPONENT_SLOTS
+
+    def __iter__(self):
+        return iter(COMPONENT_KEYS_ORDERED)
+
+    def __len__(self):
+        return len(COMPONENT_SLOTS)
+
+
+class CrewSlots(MutableMapping):
+    """Dictionary interface of role: (faction, role, name) to the crew indexes of a Ship"""
+
+    __slots__ = ("_ship",)
+
+    def __init__(self, ship):
+        self._ship = ship
+
+    def __getitem__(self, role: str):
+        index = self._ship._crew[CREW_SLOTS[role]]
+        if index == 0:
+            return None
+        return self._ship.faction, role, get_encoding_tables()[2][index - 1]
+
+    def __setitem__(self, role: str, member: (tuple, None)):
+        index = CREW_SLOTS[role]
+        self._ship._crew[index] = 0 if member is None else get_encoding_tables()[3][member[2]] + 1
+
+    def __delitem__(self, role: str):
+        raise TypeError("Crew roles cannot be removed")
+
+    def __contains__(self, role):
+        return role in CREW_SLOTS
+
+    def __iter__(self):
+        return iter(CREW_ROLES)
+
+    def __len__(self):
+        return len(CREW_ROLES)
 
 
 class Ship(object):
@@ -46,10 +137,17 @@ class Ship(object):
     for and operations on GSF Ships. For every Ship, the components and
     selected crew members are selected.
 
+    The components are kept in a list in COMPONENT_KEYS_ORDERED order
+    and the crew as indexes of the build encoding (plus one, zero if
+    not set).
+    The components and crew attributes offer dictionary interfaces.
+
     :attribute name: Simple ship name
     :attribute ship_name: Fully-Qualified Ship name
     """
 
+    __slots__ = ("ship_name", "faction", "name", "_components", "_crew")
+
     def __init__(self, ship_name: str):
         """
         :param ship_name: FQ or Simple ship name
@@ -60,29 +158,26 @@ class Ship(object):
         self.faction = self.ship_name.split("_")[0]
         self.name = ship_name if ship_name in ship_names else ships_names_reverse[self.ship_name]
         # Initialize attributes
-        self.data = ships_data[self.ship_name]
-        self.components = {
-            "primary": None,
-            "primary2": None,
-            "secondary": None,
-            "secondary2": None,
-            "engine": None,
-            "shields": None,
-            "systems": None,
-            "armor": None,
-            "reactor": None,
-            "magazine": None,
-            "sensors": None,
-            "thrusters": None,
-            "capacitor": None
-        }
-        self.crew = {
-            "Engineering": None,
-            "Offensive": None,
-            "Tactical": None,
-            "Defensive": None,
-            "CoPilot": None
-        }
+        self._components = [None] * len(COMPONENT_SLOTS)
+        self._crew = [0] * len(CREW_SLOTS)
+
+    @property
+    def data(self):
+        """Shared ship data record"""
+        return load_ship_data()[self.ship_name]
+
+    @property
+    def components(self) -> ComponentSlots:
+        return ComponentSlots(self._components)
+
+    @property
+    def crew(self) -> CrewSlots:
+        return CrewSlots(self)
+
+    @crew.setter
+    def crew(self, crew: dict):
+        for role in CREW_ROLES:
+            self.crew[role] = crew.get(role)
 
     def update_element(self, element: str, ships_data: (dict, None))->str:
         """
@@ -137,7 +232,7 @@ class Ship(object):
         if i == -1:
             return "Invalid component '{}' for ship '{}'".format(name, self.name)
         component = Component(data[self.ship_name][fqn_category][i], i, category)
-        component.upgrades.update(Ship.parse_upgrade_string(upgrades))
+        component.mask |= Ship.parse_upgrade_mask(upgrades)
         self[category] = component
         upgrades = "out any upgrades" if upgrades == "" else " upgrades {}".format(upgrades)
         return "{} now set to {} with{}.".format(
@@ -150,9 +245,9 @@ class Ship(object):
         :param value: Component instance or Crew member name
         """
         item = self.process_key(item)
-        if item in self.components:
-            self.components[item] = value
-        elif item in self.crew:
+        if item in COMPONENT_SLOTS:
+            self._components[COMPONENT_SLOTS[item]] = value
+        elif item in CREW_SLOTS:
             self.crew[item] = value
         else:
             raise ValueError("Invalid key for Ship: '{}'".format(item))
@@ -160,9 +255,9 @@ class Ship(object):
     def __getitem__(self, item):
         """Returns a Component instance or Crew member name"""
         item = self.process_key(item)
-        if item in self.components:
-            return self.components[item]
-        elif item in self.crew:
+        if item in COMPONENT_SLOTS:
+            return self._components[COMPONENT_SLOTS[item]]
+        elif item in CREW_SLOTS:
             return self.crew[item]
         raise KeyError("Invalid key for [Ship] instance: {}".format(item))
 
@@ -171,7 +266,7 @@ class Ship(object):
             yield (key, value)
 
     def __contains__(self, item):
-        return item in self.components or item in self.crew
+        return item in COMPONENT_SLOTS or item in CREW_SLOTS
 
     def process_key(self, item):
         """
@@ -182,11 +277,11 @@ class Ship(object):
         """
         if item in COMP_TYPES_REVERSE:
             return COMP_TYPES_REVERSE[item]
-        elif item.lower() in self.components:
+        elif item.lower() in COMPONENT_SLOTS:
             item = item.lower()
         elif item in COMP_SHORT_HAND:
             return COMP_SHORT_HAND[item]
-        if item not in self.components and item not in self.crew:
+        if item not in COMPONENT_SLOTS and item not in CREW_SLOTS:
             return None
         return item
 
@@ -208,29 +303,68 @@ class Ship(object):
         """
         logger.debug("Serializing ship {}".format(self.ship_name))
         string = self.ship_name + ";"  # FQN
-        for key, component in self.components.items():
+        for key, component in zip(COMPONENT_KEYS_ORDERED, self._components):
             # component is None or Component instance
             if component is None or not isinstance(component, Component):
                 continue
             # Serialize the Component
-            upgrades = Ship.build_upgrade_string(component.upgrades, component.type)
+            upgrades = Ship.build_upgrade_string(component.mask, component.type)
             comp = "{}/{}/{};".format(key, component.name, upgrades)
             string += comp
-        for role, member in self.crew.items():
-            if member is None:
+        names = get_encoding_tables()[2]
+        for role, index in zip(CREW_ROLES, self._crew):
+            if index == 0:
                 continue
-            faction, role, name = member
-            crew = "crew/{}/{};".format(role, name)
+            crew = "crew/{}/{};".format(role, names[index - 1])
             string += crew
         return string
 
+    def encode(self) -> str:
+        """
+        Encode a Ship instance into the compact database-storage string
+
+        Format:
+            ENCODING_PREFIX + url-safe base64 of ENCODING
+        """
+        components = [c if isinstance(c, Component) else None for c in self._components]
+        values = [get_encoding_tables()[1][self.ship_name]]
+        values += [0 if c is None else c.index + 1 for c in components]
+        values += [0 if c is None else c.mask for c in components]
+        values += self._crew
+        return ENCODING_PREFIX + urlsafe_b64encode(ENCODING.pack(*values)).decode()
+
+    @staticmethod
+    def decode(string: str):
+        """Build a Ship instance from a compact encoded string"""
+        if not string.startswith(ENCODING_PREFIX):
+            raise ValueError("Unsupported build encoding: {}".format(string[:len(ENCODING_PREFIX)]))
+        try:
+            values = ENCODING.unpack(urlsafe_b64decode(string[len(ENCODING_PREFIX):]))
+        except (DecodeError, StructError) as e:
+            raise ValueError("Invalid build encoding: {}".format(e))
+        ship = Ship(get_encoding_tables()[0][values[0]])
+        data, count = ship.data, len(COMPONENT_SLOTS)
+        components = zip(COMPONENT_KEYS_ORDERED, values[1:count + 1], values[count + 1:2 * count + 1])
+        for slot, (key, index, mask) in enumerate(components):
+            if index == 0:
+                continue
+            component = Component(data[COMPONENT_TYPES[key]][index - 1], index - 1, key)
+            component.mask = mask
+            ship._components[slot] = component
+        ship._crew = list(values[2 * count + 1:])
+        return ship
+
     @staticmethod
     def deserialize(string: str):
         """
         Build a Ship instance from a serialized string
 
-        This is a rather complicated bit.
+        Strings in the compact encoding are decoded directly, others
+        are parsed as the legacy text format. This is a rather
+        complicated bit.
         """
+        if string.startswith(ENCODING_PREFIX):
+            return Ship.decode(string)
         ships_data = load_ship_data()
         elements = string.split(";")
         # First element is FQSN
@@ -247,20 +381,13 @@ class Ship(object):
         return ship
 
     @staticmethod
-    def build_upgrade_string(upgrades: dict, type: str):
-        """Build an upgrades string"""
-        if type not in abilities.upgrades:
+    def build_upgrade_string(upgrades: (int, dict), type: str):
+        """Build an upgrades string from an upgrade bitmask or dictionary"""
+        if type not in UPGRADE_STRINGS:
             raise ValueError("Invalid component type (major/middle/minor)")
-        string = str()
-        for upgrade in abilities.upgrades[type]:
-            if upgrades[upgrade] is True:
-                level, side = upgrade
-                if (type == "major" and level < 3) or (type == "middle" and level < 2) or type == "minor":
-                    string += "{}".format(level + 1)
-                    continue
-                string += "L" if side == 0 else "R"
-                continue
-        return string
+        if not isinstance(upgrades, int):
+            upgrades = sum(UPGRADE_MASKS[u] for u in UPGRADE_BITS if upgrades.get(u) is True)
+        return str().join(letter for mask, letter in UPGRADE_STRINGS[type] if upgrades & mask)
 
     @staticmethod
     def parse_upgrade_string(upgrades: str):
@@ -275,6 +402,11 @@ class Ship(object):
             dictionary[(level, side)] = True
         return dictionary
 
+    @staticmethod
+    def parse_upgrade_mask(upgrades: str) -> int:
+        """Parse a specific upgrade string into an upgrade bitmask"""
+        return sum(UPGRADE_MASKS[upgrade] for upgrade in Ship.parse_upgrade_string(upgrades))
+
     @staticmethod
     def from_base(base: str) -> (object, None):
         base = base.upper()
@@ -287,23 +419,108 @@ class Ship(object):
         return Ship(fqsn)
 
     @staticmethod
-    def random():
-        """Generate a random Ship instance"""
-        base = random.choice(list(ship_tier_factions))
+    def stock(base: str) -> (object, None):
+        """Return a Ship with the default components of a base ship"""
         ship = Ship.from_base(base)
-        names = ["Empty"]
+        if ship is None:
+            return None
         for cat in COMPONENTS:
             if cat not in ship.data:
                 continue
-            name = "Empty"
-            while name in names:
-                index = random.randint(0, len(ship.data[cat]) - 1)
-                comp = ship.data[cat][index]
-                name = comp["Name"]
-            names.append(name)
-            ship[cat] = Component(comp, index, cat)
+            for index, comp in enumerate(ship.data[cat]):
+                if comp["Default"] is True:
+                    ship[cat] = Component(comp, index, COMP_TYPES_REVERSE[cat])
+                    break
         return ship
 
+    @staticmethod
+    def random():
+        """Generate a random Ship instance"""
+        return Ship.random_batch(1)[0]
+
+    @staticmethod
+    def random_batch(n: int, seed: int = None) -> list:
+        """
+        Generate a list of random Ship instances
+
+        Every build gets a random base ship and for every category a
+        random component of that ship, where a component may not be
+        used twice in the same build.
+
+        :param seed: Seed for reproducible builds, the random module
+            is used if not given
+        """
+        rng = random.Random(seed) if seed is not None else random
+        bases, ships = get_random_tables()
+        builds = list()
+        for _ in range(n):
+            ship = Ship(rng.choice(bases))
+            used = set()
+            for slot, data, options in ships[ship.ship_name]:
+                options = [(index, name) for index, name in options if name not in used]
+                if len(options) == 0:
+                    continue
+                index, name = rng.choice(options)
+                used.add(name)
+                ship._components[slot] = Component(data[index], index, COMPONENT_KEYS_ORDERED[slot])
+            builds.append(ship)
+        return builds
+
+
+@lru_cache()
+def get_random_tables() -> (list, dict):
+    """
+    Return the ship FQNs of all bases and per ship FQN a list of
+    (component slot, category data, valid (index, name) options)
+
+    The bases are sorted and the options are in component index order,
+    so that the same seed gives the same builds in every process.
+    """
+    bases = [ship_names[ship_tier_factions[base]] for base in sorted(ship_tier_factions)]
+    ships = dict()
+    for fqn in set(bases):
+        data = load_ship_data()[fqn]
+        ships[fqn] = [
+            (COMPONENT_SLOTS[COMP_TYPES_REVERSE[category]], data[category],
+             tuple((i, c["Name"]) for i, c in enumerate(data[category]) if c["Name"] != "Empty"))
+            for category in COMPONENTS if category in data]
+    return bases, ships
+
+
+assets.add_listener(get_random_tables.cache_clear)
+
+
+class Upgrades(MutableMapping):
+    """Dictionary interface of (tier, side): enabled to the upgrade bitmask of a Component"""
+
+    __slots__ = ("_component",)
+
+    def __init__(self, component):
+        self._component = component
+
+    def __getitem__(self, key: tuple) -> bool:
+        return self._component.mask & UPGRADE_MASKS[key] != 0
+
+    def __setitem__(self, key: tuple, value: bool):
+        if value is True:
+            self._component.mask |= UPGRADE_MASKS[key]
+        else:
+            self._component.mask &= ~UPGRADE_MASKS[key]
+
+    def __delitem__(self, key: tuple):
+        raise TypeError("Upgrades cannot be removed")
+
+    def __iter__(self):
+        mask = self._component.mask
+        return (u for u in UPGRADE_BITS if u in DEFAULT_UPGRADES or mask & UPGRADE_MASKS[u])
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    @property
+    def mask(self) -> int:
+        return self._component.mask
+
 
 class Component(object):
     """
@@ -314,9 +531,12 @@ class Component(object):
         is the component data dictionary
     :attribute category: Component category
     :attribute name: Component name
-    :attribute upgrades: Upgrade dictionary
+    :attribute mask: Upgrade bitmask, with the bits of UPGRADE_MASKS
+    :attribute upgrades: Dictionary interface to the upgrade bitmask
     """
 
+    __slots__ = ("index", "category", "name", "type", "mask")
+
     def __init__(self, data, index, category):
         """
         :param data: Component data dictionary
@@ -326,43 +546,26 @@ class Component(object):
         self.index = index
         self.category = category
         self.name = data["Name"]
-        self.upgrades = {
-            (0, 0): False,
-            (1, 0): False,
-            (2, 0): False,
-            (2, 1): False,
-            (3, 0): False,
-            (3, 1): False,
-            (4, 0): False,
-            (4, 1): False
-        }
+        self.mask = 0
         if category not in abilities.TYPES:
             category = COMPONENT_TYPES[category]
         self.type = abilities.TYPES[category]
 
-    def __setitem__(self, key, value):
-        if isinstance(key, tuple):
-            tier, upgrade = map(int, key)
-            if upgrade is 0:
-                if self[(tier, 1)]:
-                    self.upgrades[(tier, 1)] = False
-                elif self[(tier, 0)]:
-                    return
-                else:
-                    pass
-            elif upgrade is 1:
-                if self[(tier, 0)]:
-                    self.upgrades[(tier, 1)] = False
-                elif self[(tier, 1)]:
-                    return
-                else:
-                    pass
-            else:
-                raise ValueError("Invalid value passed in tuple key: {0}".format(key))
-        self.upgrades[key] = value
+    @property
+    def upgrades(self) -> Upgrades:
+        return Upgrades(self)
+
+    def __setitem__(self, key: tuple, value: bool):
+        """Enable or disable an upgrade, disabling the other side of its tier"""
+        tier, side = map(int, key)
+        if side not in (0, 1):
+            raise ValueError("Invalid value passed in tuple key: {0}".format(key))
+        if value is True:
+            self.mask &= ~(UPGRADE_MASKS[(tier, 0)] | UPGRADE_MASKS[(tier, 1)])
+        self.upgrades[(tier, side)] = value
 
     def __getitem__(self, key):
-        return self.upgrades[key]
+        return self.mask & UPGRADE_MASKS[key] != 0
 
     def __iter__(self):
         for key, value in self.upgrades.items():
@@ -373,17 +576,11 @@ def lookup_crew(name: str)->(None, dict):
     """
     Lookup a crew member by name, or part of the name
 
-    Returns the data dictionary of that crew member. Uses assets/crew.db
+    Returns the data dictionary of that crew member. Uses the crew records
     so it does not require a faction or category to be specified.
     """
-    with open(path.join(get_assets_directory(), "crew.db"), "rb") as fi:
-        crew = pickle.load(fi)
-    name = name.lower()
-    for member in crew.keys():
-        # Now perform name matching
-        if member.lower().startswith(name):
-            return crew[member]
-    return None
+    member = crew_index.find(name.lower())
+    return assets.crew[member] if member is not None else None
 
 
 def lookup_component(category, name)->(dict, None):
@@ -399,39 +596,16 @@ def lookup_component(category, name)->(dict, None):
     name = identify_component(category, name)
     if name is None:
         return None
-    with open(path.join(get_assets_directory(), "components.db"), "rb") as fi:
-        components = pickle.load(fi)
-    return components[category][name]
+    return assets.component_info(category, name)
 
 
 def identify_category(category: str)->(str, None):
     """Return a FQN category for a category identifier"""
-    if category in COMP_SHORT_HAND:
-        return COMP_SHORT_HAND[category]
-    if category in SHIP_KEY_TO_SH.keys():
-        return COMP_SHORT_HAND[SHIP_KEY_TO_SH[category]]
-    for full_name in COMP_SHORT_HAND.values():
-        if full_name.lower().startswith(category.lower()):
-            return full_name
-    return None
+    return resolve_category(category)
 
 
 def identify_component(category: str, component: str)->(str, None):
     """Identify a component by its identifier"""
     if category in COMP_TYPES_REVERSE:
         category = COMP_TYPES_REVERSE[category]
-    category = category.replace("2", str())
-    shorthand = component.lower()
-    category = getattr(abilities, category)
-    if shorthand in category:
-        return category[shorthand]
-    for key, value in category.items():
-        if key.startswith(shorthand):
-            return value
-        if value.lower().startswith(shorthand):
-            return value
-    for _, value in category.items():
-        key = str().join(word[0].lower() for word in value.split(" "))
-        if key == shorthand:
-            return value
-    return None
+    return resolve_component(category.replace("2", str()), component.lower())
@@ -5,14 +5,18 @@ License: GNU GPLv3 as in LICENSE
 Copyright (C) 2016-2018 RedFantom
 """
 # Standard Library
-import os
-import _pickle as pickle
+from collections import OrderedDict
+from copy import deepcopy
+from threading import Lock
+from types import MappingProxyType
 # Project Modules
 from bot import DiscordBotException
 from data.actives import ACTIVES
 from data.components import COMPONENT_TYPES, COMP_TYPES_REVERSE, COMPONENTS
-from parsing.ships import Ship, Component
-from utils.utils import get_assets_directory, setup_logger
+from parsing.assets import STAT_ALIASES
+from parsing.resolver import resolve_active
+from parsing.ships import Ship, Component, assets
+from utils.utils import setup_logger
 
 logger = setup_logger("ShipStats", "stats.log")
 
@@ -39,9 +43,7 @@ class ShipStats(object):
     ship and each component.
     """
 
-    ALIASES = {
-        "Cooldown_Time": "Cooldown",
-    }
+    ALIASES = STAT_ALIASES
 
     PRIMARY_WEAPON = ("PrimaryWeapon", "PrimaryWeapon2")
     SECONDARY_WEAPON = ("SecondaryWeapon", "SecondaryWeapon2")
@@ -61,18 +63,12 @@ class ShipStats(object):
             raise ValueError("ShipStats can only be initialized with a Ship object")
         self.stats = {}
         self.ship = ship
-        with open(os.path.join(get_assets_directory(), "ships.db"), "rb") as fi:
-            ships_data = pickle.load(fi)
-        with open(os.path.join(get_assets_directory(), "companions.db"), "rb") as fi:
-            companions_data = pickle.load(fi)
-        self.ships_data = ships_data.copy()
-        self.companions_data = companions_data.copy()
         self.calc_ship_stats()
 
     def calc_ship_stats(self):
         """Calculate the statistics of the Ship Object"""
         self.stats.clear()
-        self.stats["Ship"] = self.ships_data[self.ship.ship_name]["Stats"].copy()
+        self.stats["Ship"] = assets.ship(self.ship.ship_name)["Stats"].copy()
         for key, value in self.stats["Ship"].copy().items():
             key = key.replace("_(OBSOLETE?)", "")
             self.stats["Ship"][key] = value
@@ -92,26 +88,21 @@ class ShipStats(object):
         self.calc_compound_stats()
 
     def apply_comp_stats(self, comp: Component):
-        """Apply the stats of a component in a category"""
+        """Apply the precompiled stats of a component in a category"""
         ctg = COMPONENT_TYPES[comp.category]
-        data = self.ships_data[self.ship.ship_name][ctg][comp.index].copy()
-        # Get the base statistics for this component
-        base = data["Base"]["Stats"].copy()
-        base.update(data["Stats"])
-        base["Cooldown"] = data["Base"]["Cooldown"]
-        self.stats[ctg] = base.copy()
-        # Apply enabled upgrades
+        effects = assets.effects(self.ship.ship_name, ctg, comp.index)
+        self.stats[ctg] = effects.base.copy()
+        # Apply enabled upgrades, then the base statistics to the Ship
         for u in (u for u in comp.upgrades.keys() if comp.upgrades[u] is True):
-            i, s = u  # index, side
-            upgrade = data["TalentTree"][i][s].copy()
-            upgrade["Target"] = upgrade["Target"].replace("0x00", "")  # Inconsistency in data files
-            # Apply statistics found in this upgrade
-            target = upgrade.pop("Target", None)
-            target = target if target != "Self" else ctg
-            upgrade.update(upgrade.pop("Stats", {}))
-            self.apply_stats(target, upgrade)
-        # Apply statistics of the base component
-        self.apply_stats("Ship", base)
+            self.apply_effects(effects.upgrades.get(u, ()))
+        self.apply_effects(effects.ship)
+
+    def apply_effects(self, effects: tuple):
+        """Apply a sequence of resolved (targets, stat, multiplicative, value) effects"""
+        for targets, stat, mul, val in effects:
+            for category in targets:
+                if category in self.stats:
+                    self.stats[category] = self.update_stat(self.stats[category], stat, mul, val)
 
     def calc_crew_stats(self):
         """Apply Crew Passive ability stats to self"""
@@ -172,28 +163,31 @@ class ShipStats(object):
         """Apply a list of active abilities to self"""
         applied = list()
         for active in actives:
-            if len(active) == 2 and active[0].lower() == "F" and active[1].isdigit():
+            if ShipStats.is_power_mode(active):
                 self.apply_power_mode(active)
                 continue
-            # Name matching
-            active_dict, key = False, None
-            for key, dict in ACTIVES.items():
-                if key.startswith(active):
-                    active_dict = dict
-                    break
-                initials = "".join(l for l in key if l.isupper())
-                if initials.lower() == active.lower():
-                    active_dict = dict
-                    break
-            if active_dict is False:
-                raise ActiveNotFound()
-            elif active_dict is None:
-                raise ActiveNotSupported()
-            self.apply_active(key, active_dict)
+            key = ShipStats.identify_active(active)
+            # The ACTIVES dictionaries are consumed by apply_active
+            self.apply_active(key, deepcopy(ACTIVES[key]))
             applied.append(key)
         self.calc_compound_stats()
         return applied
 
+    @staticmethod
+    def is_power_mode(active: str) -> bool:
+        """Return whether an active identifier is a power mode (F1-F4)"""
+        return len(active) == 2 and active[0].upper() == "F" and active[1].isdigit()
+
+    @staticmethod
+    def identify_active(active: str) -> str:
+        """Return the ACTIVES key for an active ability identifier"""
+        key = resolve_active(active)
+        if key is None:
+            raise ActiveNotFound()
+        if ACTIVES[key] is None:
+            raise ActiveNotSupported()
+        return key
+
     def apply_active(self, name: str, active: dict):
         """Apply an active ability to self"""
         talent_tree = active.pop("TalentTree", None)
@@ -335,10 +329,7 @@ class ShipStats(object):
         return statistic, multiplicative
 
     def get_crew_member_data(self, faction, category, name):
-        faction_data = self.companions_data[faction]
-        category_data = [item for item in faction_data if category in item][0][category]
-        member_data = [item for item in category_data if item["Name"] == name][0]
-        return member_data.copy()
+        return assets.companion(faction, category, name).copy()
 
     # Dictionary like functions
 
@@ -355,3 +346,124 @@ class ShipStats(object):
         """Iterator for all of the statistics and their values"""
         for key, value in self.stats.items():
             yield key, value
+
+
+class FrozenShipStats(object):
+    """
+    Immutable snapshot of the statistics calculated by a ShipStats
+    instance. Offers the same read-only dictionary interface, so it can
+    be used in its place for embeds and TTK calculations.
+
+    :attribute ship: Ship the statistics were calculated for
+    :attribute actives: Tuple of the applied active ability names
+    """
+
+    def __init__(self, shipstats: ShipStats, actives: tuple):
+        """
+        :param shipstats: ShipStats instance to take a snapshot of
+        :param actives: Applied active abilities
+        """
+        self.ship = shipstats.ship
+        self.actives = tuple(actives)
+        self.stats = MappingProxyType({
+            category: MappingProxyType(stats) for category, stats in shipstats.stats.items()})
+
+    def __getitem__(self, item):
+        return self.stats[item]
+
+    def __contains__(self, item):
+        return item in self.stats
+
+    def __iter__(self):
+        for key, value in self.stats.items():
+            yield key, value
+
+
+class ShipStatsCache(object):
+    """
+    LRU cache of FrozenShipStats snapshots
+
+    Snapshots are keyed by the encoded Ship and the identified active
+    abilities, so the statistics of popular builds are only calculated
+    once. The statistics are calculated for a copy of the Ship, so that
+    later changes to the Ship instance given cannot affect the snapshot.
+    As the snapshots are derived from the asset data, all of them are
+    invalidated when the assets are reloaded.
+    """
+
+    def __init__(self, size: int = 256):
+        """
+        :param size: Maximum number of snapshots kept
+        """
+        self.size = size
+        self._cache = OrderedDict()
+        self._lock = Lock()
+        self._generation = 0  # Incremented upon invalidation
+        self.hits, self.misses, self.invalidations = 0, 0, 0
+
+    @staticmethod
+    def get_key(ship: Ship, actives: (list, tuple)) -> tuple:
+        """Return the cache key for a Ship and active ability identifiers"""
+        actives = tuple(
+            active.upper() if ShipStats.is_power_mode(active) else ShipStats.identify_active(active)
+            for active in actives)
+        return ship.encode(), actives
+
+    def get(self, ship: Ship, actives: (list, tuple) = ()) -> FrozenShipStats:
+        """Return the statistics of a ship with the given actives applied"""
+        key = self.get_key(ship, actives)
+        with self._lock:
+            snapshot = self._cache.get(key)
+            if snapshot is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return snapshot
+            self.misses += 1
+            generation = self._generation
+        data, actives = key
+        stats = ShipStats(Ship.decode(data))
+        applied = stats.apply_actives(actives) if len(actives) != 0 else ()
+        snapshot = FrozenShipStats(stats, applied)
+        with self._lock:
+            if generation != self._generation:
+                return snapshot  # Calculated from invalidated asset data
+            self._cache[key] = snapshot
+            while len(self._cache) > self.size:
+                self._cache.popitem(last=False)
+        return snapshot
+
+    def invalidate(self, ship: Ship = None):
+        """Remove all snapshots of a Ship, or all snapshots if no Ship is given"""
+        data = ship.encode() if ship is not None else None
+        with self._lock:
+            keys = [key for key in self._cache if data is None or key[0] == data]
+            for key in keys:
+                del self._cache[key]
+            self.invalidations += len(keys)
+            if data is None:
+                self._generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    def statistics(self) -> dict:
+        """Return a dictionary with the cache metrics"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total != 0 else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self._cache),
+            "size": self.size,
+        }
+
+
+stats_cache = ShipStatsCache()
+assets.add_listener(stats_cache.invalidate)
+
+
+def get_ship_stats(ship: Ship, actives: (list, tuple) = ()) -> FrozenShipStats:
+    """Return the (cached) statistics of a Ship with actives applied"""
+    return stats_cache.get(ship, actives)
@@ -0,0 +1,405 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from collections import namedtuple
+from copy import deepcopy
+from threading import Lock
+# Project Modules
+from data.actives import ACTIVES
+from data.components import COMPONENTS, COMPONENT_TYPES, COMP_TYPES_REVERSE
+from parsing.assets import resolve_effects
+from parsing.ships import Component, Ship, assets, UPGRADE_BITS, UPGRADE_MASKS
+from parsing.shipstats import ShipStats, ActiveNotAvailable
+from utils.utils import setup_logger
+# Packages
+import numpy as np
+
+
+logger = setup_logger("ShipVectors", "stats.log")
+
+CATEGORIES = ("Ship",) + tuple(COMPONENTS)  # Rows of a statistics matrix
+ROWS = {category: row for row, category in enumerate(CATEGORIES)}
+
+# Changes of statistics, expanded to a row per category they apply to.
+# The rows are None if the categories must be guessed like in
+# ShipStats.apply_stat_guess, with a change per statistic instead.
+Effect = namedtuple("Effect", ("rows", "columns", "deltas", "multiplicative"))
+# Compiled ships.db component: the base statistics of its category, the
+# Effect of the base statistics on the Ship and the Effects of upgrades
+CompiledComponent = namedtuple("CompiledComponent", ("columns", "values", "names", "ship", "upgrades"))
+# Base statistics of a category of a build, the statistics it has
+Layout = namedtuple("Layout", ("category", "row", "columns", "values", "names"))
+
+
+def resolve_target(target: (str, None)) -> (tuple, None):
+    """Return the categories affected by an effect target like apply_stat_ctg"""
+    if target is None:
+        return None
+    if target == "":
+        return "Ship",
+    if target[-1] == "s":
+        return target[:-1], target[:-1] + "2"
+    return target,
+
+
+class StatVectors(object):
+    """
+    Registry of statistic names and precompiled effects
+
+    Every statistic name is assigned a fixed column once. The statistics
+    of a build are a matrix with a row per category in CATEGORIES, with
+    NaN for the statistics a category does not have, so that effects on
+    statistics that do not exist are ignored as in ShipStats.
+    Components, crew passives and active abilities are compiled into
+    Effects once, after which calculating the statistics of a build only
+    takes a few NumPy operations.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.names = list()
+        self.columns = dict()
+        self._ships, self._components, self._companions, self._upgrades = dict(), dict(), dict(), dict()
+
+    @property
+    def width(self) -> int:
+        return len(self.names)
+
+    def clear(self):
+        """Drop the compiled asset data, the columns of the statistics remain valid"""
+        for compiled in (self._ships, self._components, self._companions, self._upgrades):
+            compiled.clear()
+
+    def column(self, name: str) -> int:
+        """Return the column of a statistic, assigning one if it is new"""
+        if name not in self.columns:
+            with self._lock:
+                if name not in self.columns:
+                    self.names.append(name)
+                    self.columns[name] = len(self.names) - 1
+        return self.columns[name]
+
+    def compile_values(self, stats: dict) -> (np.ndarray, np.ndarray, tuple):
+        """Return the columns, values and names of a statistics dictionary"""
+        columns = np.array([self.column(name) for name in stats], dtype=np.intp)
+        return columns, np.array(list(stats.values()), dtype=np.float64), tuple(stats)
+
+    def compile_effect(self, target: (tuple, None), stats: dict) -> Effect:
+        """Compile a dictionary of statistic changes into an Effect"""
+        if target is not None:
+            return self.compile_effects(resolve_effects(target, stats))
+        columns, deltas, multiplicative = list(), list(), list()
+        for stat, value in stats.items():
+            stat = ShipStats.ALIASES.get(stat, stat)
+            stat, mul = ShipStats.is_multiplicative(stat)
+            columns.append(self.column(stat))
+            deltas.append(value)
+            multiplicative.append(mul)
+        return Effect(
+            None, np.array(columns, dtype=np.intp), np.array(deltas, dtype=np.float64),
+            np.array(multiplicative, dtype=bool))
+
+    def compile_effects(self, effects: tuple) -> Effect:
+        """Compile resolved (targets, stat, multiplicative, value) effects into an Effect"""
+        expanded = [(ROWS[category], self.column(stat), value, mul)
+                    for targets, stat, mul, value in effects for category in targets if category in ROWS]
+        rows, columns, deltas, multiplicative = zip(*expanded) if len(expanded) != 0 else ((),) * 4
+        return Effect(
+            np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp),
+            np.array(deltas, dtype=np.float64), np.array(multiplicative, dtype=bool))
+
+    def compile_ship(self, fqn: str) -> (np.ndarray, np.ndarray, tuple):
+        """Return the columns, values and names of the base statistics of a ship"""
+        if fqn not in self._ships:
+            stats = assets.ship(fqn)["Stats"].copy()
+            for key, value in assets.ship(fqn)["Stats"].items():
+                stats[key.replace("_(OBSOLETE?)", "")] = value
+            self._ships[fqn] = self.compile_values(stats)
+        return self._ships[fqn]
+
+    def compile_component(self, fqn: str, category: str, index: int) -> CompiledComponent:
+        """Return the CompiledComponent for a ships.db component"""
+        key = (fqn, category, index)
+        if key in self._components:
+            return self._components[key]
+        effects = assets.effects(fqn, category, index)
+        upgrades = {upgrade: self.compile_effects(effects) for upgrade, effects in effects.upgrades.items()}
+        compiled = CompiledComponent(
+            *self.compile_values(effects.base), self.compile_effects(effects.ship), upgrades)
+        self._components[key] = compiled
+        return compiled
+
+    def compile_upgrades(self, fqn: str, category: str, index: int, mask: int) -> Effect:
+        """Return the Effects of the upgrades of a bitmask and the base statistics of a component"""
+        key = (fqn, category, index, mask)
+        if key not in self._upgrades:
+            compiled = self.compile_component(fqn, category, index)
+            effects = [compiled.upgrades[u] for u in UPGRADE_BITS if mask & UPGRADE_MASKS[u] and u in compiled.upgrades]
+            self._upgrades[key] = self.concatenate(effects + [compiled.ship])
+        return self._upgrades[key]
+
+    def compile_companion(self, faction: str, category: str, name: str) -> tuple:
+        """Return the Effects of the passives of a crew member"""
+        key = (faction, category, name)
+        if key not in self._companions:
+            data = assets.companion(faction, category, name)
+            self._companions[key] = tuple(
+                self.compile_effect(None, data[passives]) for passives in ("PassiveStats", "SecondaryPassiveStats"))
+        return self._companions[key]
+
+    def compile_active(self, ship: Ship, name: str) -> tuple:
+        """Return the Effects of an active ability like apply_active"""
+        active = deepcopy(ACTIVES[name])
+        talent_tree = active.pop("TalentTree", None)
+        effects = list()
+        if talent_tree is not None:
+            components = [c for c in ship.components.values() if c is not None and c.name == name]
+            if len(components) == 0:
+                raise ActiveNotAvailable()
+            for upgrade in (u for u, enabled in components[0].upgrades.items() if enabled is True):
+                assert upgrade in talent_tree
+                upgrade = talent_tree[upgrade]
+                target = upgrade.pop("Target", None)
+                if target == "self":
+                    for stat, value in upgrade.items():
+                        active = ShipStats.update_stat(active, stat, False, value)
+                    continue
+                target = ("Ship",) if target is None else resolve_target(target)
+                effects.append(self.compile_effect(target, upgrade))
+        effects.append(self.compile_effect(resolve_target(active.pop("Target", None)), active))
+        return tuple(effects)
+
+    def compile_build(self, ship: Ship) -> (np.ndarray, tuple, Effect, Effect):
+        """
+        Compile a build into its base statistics matrix, its Layout and
+        the expanded Effects of its components and of its crew
+
+        Like in ShipStats, the effects of a component only apply to the
+        categories of the components that come before it in COMPONENTS.
+        """
+        effects, order = list(), np.full(len(CATEGORIES), len(CATEGORIES))
+        order[ROWS["Ship"]] = 0
+        layout = [Layout("Ship", ROWS["Ship"], *self.compile_ship(ship.ship_name))]
+        components = ship.components
+        for category in COMPONENTS:
+            component = components.get(COMP_TYPES_REVERSE[category])
+            if component is None:
+                continue
+            columns, base, names, _, _ = self.compile_component(ship.ship_name, category, component.index)
+            order[ROWS[category]] = position = len(layout)
+            layout.append(Layout(category, ROWS[category], columns, base, names))
+            effects.append((self.compile_upgrades(ship.ship_name, category, component.index, component.mask), position))
+        crew = [effect for category, companion in ship.crew.items()
+                if category != "CoPilot" and companion is not None
+                for effect in self.compile_companion(*companion)]
+        values = np.full((len(CATEGORIES), self.width), np.nan)
+        for _, row, columns, base, _ in layout:
+            values[row, columns] = base
+        if len(effects) != 0:
+            rows, columns, deltas, multiplicative = (
+                np.concatenate(arrays) for arrays in zip(*(effect for effect, _ in effects)))
+            positions = np.repeat([p for _, p in effects], [len(effect.rows) for effect, _ in effects])
+            applied = order[rows] <= positions
+            components = Effect(rows[applied], columns[applied], deltas[applied], multiplicative[applied])
+        else:
+            components = self.expand(values, ())
+        return values, tuple(layout), components, self.expand(values, crew)
+
+    @staticmethod
+    def expand(values: np.ndarray, effects) -> Effect:
+        """
+        Concatenate Effects into a single Effect for a statistics matrix
+
+        The categories of Effects without rows are guessed: the primary
+        weapons if they have the statistic, else the Ship.
+        """
+        guess = np.array([ROWS["PrimaryWeapon"], ROWS["PrimaryWeapon2"], ROWS["Ship"]], dtype=np.intp)
+        expanded = list()
+        for effect in effects:
+            mask = effect.columns < values.shape[1]  # Statistics that no category has
+            if effect.rows is not None:
+                expanded.append((effect.rows[mask], effect.columns[mask], effect.deltas[mask],
+                                 effect.multiplicative[mask]))
+                continue
+            columns = effect.columns[mask]
+            present = ~np.isnan(values[guess][:, columns].T)
+            present[:, 2] &= ~(present[:, 0] | present[:, 1])
+            present = present.ravel()
+            expanded.append((
+                np.tile(guess, len(columns))[present],
+                np.repeat(columns, len(guess))[present],
+                np.repeat(effect.deltas[mask], len(guess))[present],
+                np.repeat(effect.multiplicative[mask], len(guess))[present]))
+        return StatVectors.concatenate([Effect(*arrays) for arrays in expanded])
+
+    @staticmethod
+    def concatenate(effects: list) -> Effect:
+        """Concatenate Effects with rows into a single Effect"""
+        if len(effects) == 0:
+            return Effect(*(np.empty(0, dtype=dtype) for dtype in (np.intp, np.intp, np.float64, bool)))
+        return Effect(*(np.concatenate(arrays) for arrays in zip(*effects)))
+
+    @staticmethod
+    def apply(values: np.ndarray, effects: Effect):
+        """
+        Apply an expanded Effect to a statistics matrix in place
+
+        The rows of the Effect index the rows of all matrices of values
+        together, so the Effects of a batch of matrices are applied at
+        once if their rows are offset by the rows of the matrices before.
+
+        Additive changes to a statistic are summed before multiplicative
+        changes are applied, which is only equivalent to applying them
+        in order if no addition follows a multiplication. The changes
+        are therefore applied in stages that end before such additions.
+        """
+        width = values.shape[-1]
+        values = values.reshape(-1)
+        cells = effects.rows * width + effects.columns
+        start, end = 0, len(cells)
+        while start < end:
+            stage = StatVectors.stage_end(values.size, cells, effects.multiplicative, start)
+            cell, delta, mul = cells[start:stage], effects.deltas[start:stage], effects.multiplicative[start:stage]
+            np.add.at(values, cell[~mul], delta[~mul])
+            np.multiply.at(values, cell[mul], delta[mul] + 1)
+            start = stage
+
+    @staticmethod
+    def stage_end(size: int, cells: np.ndarray, multiplicative: np.ndarray, start: int) -> int:
+        """Return the index of the first addition after a multiplication"""
+        cells, multiplicative = cells[start:], multiplicative[start:]
+        positions = np.arange(len(cells))
+        first = np.full(size, len(cells))
+        np.minimum.at(first, cells[multiplicative], positions[multiplicative])
+        after = ~multiplicative & (positions > first[cells])
+        return start + int(np.argmax(after)) if after.any() else start + len(cells)
+
+    @staticmethod
+    def to_dicts(values: np.ndarray, layout: tuple) -> dict:
+        """Return the statistics dictionaries of the categories in a Layout"""
+        return {category: dict(zip(names, values[row, columns].tolist()))
+                for category, row, columns, _, names in layout}
+
+    def widen(self, values: np.ndarray) -> np.ndarray:
+        """Return a copy of a statistics matrix with the columns assigned since it was created"""
+        widened = np.full(values.shape[:-1] + (self.width,), np.nan)
+        widened[..., :values.shape[-1]] = values
+        return widened
+
+    def compile_hull(self, fqn: str) -> np.ndarray:
+        """Return the statistics matrix of a ship without any components"""
+        columns, values, _ = self.compile_ship(fqn)
+        matrix = np.full((len(CATEGORIES), self.width), np.nan)
+        matrix[ROWS["Ship"], columns] = values
+        return matrix
+
+    def add_components(self, values: np.ndarray, fqn: str, components: list) -> np.ndarray:
+        """
+        Return a batch of copies of a statistics matrix, with one of the
+        components added to every copy
+
+        Like ShipStats.apply_comp_stats, the effects of a component only
+        apply to the categories already in the matrix, so the components
+        must be added in COMPONENTS order.
+        """
+        compiled = [(COMPONENT_TYPES[c.category], self.compile_component(fqn, COMPONENT_TYPES[c.category], c.index),
+                     self.compile_upgrades(fqn, COMPONENT_TYPES[c.category], c.index, c.mask)) for c in components]
+        # The matrices are widened after compiling, so they have the columns of all Effects
+        batch = np.repeat(self.widen(values)[np.newaxis], len(components), axis=0)
+        effects = list()
+        for i, (category, component, upgrades) in enumerate(compiled):
+            batch[i, ROWS[category], component.columns] = component.values
+            effects.append(upgrades._replace(rows=upgrades.rows + i * len(CATEGORIES)))
+        self.apply(batch, self.concatenate(effects))
+        return batch
+
+    def add_component(self, values: np.ndarray, fqn: str, component: Component) -> np.ndarray:
+        """Return a copy of a statistics matrix with a component added"""
+        return self.add_components(values, fqn, [component])[0]
+
+    def compile_batch(self, ships: list) -> np.ndarray:
+        """
+        Return the statistics of a batch of builds as an N x CATEGORIES
+        x width array, without active abilities
+
+        The builds that are None or have unsupported components are NaN.
+        The Effects of all builds are applied to the batch at once.
+        """
+        compiled = list()
+        for i, ship in enumerate(ships):
+            if ship is None:
+                continue
+            try:
+                compiled.append((i,) + self.compile_build(ship))
+            except (KeyError, IndexError):  # Unsupported components, such as mines
+                continue
+        batch = np.full((len(ships), len(CATEGORIES), self.width), np.nan)
+        components, crew = list(), list()
+        for i, values, _, build_components, build_crew in compiled:
+            batch[i, :, :values.shape[1]] = values
+            offset = i * len(CATEGORIES)
+            components.append(build_components._replace(rows=build_components.rows + offset))
+            crew.append(build_crew._replace(rows=build_crew.rows + offset))
+        self.apply(batch, self.concatenate(components))
+        self.apply(batch, self.concatenate(crew))
+        return batch
+
+    def get_stat_arrays(self, batch: np.ndarray, category: str, keys: list, shape: tuple = (-1,)) -> dict:
+        """
+        Return a dictionary of statistic: array of its value per build
+        of a batch, like shipops.get_stat_arrays for ShipStats
+
+        :param batch: Statistics matrices of compile_batch or stacked
+            matrices of add_component
+        """
+        row = batch[..., ROWS[category], :]
+        nan = np.full(row.shape[:-1], np.nan)
+        return {key: (row[..., self.columns[key]] if self.columns.get(key, self.width) < row.shape[-1] else nan)
+                .reshape(shape) for key in keys}
+
+
+vectors = StatVectors()
+assets.add_listener(vectors.clear)
+
+
+class VectorShipStats(ShipStats):
+    """
+    ShipStats calculated from the precompiled effects of StatVectors
+
+    The statistics are kept as a matrix in the values attribute, from
+    which the dictionaries of the ShipStats interface are generated.
+    """
+
+    def calc_ship_stats(self):
+        """Calculate the statistics of the Ship object"""
+        self.values, self.layout, components, crew = vectors.compile_build(self.ship)
+        vectors.apply(self.values, components)
+        self.stats.clear()
+        self.stats.update(vectors.to_dicts(self.values, self.layout))
+        self.calc_compound_stats()
+        # As in ShipStats, the compound statistics exclude crew passives
+        vectors.apply(self.values, crew)
+        self.update_stats()
+
+    def update_stats(self):
+        """Update the statistics dictionaries from the values matrix"""
+        for category, stats in vectors.to_dicts(self.values, self.layout).items():
+            self.stats[category].update(stats)
+
+    def apply_actives(self, actives: list) -> list:
+        """Apply a list of active abilities to self"""
+        applied, effects = list(), list()
+        for active in actives:
+            if ShipStats.is_power_mode(active):
+                self.apply_power_mode(active)
+                continue
+            key = ShipStats.identify_active(active)
+            effects.extend(vectors.compile_active(self.ship, key))
+            applied.append(key)
+        vectors.apply(self.values, vectors.expand(self.values, effects))
+        self.update_stats()
+        self.calc_compound_stats()
+        return applied
@@ -8,7 +8,7 @@ import asyncio
 from datetime import datetime, timedelta
 import traceback
 # Project Modules
-from database import DatabaseHandler
+from database import AsyncDatabaseHandler
 from parsing.strategies import Strategy
 from server.server import Server
 from utils.utils import DATE_FORMAT, TIME_FORMAT
@@ -20,9 +20,9 @@ class DiscordServer(Server):
     SUCCESS_MESSAGE = "ack"
     MATCH_END_TIME = 120
 
-    def __init__(self, database: DatabaseHandler, loop: asyncio.BaseEventLoop, host: str, port: int):
+    def __init__(self, database: AsyncDatabaseHandler, loop: asyncio.BaseEventLoop, host: str, port: int):
         """
-        :param database: DatabaseHandler instance to perform database
+        :param database: AsyncDatabaseHandler instance to perform database
             operations on.
         """
         Server.__init__(self, database, host, port, "DiscordServer")
@@ -88,19 +88,19 @@ class DiscordServer(Server):
         """Process a command given by a Client"""
         try:
             if command == "match":
-                self.process_match_start(*args)
+                await self.process_match_start(*args)
             elif command == "result":
-                self.process_result(*args)
+                await self.process_result(*args)
             elif command == "score":
-                self.process_score(*args)
+                await self.process_score(*args)
             elif command == "map":
-                self.process_map(*args)
+                await self.process_map(*args)
             elif command == "end":
-                self.process_end(*args)
+                await self.process_end(*args)
             elif command == "character":
-                self.process_character(*args)
+                await self.process_character(*args)
             elif command == "strategy":
-                self.process_strategy(tag, *args)
+                await self.process_strategy(tag, *args)
             else:
                 self.logger.error("Invalid command received: {}.".format(command))
             self.queue.append((command, args))
@@ -110,49 +110,49 @@ class DiscordServer(Server):
             return None
         return DiscordServer.SUCCESS_MESSAGE
 
-    def process_match_start(self, server: str, date: str, time: str, id_fmt: str):
+    async def process_match_start(self, server: str, date: str, time: str, id_fmt: str):
         """Insert a new match into the database"""
         self.logger.debug("Inserting new match into database: {}, {}".format(server, time))
-        self.db.insert_match(server, date, time, id_fmt)
+        await self.db.ingest.insert_match(server, date, time, id_fmt)
 
-    def process_result(self, server: str, date: str, start: str, id_fmt: str, character: str,
+    async def process_result(self, server: str, date: str, start: str, id_fmt: str, character: str,
                        assists: str, dmgd: str, dmgt: str, deaths: str, ship: str):
         """Insert a character result into the database"""
         self.logger.debug("Inserting new result into database: {}".format((
             server, start, character, assists, dmgd, dmgt, deaths)))
         assists, dmgd, dmgt, deaths = map(int, (assists, dmgd, dmgt, deaths))
-        self.db.insert_result(character, server, date, start, id_fmt, assists, dmgd, dmgt, deaths, ship)
+        await self.db.ingest.insert_result(character, server, date, start, id_fmt, assists, dmgd, dmgt, deaths, ship)
 
-    def process_map(self, server: str, date: str, start: str, id_fmt: str, map: str):
+    async def process_map(self, server: str, date: str, start: str, id_fmt: str, map: str):
         """Insert the map of a match into the database"""
         self.logger.debug("Updating map in database: {}".format(server, start, map))
         map_eval = map.split(",")
         if not isinstance(map_eval, list) or not len(map_eval) == 2:
             self.logger.error("Invalid map tuple received: {}.".format(map_eval))
             return False
-        self.db.update_match(server, date, start, id_fmt, map=map)
+        await self.db.ingest.update_match(server, date, start, id_fmt, map=map)
 
-    def process_score(self, server: str, date: str, start: str, id_fmt: str, score: str):
+    async def process_score(self, server: str, date: str, start: str, id_fmt: str, score: str):
         """Insert the score of a match into the database"""
         self.logger.debug("Updating score in database: {}, {}, {}".format(server, start, score))
         score = float(score)
-        self.db.update_match(server, date, start, id_fmt, score=score)
+        await self.db.ingest.update_match(server, date, start, id_fmt, score=score)
 
-    def process_end(self, server: str, date: str, start: str, id_fmt: str, end: str):
+    async def process_end(self, server: str, date: str, start: str, id_fmt: str, end: str):
         """Insert the end time of a match into the database"""
         self.logger.debug("Updating end in database: {}".format(server, start, end))
-        self.db.update_match(server, date, start, id_fmt, end=end)
+        await self.db.ingest.update_match(server, date, start, id_fmt, end=end)
 
-    def process_character(self, server: str, faction: str, name: str, discord: str):
+    async def process_character(self, server: str, faction: str, name: str, discord: str):
         """Insert a new character into the database for a Discord user"""
         self.logger.debug("Inserting new character into dtaabase: {}".format(
             server, faction, name, discord))
-        self.db.insert_character(name, server, faction, discord)
+        await self.db.ingest.insert_character(name, server, faction, discord)
 
-    def process_strategy(self, tag: str, data: str):
+    async def process_strategy(self, tag: str, data: str):
         """Insert a new strategy into the database for a Discord user"""
         # Check if it is a valid Strategy
         self.logger.debug("Processing new strategy from {}".format(tag))
         strategy = Strategy.deserialize(data)
         self.logger.debug("Strategy: {}, Phases: {}".format(strategy.name, tuple(strategy.phases.values())))
-        self.db.insert_strategy(tag, strategy)
+        await self.db.ingest.insert_strategy(tag, strategy)
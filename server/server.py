@@ -8,7 +8,7 @@ import asyncio
 import traceback
 from semantic_version import Version
 # Project Modules
-from database import DatabaseHandler
+from database import AsyncDatabaseHandler
 from utils import setup_logger, hash_auth
 
 
@@ -30,9 +30,9 @@ class Server(object):
     BUFFER_SIZE = 32
     MIN_VERSION = "v5.0.0"
 
-    def __init__(self, database: DatabaseHandler, host: str, port: int, name: str="Server"):
+    def __init__(self, database: AsyncDatabaseHandler, host: str, port: int, name: str="Server"):
         """
-        :param database: DatabaseHandler instance
+        :param database: AsyncDatabaseHandler instance
         :param host: Hostname to bind the server to
         :param port: Port number to bind the server to
         """
@@ -63,10 +63,10 @@ class Server(object):
                 raise ValueError("Command split failed")
             # Authenticate the user and check version
             tag, auth, version, command, args = split
-            if self.authenticate_user(tag, auth) is False:
+            if await self.authenticate_user(tag, auth) is False:
                 writer.write(b"unauth")
                 raise PermissionError("Unauthorized usage")
-            if self.check_version(version) is False:
+            if await self.check_version(version) is False:
                 writer.write(b"version")
                 raise ValueError("Version mismatch")
             # Process the command
@@ -119,7 +119,7 @@ class Server(object):
         :param code: Authentication code in str format
         :return: boolean, authenticated
         """
-        valid = self.db.get_auth_code(tag)
+        valid = await self.db.get_auth_code(tag)
         if valid is None:  # User not known
             self.logger.info("User {} not known.".format(tag))
             return False
@@ -0,0 +1,41 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+import asyncio
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import TestCase
+# Project Modules
+from bot.bot import DiscordBot
+from settings import settings
+
+
+class TestCommands(TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        # Parsing commands does not require a connection to Discord
+        self.bot = DiscordBot.__new__(DiscordBot)
+
+    def process_command(self, content: str) -> tuple:
+        message = SimpleNamespace(content=settings["bot"]["prefix"] + content, channel=None)
+        return self.loop.run_until_complete(self.bot.process_command(message))
+
+    def test_period(self):
+        for content, count in (("period 2018-01-01", 1),
+                               ("period 2018-01-01 2018-02-01", 2),
+                               ("period 2018-01-01 daily", 2),
+                               ("period 2018-01-01 2018-02-01 daily", 3)):
+            command, args = self.process_command(content)
+            self.assertEqual(command, "period")
+            self.assertEqual(len(args), count)
+            self.assertIsInstance(args[0], datetime)
+        _, args = self.process_command("period 2018-01-01 2018-02-01 daily")
+        self.assertIsInstance(args[1], datetime)
+        self.assertEqual(args[2], "daily")
+        self.assertEqual(self.process_command("period"), (None, None))
+
+    def tearDown(self):
+        self.loop.close()
@@ -4,12 +4,22 @@ License: GNU GPLv3 as in LICENSE
 Copyright (C) 2018 RedFantom
 """
 # Standard Library
-from datetime import datetime
+import asyncio
+from datetime import datetime, timedelta
+import json
 import os
+import sqlite3 as sql
+from threading import Barrier, Event, Thread
+import time
 from unittest import TestCase
 # Project Modules
-from database import DatabaseHandler
-from database import create
+from database import DatabaseHandler, AsyncDatabaseHandler, DatabaseTimeout, IngestQueue
+from database import create, delete, insert, select
+from database import database as database_module
+from database.cache import IdentityMap
+from database.migrations import SCHEMA_VERSION
+from data.servers import SERVER_NAMES
+from parsing.ships import Ship, ENCODING_PREFIX
 from utils import utils
 from utils.utils import DATE_FORMAT, TIME_FORMAT
 utils.STDOUT = True
@@ -59,6 +69,23 @@ class TestDatabase(TestCase):
         self.db.update_auth_code(self.TEST_TAG, "234567")
         self.assertEqual(self.db.get_auth_code(self.TEST_TAG), "234567")
 
+    def test_user_cache(self):
+        self.db.insert_user(self.TEST_TAG, "123456")
+        self.db.insert_user("@OtherUser#2222", "654321")
+        self.db.update_auth_code(self.TEST_TAG, "234567")
+        self.db.delete_user("@OtherUser#2222")
+        # Validation does not query the database
+        self.db.exec_query = None
+        self.assertTrue(self.db.get_user_in_database(self.TEST_TAG))
+        self.assertFalse(self.db.get_user_in_database("@OtherUser#2222"))
+        self.assertIsNone(self.db.get_auth_code("@OtherUser#2222"))
+        del self.db.exec_query
+        self.db.close()
+        # The cache is loaded from the database at startup
+        self.db = DatabaseHandler()
+        self.assertEqual(self.db.get_auth_code(self.TEST_TAG), "234567")
+        self.assertFalse(self.db.get_user_in_database("@OtherUser#2222"))
+
     def test_insert_match_and_update_match(self):
         self.db.insert_match(
             self.TEST_SERVER, self.TEST_DATE, self.TEST_TIME, "123456")
@@ -92,6 +119,593 @@ class TestDatabase(TestCase):
         self.assertEqual(10, deaths)
         self.assertEqual("T1G", ship)
 
+    def test_matches_count_by_period(self):
+        start = datetime(2018, 1, 1, 12, 0)
+        for i in range(40):
+            day = (start + timedelta(days=i % 10)).strftime(DATE_FORMAT)
+            self.db.insert_match(("DM", "SF")[i % 2], day, self.TEST_TIME, str(i))
+        # The period includes every day from start until end, which is excluded at midnight
+        end = datetime(2018, 1, 6)
+        expected = {server: 0 for server in SERVER_NAMES.keys()}
+        current = start
+        while current < end:
+            for server, count in self.db.get_matches_count_by_day(current).items():
+                expected[server] += count
+            current += timedelta(days=1)
+        self.assertEqual(self.db.get_matches_count_by_period(start, end), expected)
+        days = self.db.get_matches_count_by_period_by_day(start, end)
+        self.assertEqual(list(days), ["2018-01-0{}".format(i) for i in range(1, 6)])
+        self.assertEqual({server: sum(counts[server] for counts in days.values()) for server in expected}, expected)
+        self.assertEqual(days["2018-01-02"]["SF"], 4)
+        self.assertEqual(self.db.get_matches_count_by_period(end, start), {server: 0 for server in expected})
+
+    def test_match_daily(self):
+        for i in range(30):
+            server, day = ("DM", "SF", "TL")[i % 3], "2018-01-0{}".format(1 + i % 4)
+            self.db.insert_match(server, day, self.TEST_TIME, str(i))
+            if i % 2 == 0:
+                self.db.update_match(server, day, self.TEST_TIME, str(i), map=("tdm,km", "dom,de")[i % 4 // 2])
+            if i % 5 == 0:
+                self.db.update_match(server, day, self.TEST_TIME, str(i), score=1.0 + i / 10)
+        self.db.exec_command("UPDATE Match SET date = '2018-01-05' WHERE idfmt = '0';")
+        self.db.exec_command("DELETE FROM Match WHERE idfmt = '1';")
+        query = "SELECT * FROM MatchDaily WHERE matches > 0 ORDER BY date, server;"
+        rollup = self.db.exec_query(query)
+        self.assertEqual(sum(row[2] for row in rollup), 29)
+        self.assertEqual(self.db.backfill_match_daily(), len(rollup))
+        self.assertEqual(self.db.exec_query(query), rollup)
+        self.assertEqual(self.db.get_matches_count_by_day("2018-01-05"), {"DM": 1})
+
+    def test_delete_user(self):
+        other = "@OtherUser#2222"
+        for tag in (self.TEST_TAG, other):
+            self.db.insert_user(tag, "123456")
+            self.db.exec_command(insert.INSERT_STRATEGY, dict(owner=tag, name="Strategy", data=b""))
+        self.db.insert_character("Other Character", self.TEST_SERVER, self.TEST_FACTION, other)
+        with self.db.transaction():
+            for i in range(10):
+                self.db.insert_character("Character {}".format(i), self.TEST_SERVER, self.TEST_FACTION, self.TEST_TAG)
+                for j in range(500):
+                    self.db.insert_result("Character {}".format(i), self.TEST_SERVER, self.TEST_DATE,
+                                          self.TEST_TIME, str(j), 1, 100, 1000, 2, "Quell")
+            self.db.insert_result("Other Character", self.TEST_SERVER, self.TEST_DATE,
+                                  self.TEST_TIME, "0", 1, 100, 1000, 2, "Quell")
+        acquisitions = self.db.metrics()["lock_acquisitions"]
+        self.db.delete_user(self.TEST_TAG)
+        # All deletes are executed in a single transaction
+        self.assertEqual(self.db.metrics()["lock_acquisitions"], acquisitions + 1)
+        for table, count in (("Result", 1), ("Character", 1), ("Strategies", 1), ("User", 1)):
+            self.assertEqual(self.db.exec_query("SELECT COUNT(*) FROM {};".format(table))[0][0], count)
+        self.assertFalse(self.db.get_user_in_database(self.TEST_TAG))
+        self.assertIsNone(self.db.get_character_id(self.TEST_SERVER, "Character 0"))
+        self.assertIsNotNone(self.db.get_character_id(self.TEST_SERVER, "Other Character"))
+
+    def test_migrate_builds(self):
+        ship = Ship.from_base("R1S")
+        ship.update_element("primary/Rapid-fire Laser Cannon/12", None)
+        ship.update_element("crew/Engineering/Risha", None)
+        legacy = self.db.insert_build(self.TEST_OWNER, "Legacy", ship.serialize(), False)
+        compact = self.db.insert_build(self.TEST_OWNER, "Compact", ship.encode(), False)
+        self.db.close()
+        self.db = DatabaseHandler()
+        for build in (legacy, compact):
+            data = self.db.get_build_data(build)
+            self.assertTrue(data.startswith(ENCODING_PREFIX))
+            self.assertEqual(Ship.deserialize(data).serialize(), ship.serialize())
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestMigrations(TestCase):
+    # Queries that may scan a table: the Server table holds five rows,
+    # the legacy builds are only converted and the users only loaded at
+    # initialization and the character owner query is a known cross join
+    FULL_SCAN_ALLOWED = (
+        "INSERT_SERVERS", "GET_SERVER_ID", "GET_BUILDS_LEGACY", "GET_CHARACTER_OWNER", "GET_USERS")
+
+    class Parameters(dict):
+        def __missing__(self, key):
+            return 1
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+
+    def get_indexes(self) -> list:
+        return [name for name, in self.db.exec_query(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%';")]
+
+    def test_migrate(self):
+        self.assertEqual(self.db.exec_query("PRAGMA user_version;")[0][0], SCHEMA_VERSION)
+        indexes = self.get_indexes()
+        self.assertNotEqual(len(indexes), 0)
+        # Reopening the database does not apply migrations again
+        self.db.close()
+        self.db = DatabaseHandler()
+        self.assertEqual(self.get_indexes(), indexes)
+        # Migrations are applied to an older database and are idempotent
+        self.db.exec_command("DROP INDEX {};".format(indexes[-1]))
+        self.db.exec_command("PRAGMA user_version = 0;")
+        self.db.close()
+        self.db = DatabaseHandler()
+        self.assertEqual(sorted(self.get_indexes()), sorted(indexes))
+        self.assertEqual(self.db.exec_query("PRAGMA user_version;")[0][0], SCHEMA_VERSION)
+
+    def test_failed_migration(self):
+        """A migration that fails partway through leaves the schema and user_version unchanged"""
+        self.db.close()
+        migrations = database_module.MIGRATIONS
+        commands = ("CREATE TABLE Partial(id INTEGER);", "CREATE INDEX Invalid ON Missing(id);")
+        database_module.MIGRATIONS = migrations + ((SCHEMA_VERSION + 1, "Failing", commands),)
+        try:
+            self.assertRaises(sql.OperationalError, DatabaseHandler)
+        finally:
+            database_module.MIGRATIONS = migrations
+        self.db = DatabaseHandler()
+        self.assertEqual(self.db.exec_query("PRAGMA user_version;")[0][0], SCHEMA_VERSION)
+        self.assertEqual(self.db.exec_query("SELECT name FROM sqlite_master WHERE name = 'Partial';"), [])
+
+    def test_query_plans(self):
+        for module in (select, insert, delete):
+            for name, query in vars(module).items():
+                if not name.isupper() or not isinstance(query, str) or name in self.FULL_SCAN_ALLOWED:
+                    continue
+                plan = self.db.db.execute("EXPLAIN QUERY PLAN " + query, self.Parameters()).fetchall()
+                for *_, detail in plan:
+                    self.assertFalse(detail.startswith("SCAN"), "{} uses a full scan: {}".format(name, detail))
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestBoundParameters(TestCase):
+    INJECTION = "Robert'); DROP TABLE Result; --"
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+
+    def test_statements(self):
+        for module in (select, insert, delete):
+            for name, value in vars(module).items():
+                if name.isupper() and isinstance(value, str):
+                    self.assertNotRegex(value, r"\{\w*\}", "{} is formatted instead of bound".format(name))
+
+    def test_injection(self):
+        self.db.insert_character(self.INJECTION, "DM", "IMP", self.INJECTION)
+        self.db.insert_result(self.INJECTION, "DM", "2018-01-01", "12:00:00", self.INJECTION, 1, 100, 1000, 2, "Quell")
+        results = self.db.get_match_results("DM", "2018-01-01", "12:00:00")
+        self.assertEqual(results[0][0], self.INJECTION)
+        self.assertEqual(self.db.exec_query("SELECT COUNT(*) FROM Result;")[0][0], 1)
+
+    def test_quotes(self):
+        name = "Ka'lar"
+        self.db.insert_character(name, "DM", "IMP", "@O'Brien#1111")
+        self.assertIsNotNone(self.db.get_character_id("DM", name))
+        self.db.insert_result(name, "DM", "2018-01-01", "12:00:00", "1", 1, 100, 1000, 2, "Quell")
+        self.assertEqual(len(self.db.get_match_results("DM", "2018-01-01", "12:00:00")), 1)
+
     def tearDown(self):
+        self.db.close()
         os.remove("database.db")
 
+
+class TestConnectionPool(TestCase):
+    TEST_FILE = "stress.db"
+    TEST_DATE = "2018-01-01"
+    READERS = 4
+    TIMEOUT = 10.0
+
+    def start_write(self, readers: int) -> (DatabaseHandler, Thread):
+        """Return a handler and a thread executing a write that holds the lock until released"""
+        db = DatabaseHandler(self.TEST_FILE, readers)
+        db.insert_match("DM", self.TEST_DATE, "12:00:00", "1")
+        writing, self.release = Event(), Event()
+        self.addCleanup(self.release.set)
+
+        def block(_):
+            writing.set()
+            self.release.wait(self.TIMEOUT)
+
+        db.db.create_function("block", 1, block)
+        writer = Thread(target=db.exec_command, args=("UPDATE Match SET map = block(1) WHERE id = 1;",))
+        writer.start()
+        self.assertTrue(writing.wait(self.TIMEOUT))
+        return db, writer
+
+    def test_reads_during_write(self):
+        db, writer = self.start_write(self.READERS)
+        barrier, counts = Barrier(self.READERS, timeout=self.TIMEOUT), list()
+
+        def reader():
+            # Every reader holds a connection of the pool at the same time
+            with db._pool.connection():
+                barrier.wait()
+            counts.append(db.get_matches_count_by_day(self.TEST_DATE))
+
+        readers = [Thread(target=reader) for _ in range(self.READERS)]
+        for thread in readers:
+            thread.start()
+        for thread in readers:
+            thread.join(self.TIMEOUT)
+        # The reads completed while the write is holding the lock
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(counts, [{"DM": 1}] * self.READERS)
+        metrics = db.metrics()
+        self.assertEqual(metrics["pool_peak"], self.READERS)
+        self.assertEqual(metrics["pool_in_use"], 0)
+        self.release.set()
+        writer.join()
+        db.close()
+
+    def test_serialized(self):
+        db, writer = self.start_write(0)
+        reader = Thread(target=db.get_matches_count_by_day, args=(self.TEST_DATE,))
+        reader.start()
+        # Without readers, the query waits for the lock held by the write
+        reader.join(0.1)
+        self.assertTrue(reader.is_alive())
+        self.release.set()
+        reader.join()
+        writer.join()
+        self.assertGreater(db.metrics()["lock_wait_max"], 0.0)
+        db.close()
+
+    def tearDown(self):
+        os.remove(self.TEST_FILE)
+
+
+class TestIngestQueue(TestCase):
+    RESULTS = 2000
+    CHARACTERS = 10
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+        self.db.logger.disabled = True
+        for i in range(self.CHARACTERS):
+            self.db.insert_character("Character {}".format(i), "DM", "IMP", "@TestUser#1111")
+
+    def insert_result(self, i: int, func: callable):
+        return func(
+            "Character {}".format(i % self.CHARACTERS), "DM", "2018-01-01", "12:00:00",
+            str(i // self.CHARACTERS), 1, 100, 1000, 2, "Quell")
+
+    def get_result_count(self) -> int:
+        return self.db.exec_query("SELECT COUNT(*) FROM Result;")[0][0]
+
+    def test_group_commit(self):
+        # With a long delay, a transaction is only committed when it is full
+        ingest = IngestQueue(self.db, size=256, delay=60.0)
+        futures = [self.insert_result(i, lambda *args: ingest.submit(self.db.insert_result, *args))
+                   for i in range(self.RESULTS)]
+        ingest.close()
+        self.assertTrue(all(future.done() and future.exception() is None for future in futures))
+        self.assertEqual(self.get_result_count(), self.RESULTS)
+        self.assertEqual(ingest.calls, self.RESULTS)
+        self.assertEqual(ingest.batches, -(-self.RESULTS // 256))
+
+    def test_failed_call(self):
+        def insert_and_fail():
+            self.insert_result(self.CHARACTERS, self.db.insert_result)
+            self.db.insert_user("@Failed#0000", "code")
+            raise ValueError("Invalid result")
+
+        users = self.db._users
+        ingest = IngestQueue(self.db, delay=1.0)
+        first = self.insert_result(1, lambda *args: ingest.submit(self.db.insert_result, *args))
+        failed = ingest.submit(insert_and_fail)
+        last = self.insert_result(2, lambda *args: ingest.submit(self.db.insert_result, *args))
+        ingest.flush()
+        self.assertIsInstance(failed.exception(), ValueError)
+        self.assertIsNone(first.exception())
+        self.assertIsNone(last.exception())
+        self.assertEqual(ingest.batches, 1)
+        # The result of the failed call was rolled back
+        self.assertEqual(self.get_result_count(), 2)
+        # Only the match ID and the user stored by the failed call were discarded
+        self.assertIsNotNone(self.db._matches.get(("DM", "2018-01-01", "0")))
+        self.assertIsNone(self.db._matches.get(("DM", "2018-01-01", "1")))
+        self.assertIsNotNone(self.db._characters.get(("DM", "Character 0")))
+        self.assertIs(self.db._users, users)
+        self.assertFalse(self.db.get_user_in_database("@Failed#0000"))
+        ingest.close()
+
+    def test_queued_timeout(self):
+        ingest = IngestQueue(self.db, delay=60.0)
+
+        async def insert():
+            with self.assertRaises(DatabaseTimeout):
+                await ingest.insert_match("DM", "2018-01-01", "12:00:00", "1", timeout=0.1)
+
+        asyncio.new_event_loop().run_until_complete(insert())
+        ingest.flush()
+        # The call timed out while queued and was never executed
+        self.assertEqual(ingest.calls, 0)
+        self.assertEqual(self.db.exec_query("SELECT COUNT(*) FROM Match;")[0][0], 0)
+        ingest.close()
+
+    def test_executing_timeout(self):
+        ingest = IngestQueue(self.db, delay=0.0)
+
+        async def calls():
+            with self.assertRaises(DatabaseTimeout):
+                await ingest.exec_query(TestAsyncDatabaseHandler.SLOW_QUERY, timeout=0.2)
+            # The query was interrupted and the queue executes new calls
+            await ingest.insert_match("DM", "2018-01-01", "12:00:00", "1")
+
+        asyncio.new_event_loop().run_until_complete(calls())
+        self.assertEqual(self.db.exec_query("SELECT COUNT(*) FROM Match;")[0][0], 1)
+        ingest.close()
+
+    def test_rolled_back_transaction(self):
+        def fail():
+            self.db.db.rollback()
+            raise sql.OperationalError("interrupted")
+
+        ingest = IngestQueue(self.db, delay=1.0)
+        first = self.insert_result(1, lambda *args: ingest.submit(self.db.insert_result, *args))
+        failed = ingest.submit(fail)
+        ingest.flush()
+        # Calls are not reported as committed if SQLite rolled back their transaction
+        self.assertIsInstance(first.exception(), sql.OperationalError)
+        self.assertIsInstance(failed.exception(), sql.OperationalError)
+        self.assertEqual(self.get_result_count(), 0)
+        ingest.close()
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestMatchUpsert(TestCase):
+    MATCHES = 100
+    CHARACTERS = 4
+    MATCH = ("DM", "2018-01-01", "12:00:00")
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+        self.db.logger.disabled = True
+        for i in range(self.CHARACTERS):
+            self.db.insert_character("Character {}".format(i), "DM", "IMP", "@TestUser#1111")
+
+    def update_match_legacy(self, server: str, date: str, start: str, id_fmt: str,
+                            score: float = None, map: str = None, end: str = None):
+        """Statements executed by update_match before the upsert"""
+        if self.db.get_match_id(server, date, id_fmt) is None:
+            self.db.insert_match(server, date, start, id_fmt)
+        match = self.db.get_match_id(server, date, id_fmt)
+        for column, value in (("score", score), ("end", end), ("map", map)):
+            if value is not None:
+                self.db.exec_command(
+                    "UPDATE Match SET {0} = :{0} WHERE id = :match;".format(column), {column: value, "match": match})
+
+    def insert_result_legacy(self, character: str, server: str, date: str, start: str, id_fmt: str,
+                             assists: int, dmgd: int, dmgt: int, deaths: int, ship: str):
+        """Statements executed by insert_result before the upsert"""
+        char = self.db.get_character_id(server, character)
+        match = self.db.get_match_id(server, date, id_fmt)
+        if match is None:
+            self.db.insert_match(server, date, start, id_fmt)
+            match = self.db.get_match_id(server, date, id_fmt)
+        self.db.exec_command(
+            "INSERT OR IGNORE INTO Result VALUES (:match, :char, :assists, :dmgd, :dmgt, :deaths, :ship);",
+            dict(match=match, char=char, assists=assists, dmgd=dmgd, dmgt=dmgt, deaths=deaths, ship=ship))
+
+    def ingest(self, update_match: callable, insert_result: callable):
+        """Execute the ingest messages of the matches"""
+        for i in range(self.MATCHES):
+            for j in range(self.CHARACTERS):
+                insert_result("Character {}".format(j), *self.MATCH, str(i), 1, 100, 1000, 2, "Quell")
+            update_match(*self.MATCH, str(i), map="tdm,km")
+            update_match(*self.MATCH, str(i), score=1.0 + i / 100)
+            update_match(*self.MATCH, str(i), end="12:10:00")
+
+    def get_tables(self) -> tuple:
+        return tuple(self.db.exec_query("SELECT * FROM {} ORDER BY 1, 2;".format(table))
+                     for table in ("Match", "Result"))
+
+    def test_upsert(self):
+        self.db.update_match(*self.MATCH, "1", score=0.5)
+        self.db.update_match(*self.MATCH, "1", map="dom,de", end="12:10:00")
+        self.db.update_match(*self.MATCH, "1")
+        self.assertEqual(
+            self.db.get_matches_by_day_by_server(*self.MATCH[:2]), [("12:00:00", "12:10:00", "dom,de", 0.5)])
+        self.assertFalse(self.db.insert_result("Unknown", *self.MATCH, "1", 1, 100, 1000, 2, "Quell"))
+        self.assertEqual(self.db.exec_query("SELECT matches, dom, scored FROM MatchDaily;"), [(1, 1, 1)])
+
+    def test_ingest(self):
+        self.ingest(self.update_match_legacy, self.insert_result_legacy)
+        tables = self.get_tables()
+        self.db.exec_command("DELETE FROM Result;")
+        self.db.exec_command("DELETE FROM Match;")
+        self.db.invalidate()
+        self.ingest(self.db.update_match, self.db.insert_result)
+        self.assertEqual(self.get_tables(), tables)
+        # Messages that are received again update the rows in place
+        self.ingest(self.db.update_match, self.db.insert_result)
+        matches, results = self.get_tables()
+        self.assertEqual((matches, results), tables)
+        self.assertEqual(len(matches), self.MATCHES)
+        self.assertEqual(len(results), self.MATCHES * self.CHARACTERS)
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestIdentityMap(TestCase):
+    PLAYERS = 16
+    CLIENTS = 4
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+        self.db.logger.disabled = True
+
+    def test_bounds(self):
+        identities = IdentityMap(2, 0.1)
+        for i in range(3):
+            identities.put(("DM", str(i)), i)
+        self.assertEqual(len(identities), 2)
+        self.assertIsNone(identities.get(("DM", "0")))
+        self.assertEqual(identities.get(("DM", "2")), 2)
+        time.sleep(0.1)
+        self.assertIsNone(identities.get(("DM", "2")))
+        self.assertEqual(identities.metrics("test")["test_hit_rate"], 1 / 3)
+
+    def test_ingest_hit_rate(self):
+        for i in range(self.PLAYERS):
+            self.db.insert_character("Character {}".format(i), "DM", "IMP", "@TestUser#1111")
+        # Every client of the match reports the results of all players
+        for _ in range(self.CLIENTS):
+            for i in range(self.PLAYERS):
+                self.db.insert_result("Character {}".format(i), "DM", "2018-01-01", "12:00:00", "1",
+                                      1, 100, 1000, 2, "Quell")
+        metrics = self.db.metrics()
+        self.assertEqual(metrics["characters_misses"], self.PLAYERS)
+        # The match is looked up before and after it is inserted
+        self.assertEqual(metrics["matches_misses"], 2)
+        self.assertEqual(self.db.exec_query("SELECT COUNT(*) FROM Result;")[0][0], self.PLAYERS)
+
+    def test_transaction(self):
+        self.db.insert_character("Character", "DM", "IMP", "@TestUser#1111")
+        self.db._characters.clear()
+        with self.db.transaction():
+            self.assertIsNotNone(self.db.get_character_id("DM", "Character"))
+            # The ID is not visible to other threads before commit
+            self.assertEqual(len(self.db._characters), 0)
+        self.assertEqual(len(self.db._characters), 1)
+
+    def test_rollback(self):
+        self.db.insert_character("Character", "DM", "IMP", "@TestUser#1111")
+        self.db._characters.clear()
+        with self.assertRaises(RuntimeError):
+            with self.db.transaction():
+                self.db.get_character_id("DM", "Character")
+                raise RuntimeError()
+        self.assertEqual(len(self.db._characters), 0)
+
+    def test_delete_user(self):
+        self.db.insert_user("@TestUser#1111", "123456")
+        self.db.insert_character("Character", "DM", "IMP", "@TestUser#1111")
+        self.assertIsNotNone(self.db.get_character_id("DM", "Character"))
+        self.db.delete_user("@TestUser#1111")
+        self.assertIsNone(self.db.get_character_id("DM", "Character"))
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestQueryMetrics(TestCase):
+    SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c LIMIT 200000) SELECT count(*) FROM c;"
+
+    class Unformattable(str):
+        def __repr__(self):
+            raise AssertionError("Formatted a parameter with logging disabled")
+
+        __str__ = __format__ = __repr__
+
+    def setUp(self):
+        self.db = DatabaseHandler()
+        self.db.logger.disabled = True
+
+    def test_histograms(self):
+        self.db.insert_character("Character", "DM", "IMP", "@TestUser#1111")
+        for i in range(10):
+            self.db.insert_result("Character", "DM", "2018-01-01", "12:00:00", str(i), 1, 100, 1000, 2, "Quell")
+        self.db.get_matches_count_by_day("2018-01-01")
+        queries = self.db.query_metrics()
+        self.assertEqual(queries["insert.INSERT_RESULT"]["count"], 10)
+        self.assertEqual(queries["insert.INSERT_RESULT"]["rows"], 10)
+        self.assertEqual(queries["select.GET_MATCHES_COUNT_FOR_DAY_BY_SERVER"]["rows"], 1)
+        query = queries["select.GET_MATCH_ID"]
+        self.assertEqual(sum(query["buckets"]), query["count"])
+        self.assertLessEqual(query["p50"], query["p99"])
+        dump = json.loads(self.db.dump_metrics())
+        self.assertEqual(dump["queries"]["insert.INSERT_RESULT"]["count"], 10)
+        self.assertIn("lock_wait", dump["handler"])
+
+    def test_slow_queries(self):
+        self.db._queries.threshold = 0.01
+        self.db.exec_query(self.SLOW_QUERY)
+        self.db.exec_query(select.GET_USER_ID, dict(discord_id="@TestUser#1111"))
+        slow = self.db.slow_queries()
+        self.assertEqual(len(slow), 1)
+        self.assertEqual(slow[0]["name"], "adhoc")
+        self.assertGreater(slow[0]["duration"], 0.01)
+        self.assertNotEqual(len(slow[0]["plan"]), 0)
+
+    def test_logging_disabled(self):
+        server = self.Unformattable("DM")
+        self.assertIsNone(self.db.get_character_id(server, "Character"))
+        self.db.insert_character("Character", server, "IMP", "@TestUser#1111")
+        self.assertIsNone(self.db.insert_result("Character", server, "2018-01-01", "12:00:00", "1",
+                                                1, 100, 1000, 2, "Quell"))
+
+    def tearDown(self):
+        self.db.close()
+        os.remove("database.db")
+
+
+class TestAsyncDatabaseHandler(TestCase):
+    TEST_OWNER = "@TestUser#1111"
+    SLOW_QUERY = "WITH RECURSIVE c(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM c) SELECT count(*) FROM c;"
+
+    def setUp(self):
+        self.db = AsyncDatabaseHandler(DatabaseHandler(), timeout=5.0)
+        self.loop = asyncio.new_event_loop()
+
+    def test_calls(self):
+        async def calls():
+            build = await self.db.insert_build(self.TEST_OWNER, "Test", Ship.from_base("R1S").encode(), True)
+            return build, await self.db.get_public_builds(), await self.db.get_build_owner(build)
+        build, public, owner = self.loop.run_until_complete(calls())
+        self.assertEqual(public, [(build, "Test", Ship.from_base("R1S").encode())])
+        self.assertEqual(owner, self.TEST_OWNER)
+
+    def test_timeout(self):
+        async def query():
+            ticked = asyncio.Event()
+
+            async def ticker():
+                await asyncio.sleep(0)
+                ticked.set()
+
+            task = self.loop.create_task(ticker())
+            with self.assertRaises(DatabaseTimeout):
+                await self.db.exec_query(self.SLOW_QUERY, timeout=0.2)
+            await task
+            # The loop kept running while the query executed
+            self.assertTrue(ticked.is_set())
+            # The query was interrupted and the database accepts new calls
+            self.assertFalse(await self.db.get_user_in_database(self.TEST_OWNER))
+            self.assertEqual(await self.db.exec_query("SELECT 1;"), [(1,)])
+
+        self.loop.run_until_complete(query())
+
+    def test_interrupt_completed(self):
+        handler = self.db.handler
+        with handler.interruptible() as token:
+            handler.exec_query("SELECT 1;")
+        # A later call on the same thread is not interrupted
+        with handler.interruptible():
+            handler.interrupt(token)
+            self.assertEqual(handler.exec_query("SELECT 1;"), [(1,)])
+
+    def test_interrupt_transaction(self):
+        handler = self.db.handler
+        with handler.interruptible() as token:
+            with self.assertRaises(sql.OperationalError):
+                with handler.transaction():
+                    handler.insert_user(self.TEST_OWNER, "123456")
+                    handler.interrupt(token)
+                    handler.insert_user("@OtherUser#2222", "123456")
+        # The transaction was rolled back instead of partially committed
+        self.assertFalse(handler.get_user_in_database(self.TEST_OWNER))
+        self.assertEqual(handler.exec_query("SELECT COUNT(*) FROM User;"), [(0,)])
+
+    def tearDown(self):
+        self.loop.close()
+        self.db.close()
+        os.remove("database.db")
@@ -0,0 +1,640 @@
+"""
+Author: RedFantom
+License: GNU GPLv3 as in LICENSE
+Copyright (C) 2018 RedFantom
+"""
+# Standard Library
+from copy import deepcopy
+from itertools import product
+from operator import setitem
+import os
+import pickle
+import random
+from tempfile import TemporaryDirectory
+import tracemalloc
+from types import MappingProxyType
+from unittest import TestCase
+# Packages
+import numpy as np
+# Project Modules
+from data.actives import ACTIVES
+from data import abilities
+from data.components import COMPONENT_TYPES, COMPONENTS, COMP_SHORT_HAND, COMP_TYPES_REVERSE, SHIP_KEY_TO_SH
+from data.ships import ship_tier_factions
+from parsing.assets import AssetStore, assets, convert_assets
+from parsing.charts import render_ttk_curve, render_ttk_matrix
+from parsing import optimizer
+from parsing.optimizer import \
+    optimize, get_options, build_component, get_target_stats, score_candidates, METRICS
+from parsing.ships import \
+    Ship, load_ship_data, lookup_crew, identify_category, identify_component, get_encoding_tables, \
+    COMPONENT_KEYS_ORDERED, ENCODING_PREFIX, UPGRADE_BITS
+from parsing.shipops import \
+    get_time_to_kill, get_time_to_kill_acc, get_time_to_kill_curve, get_time_to_kill_matrix, InfiniteShots, \
+    simulate_time_to_kill, SIMULATION_ENGAGEMENTS, TARGET_STATS, WEAPON_STATS
+from parsing.shipstats import \
+    get_ship_stats, stats_cache, ShipStats, ShipStatsCache, FrozenShipStats, ActiveNotFound, ActiveNotSupported
+from parsing.shipvectors import VectorShipStats, vectors
+from utils.utils import get_assets_directory
+
+
+def load_pickle(name: str):
+    with open(os.path.join(get_assets_directory(), "{}.db".format(name)), "rb") as fi:
+        return pickle.load(fi)
+
+
+TEST_BUILD = "Republic_NovaDive;primary/Laser Cannon/;secondary/Rocket Pods/;" \
+             "engine/Barrel Roll/;shields/Distortion Field/1;systems/EMP Field/;" \
+             "armor/Deflection Armor/;sensors/Communication Sensors/;" \
+             "thrusters/Speed Thrusters/;capacitor/Frequency Capacitor/;"
+
+
+class TestAssetStore(TestCase):
+    TEST_BUILD = TEST_BUILD
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.file_name = os.path.join(self.directory.name, "assets.sqlite")
+
+    def test_conversion(self):
+        convert_assets(self.file_name)
+        store = AssetStore(self.file_name)
+        ships = load_pickle("ships")
+        self.assertEqual(list(store.ships), list(ships))
+        for fqn, data in ships.items():
+            self.assertEqual(dict(store.ships[fqn]), data)
+        crew = load_pickle("crew")
+        self.assertEqual(list(store.crew), list(crew))
+        self.assertEqual(dict(store.crew), crew)
+        for category, components in load_pickle("components").items():
+            for name, component in components.items():
+                self.assertEqual(store.component_info(category, name), component)
+        for faction, roles in load_pickle("companions").items():
+            for role in roles:
+                for category, members in role.items():
+                    member = members[0]
+                    self.assertEqual(store.companion(faction, category, member["Name"]), member)
+        store.close()
+
+    def test_load_once(self):
+        store = AssetStore(self.file_name)
+        store.load()
+        self.assertTrue(os.path.exists(self.file_name))
+        record = store.component("Republic_NovaDive", "PrimaryWeapon", 0)
+        self.assertIs(record, store.component("Republic_NovaDive", "PrimaryWeapon", 0))
+        load_time, hits, misses = store.statistics()["component"]
+        self.assertGreater(load_time, 0.0)
+        self.assertEqual((hits, misses), (1, 1))
+        self.assertEqual(store.statistics()["ship"][2], 0)
+        self.assertRaises(KeyError, store.ship, "Republic_Invalid")
+        store.close()
+
+    def test_shared_data(self):
+        ship = Ship.deserialize(self.TEST_BUILD)
+        self.assertIs(ship.data, load_ship_data()[ship.ship_name])
+        hits = assets.hits["effects"]
+        ShipStats(ship)
+        ShipStats(ship)
+        self.assertGreater(assets.hits["effects"], hits)
+
+    def test_read_only(self):
+        ship = Ship.deserialize(self.TEST_BUILD)
+        data = deepcopy(dict(load_ship_data()[ship.ship_name]))
+        ShipStats(ship)
+        self.assertEqual(data, dict(load_ship_data()[ship.ship_name]))
+
+    def test_listener(self):
+        store, calls = AssetStore(self.file_name), list()
+        store.add_listener(lambda: calls.append(store.statistics()["component"][2]))
+        store.component("Republic_NovaDive", "PrimaryWeapon", 0)
+        self.assertEqual(calls, [])
+        store.close()
+        self.assertEqual(calls, [1])
+        store.component("Republic_NovaDive", "PrimaryWeapon", 0)
+        self.assertEqual(store.statistics()["component"][2], 2)
+
+    def test_reload(self):
+        ship = Ship.deserialize(self.TEST_BUILD)
+        stats = get_ship_stats(ship, ["df"])
+        vectors.compile_build(ship)
+        assets.close()
+        self.assertEqual(stats_cache.statistics()["entries"], 0)
+        self.assertEqual(vectors._upgrades, {})
+        reloaded = get_ship_stats(ship, ["df"])
+        self.assertIsNot(reloaded, stats)
+        self.assertEqual(dict(reloaded), dict(stats))
+
+    def test_lookup_crew(self):
+        self.assertEqual(lookup_crew("2v")["Name"], "2V-R8")
+        self.assertIsNone(lookup_crew("nobody"))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+
+class TestShipStatsCache(TestCase):
+    def setUp(self):
+        self.cache = ShipStatsCache(size=2)
+        self.ship = Ship.deserialize(TEST_BUILD)
+
+    def test_hit_and_miss(self):
+        stats = self.cache.get(self.ship, ["df"])
+        self.assertIsInstance(stats, FrozenShipStats)
+        self.assertEqual(stats.actives, ("Distortion Field",))
+        self.assertIs(stats, self.cache.get(Ship.deserialize(TEST_BUILD), ["Distortion Field"]))
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertIsNot(stats, self.cache.get(self.ship))
+        self.assertEqual(self.cache.statistics()["entries"], 2)
+
+    def test_equal_to_shipstats(self):
+        expected = ShipStats(Ship.deserialize(TEST_BUILD))
+        expected.apply_actives(["df"])
+        for _ in range(2):
+            stats = self.cache.get(self.ship, ["df"])
+            self.assertEqual({key: dict(value) for key, value in stats}, expected.stats)
+
+    def test_actives_unchanged(self):
+        actives = deepcopy(ACTIVES)
+        self.cache.get(self.ship, ["df"])
+        self.assertEqual(actives, ACTIVES)
+
+    def test_immutable(self):
+        stats = self.cache.get(self.ship)
+        self.assertIsInstance(stats["Ship"], MappingProxyType)
+        self.assertRaises(TypeError, setitem, stats["Ship"], "Max_Health", 0.0)
+        self.ship["primary"] = None
+        self.assertIsNotNone(stats.ship["primary"])
+
+    def test_changed_and_evict(self):
+        stats = self.cache.get(self.ship)
+        self.ship["primary"] = None
+        changed = self.cache.get(self.ship)
+        self.assertIsNot(stats, changed)
+        self.assertIsNone(changed.ship["primary"])
+        self.assertIsNotNone(stats.ship["primary"])
+        for actives in ([], ["df"], ["F2"]):
+            self.cache.get(self.ship, actives)
+        self.assertEqual(self.cache.statistics()["entries"], 2)
+
+    def test_invalidate(self):
+        self.cache.get(self.ship)
+        self.cache.get(self.ship, ["df"])
+        self.cache.invalidate(self.ship)
+        self.assertEqual(self.cache.statistics()["entries"], 0)
+        self.assertEqual(self.cache.invalidations, 2)
+        self.cache.get(self.ship)
+        self.cache.invalidate()
+        self.assertEqual(self.cache.statistics()["invalidations"], 3)
+
+    def test_invalid_active(self):
+        self.assertRaises(ActiveNotFound, self.cache.get, self.ship, ["invalid"])
+
+
+class TestVectorShipStats(TestCase):
+    ACTIVES = ["df", "Nullify", "Wingman", "Servo Jammer"]
+
+    def assertStatsEqual(self, ship: Ship, actives: list):
+        expected, stats = ShipStats(ship), VectorShipStats(ship)
+        self.assertEqual(stats.stats, expected.stats)
+        self.assertEqual(stats.apply_actives(actives), expected.apply_actives(actives))
+        self.assertEqual(stats.stats, expected.stats)
+
+    def test_build(self):
+        ship = Ship.deserialize(TEST_BUILD + "crew/Engineering/Risha;crew/Offensive/Kira Carsen;")
+        self.assertStatsEqual(ship, self.ACTIVES)
+
+    def test_random_builds(self):
+        random.seed(0)
+        for _ in range(50):
+            ship = Ship.deserialize(Ship.random().serialize())
+            for component in (c for c in ship.components.values() if c is not None):
+                data = assets.component(ship.ship_name, COMPONENT_TYPES[component.category], component.index)
+                for tier, row in enumerate(data["TalentTree"]):
+                    component.upgrades[(tier, random.randint(0, len(row) - 1))] = random.random() > 0.5
+            try:
+                ShipStats(ship)
+            except KeyError:  # Mines are not supported by ShipStats
+                continue
+            actives = [c.name for c in ship.components.values() if c is not None and ACTIVES.get(c.name)]
+            self.assertStatsEqual(ship, actives)
+
+    def test_dict_interface(self):
+        stats = VectorShipStats(Ship.deserialize(TEST_BUILD))
+        self.assertIn("PrimaryWeapon", stats)
+        self.assertEqual(stats["Ship"]["Max_Health"], stats.values[0, vectors.columns["Max_Health"]])
+
+    def test_batch(self):
+        ships = [Ship.deserialize(TEST_BUILD + "crew/Engineering/Risha;"), None, Ship.stock("I2B")]
+        batch = vectors.compile_batch(ships)
+        self.assertEqual(batch.shape[0], 3)
+        health = vectors.get_stat_arrays(batch, "Ship", ["Max_Health", "Unknown_Statistic"])
+        self.assertEqual(health["Max_Health"][0], ShipStats(ships[0])["Ship"]["Max_Health"])
+        self.assertTrue(np.isnan(health["Max_Health"][1]))
+        self.assertTrue(np.isnan(health["Unknown_Statistic"]).all())
+
+    def test_add_component(self):
+        ship = Ship.deserialize(TEST_BUILD)
+        values = vectors.compile_hull(ship.ship_name)
+        for category in COMPONENTS:
+            if ship[category] is not None:
+                values = vectors.add_component(values, ship.ship_name, ship[category])
+        expected = ShipStats(ship)
+        # The compound statistics are not calculated for the matrices
+        for category, keys in (("Ship", TARGET_STATS), ("PrimaryWeapon", WEAPON_STATS)):
+            for stat, value in vectors.get_stat_arrays(values[np.newaxis], category, keys).items():
+                self.assertEqual(value[0], expected[category][stat])
+
+
+class LegacyShipStats(ShipStats):
+    """ShipStats deriving the component statistics from ships.db on every build"""
+
+    def apply_comp_stats(self, comp):
+        ctg = COMPONENT_TYPES[comp.category]
+        data = assets.component(self.ship.ship_name, ctg, comp.index)
+        base = data["Base"]["Stats"].copy()
+        base.update(data["Stats"])
+        base["Cooldown"] = data["Base"]["Cooldown"]
+        self.stats[ctg] = base.copy()
+        for u in (u for u in comp.upgrades.keys() if comp.upgrades[u] is True):
+            i, s = u
+            upgrade = data["TalentTree"][i][s].copy()
+            upgrade["Target"] = upgrade["Target"].replace("0x00", "")
+            target = upgrade.pop("Target", None)
+            target = target if target != "Self" else ctg
+            upgrade.update(upgrade.pop("Stats", {}))
+            self.apply_stats(target, upgrade)
+        self.apply_stats("Ship", base)
+
+
+class TestComponentEffects(TestCase):
+    def setUp(self):
+        random.seed(1)
+        self.ships = list()
+        while len(self.ships) < 20:
+            ship = Ship.deserialize(Ship.random().serialize())
+            for component in (c for c in ship.components.values() if c is not None):
+                data = assets.component(ship.ship_name, COMPONENT_TYPES[component.category], component.index)
+                for tier, row in enumerate(data["TalentTree"]):
+                    component.upgrades[(tier, random.randint(0, len(row) - 1))] = True
+            try:
+                LegacyShipStats(ship)
+            except KeyError:
+                continue
+            self.ships.append(ship)
+
+    def test_equal_to_legacy(self):
+        for ship in self.ships:
+            self.assertEqual(ShipStats(ship).stats, LegacyShipStats(ship).stats)
+
+    def test_effects(self):
+        effects = assets.effects("Republic_NovaDive", "PrimaryWeapon", 0)
+        self.assertIn("Cooldown", effects.base)
+        self.assertTrue(all(targets == ("Ship",) for targets, _, _, _ in effects.ship))
+        for effects in effects.upgrades.values():
+            for targets, stat, _, _ in effects:
+                self.assertNotIn("[Pc]", stat)
+                self.assertNotIn("Self", targets)
+
+
+class TestTimeToKillMatrix(TestCase):
+    def setUp(self):
+        self.ships = [Ship.stock(base) for base in ship_tier_factions]
+        self.stats = [get_ship_stats(ship) for ship in self.ships]
+
+    def test_stock(self):
+        ship = Ship.stock("R1S")
+        self.assertTrue(all(component is None or assets.component(
+            ship.ship_name, COMPONENT_TYPES[component.category], component.index)["Default"] is True
+            for component in ship.components.values()))
+        self.assertIsNotNone(ship["primary"])
+        self.assertIsNone(Ship.stock("X1S"))
+
+    def test_equal_to_scalar(self):
+        for acc, func in ((False, get_time_to_kill), (True, get_time_to_kill_acc)):
+            for distance in (0.5, 3.0, 35.0, 100.0):
+                matrix = get_time_to_kill_matrix(self.stats, self.stats, distance, acc=acc)
+                self.assertEqual(matrix.shots.shape, (len(self.ships), len(self.ships)))
+                for (i, j), shots in np.ndenumerate(matrix.shots):
+                    try:
+                        ttk = func(self.stats[i], self.stats[j], distance, [], [])
+                    except (InfiniteShots, ZeroDivisionError):
+                        self.assertTrue(np.isnan(shots))
+                        continue
+                    self.assertEqual((ttk.shots, ttk.time), (shots, matrix.time[i, j]))
+
+    def test_ships_equal_to_stats(self):
+        """The matrix of the Ships calculated by the StatVectors equals that of their statistics"""
+        for acc in (False, True):
+            expected = get_time_to_kill_matrix(self.stats, self.stats, 3.0, acc=acc)
+            matrix = get_time_to_kill_matrix(self.ships, self.ships, 3.0, acc=acc)
+            self.assertTrue(np.allclose(matrix.time, expected.time, equal_nan=True))
+            self.assertTrue(np.array_equal(matrix.shots, expected.shots, equal_nan=True))
+
+    def test_missing_weapon(self):
+        matrix = get_time_to_kill_matrix([None, self.stats[0]], self.stats[:1], 3.0)
+        self.assertTrue(np.isnan(matrix.shots[0, 0]))
+        self.assertFalse(np.isnan(matrix.shots[1, 0]))
+
+    def test_render(self):
+        matrix = get_time_to_kill_matrix(self.stats, self.stats, 3.0, acc=True)
+        labels = [ship.name for ship in self.ships]
+        image = render_ttk_matrix(matrix, labels, labels)
+        self.assertGreater(image.size[0], 24 * 40)
+        self.assertGreater(image.size[1], 24 * 18)
+
+
+class TestTimeToKillCurve(TestCase):
+    def setUp(self):
+        self.source, self.target = Ship.deserialize(TEST_BUILD), Ship.stock("I2B")
+
+    def test_equal_to_scalar(self):
+        for acc, func in ((False, get_time_to_kill), (True, get_time_to_kill_acc)):
+            curve = get_time_to_kill_curve(self.source, self.target, ["df"], [], acc=acc)
+            self.assertEqual(curve.distances[-1], curve.ranges[-1])
+            self.assertEqual(curve.actives["source"], ["Distortion Field"])
+            for distance, shots, time in zip(curve.distances, curve.shots, curve.time):
+                ttk = func(self.source, self.target, distance, ["df"], [])
+                self.assertEqual((ttk.shots, ttk.time), (shots, time))
+
+    def test_out_of_range(self):
+        curve = get_time_to_kill_curve(self.source, self.target, [], [], distances=np.array([1.0, 100.0]))
+        self.assertFalse(np.isnan(curve.time[0]))
+        self.assertTrue(np.isnan(curve.time[1]))
+        self.assertIsNotNone(render_ttk_curve(curve))
+
+
+class TestTimeToKillSimulation(TestCase):
+    def setUp(self):
+        self.source, self.target = Ship.deserialize(TEST_BUILD), Ship.stock("I2B")
+        self.source_stats = get_ship_stats(self.source, ["df"])
+        self.target_stats = get_ship_stats(self.target, [])
+
+    def simulate(self, distance: float, acc: bool, seed=0):
+        return simulate_time_to_kill(self.source_stats, self.target_stats, distance, [], [], acc=acc, seed=seed)
+
+    def test_without_randomness(self):
+        """Without misses or critical hits every engagement is equal"""
+        ttk = self.simulate(3.0, False)
+        self.assertEqual(len(ttk.shots), SIMULATION_ENGAGEMENTS)
+        self.assertEqual(ttk.shots.min(), ttk.shots.max())
+        self.assertEqual(ttk.p10, ttk.p90)
+        expected = get_time_to_kill(self.source_stats, self.target_stats, 3.0, [], [])
+        self.assertLessEqual(abs(ttk.shots[0] - expected.shots), 1)
+
+    def test_distribution(self):
+        ttk = self.simulate(35.0, True)
+        self.assertLess(ttk.p10, ttk.p90)
+        self.assertTrue(ttk.p10 <= ttk.median <= ttk.p90)
+        expected = get_time_to_kill_acc(self.source_stats, self.target_stats, 35.0, [], [])
+        self.assertLessEqual(abs(np.median(ttk.shots) - expected.shots), 2)
+        self.assertTrue(np.array_equal(ttk.shots, self.simulate(35.0, True).shots))
+        self.assertEqual(ttk.actives["source"], ["Distortion Field"])
+
+    def test_out_of_range(self):
+        self.assertRaises(InfiniteShots, self.simulate, 100.0, False)
+
+
+class TestOptimizer(TestCase):
+    def setUp(self):
+        self.target = get_ship_stats(Ship.stock("I2B"))
+
+    def test_equal_to_brute_force(self):
+        """The pruned search finds the best build of all combinations"""
+        ship, categories = Ship.stock("R1S"), ("PrimaryWeapon", "ShieldProjector", "Armor", "Capacitor")
+        candidates = list()
+        for combination in product(*(get_options(ship, category) for category in categories)):
+            candidate = Ship.deserialize(ship.serialize())
+            for category, option in zip(categories, combination):
+                candidate[category] = build_component(ship, category, option)
+            candidates.append(candidate)
+        candidates = vectors.compile_batch(candidates)
+        target = get_target_stats(self.target)
+        for metric in METRICS:
+            result = optimize("R1S", self.target, metric, workers=0)
+            self.assertTrue(result.complete)
+            self.assertLess(result.searched, result.total)
+            best = score_candidates(candidates, metric, target, optimizer.OPTIMIZE_DISTANCE).min()
+            self.assertEqual(abs(best), result.candidates[0].score)
+            scores = [candidate.score for candidate in result.candidates]
+            self.assertEqual(scores, sorted(scores, reverse=metric != "ttk"))
+
+    def test_pool(self):
+        threshold, optimizer.POOL_THRESHOLD = optimizer.POOL_THRESHOLD, 0
+        try:
+            result = optimize("R1S", self.target, "ttk", workers=2)
+        finally:
+            optimizer.POOL_THRESHOLD = threshold
+        expected = optimize("R1S", self.target, "ttk", workers=0)
+        self.assertTrue(result.complete)
+        self.assertEqual(result.evaluated, expected.evaluated)
+        self.assertEqual([c.score for c in result.candidates], [c.score for c in expected.candidates])
+        self.assertEqual([c.build.serialize() for c in result.candidates],
+                         [c.build.serialize() for c in expected.candidates])
+
+    def test_budget(self):
+        result = optimize("R1S", self.target, "ttk", budget=0.0, workers=0)
+        self.assertFalse(result.complete)
+        self.assertEqual(len(result.candidates), 0)
+        self.assertIsNone(optimize("X9Z", self.target, "ttk"))
+
+
+def legacy_identify_category(category: str) -> (str, None):
+    if category in COMP_SHORT_HAND:
+        return COMP_SHORT_HAND[category]
+    if category in SHIP_KEY_TO_SH.keys():
+        return COMP_SHORT_HAND[SHIP_KEY_TO_SH[category]]
+    for full_name in COMP_SHORT_HAND.values():
+        if full_name.lower().startswith(category.lower()):
+            return full_name
+    return None
+
+
+def legacy_identify_component(category: str, component: str) -> (str, None):
+    if category in COMP_TYPES_REVERSE:
+        category = COMP_TYPES_REVERSE[category]
+    category = category.replace("2", str())
+    shorthand = component.lower()
+    category = getattr(abilities, category)
+    if shorthand in category:
+        return category[shorthand]
+    for key, value in category.items():
+        if key.startswith(shorthand):
+            return value
+        if value.lower().startswith(shorthand):
+            return value
+    for _, value in category.items():
+        key = str().join(word[0].lower() for word in value.split(" "))
+        if key == shorthand:
+            return value
+    return None
+
+
+def legacy_lookup_crew(name: str) -> (None, dict):
+    crew = assets.crew
+    name = name.lower()
+    for member in crew.keys():
+        if member.lower().startswith(name):
+            return crew[member]
+    return None
+
+
+def legacy_identify_active(active: str) -> str:
+    for key, active_dict in ACTIVES.items():
+        initials = "".join(l for l in key if l.isupper())
+        if key.startswith(active) or initials.lower() == active.lower():
+            break
+    else:
+        raise ActiveNotFound()
+    if active_dict is None:
+        raise ActiveNotSupported()
+    return key
+
+
+def get_identifiers(names: list) -> set:
+    """Return all prefixes, case variants and initials of a list of names"""
+    identifiers = {"", "x", "zz", "2", "-"}
+    for name in names:
+        initials = "".join(word[0] for word in name.split(" ") if word != "")
+        for string in (name, initials, "".join(l for l in name if l.isupper())):
+            for i in range(1, len(string) + 1):
+                identifiers.update((string[:i], string[:i].lower(), string[:i].upper(), string[:i] + "x"))
+    return identifiers
+
+
+class TestResolver(TestCase):
+    def test_identify_category(self):
+        names = list(COMP_SHORT_HAND) + list(SHIP_KEY_TO_SH) + list(COMP_SHORT_HAND.values())
+        for identifier in get_identifiers(names):
+            self.assertEqual(identify_category(identifier), legacy_identify_category(identifier), identifier)
+
+    def test_identify_component(self):
+        for category in list(COMPONENT_TYPES) + list(COMPONENT_TYPES.values()):
+            components = getattr(abilities, category.replace("2", "")) if category in COMPONENT_TYPES else \
+                getattr(abilities, COMP_TYPES_REVERSE[category].replace("2", ""))
+            for identifier in get_identifiers(list(components) + list(components.values())):
+                self.assertEqual(identify_component(category, identifier),
+                                 legacy_identify_component(category, identifier), (category, identifier))
+
+    def test_lookup_crew(self):
+        for identifier in get_identifiers(list(assets.crew.keys())):
+            self.assertIs(lookup_crew(identifier), legacy_lookup_crew(identifier), identifier)
+
+    def test_identify_active(self):
+        for identifier in get_identifiers(list(ACTIVES)):
+            try:
+                expected = legacy_identify_active(identifier)
+            except (ActiveNotFound, ActiveNotSupported) as e:
+                self.assertRaises(type(e), ShipStats.identify_active, identifier)
+                continue
+            self.assertEqual(ShipStats.identify_active(identifier), expected, identifier)
+
+
+class TestBuildEncoding(TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.ships = [Ship.deserialize(TEST_BUILD + "crew/Engineering/Risha;crew/Offensive/Kira Carsen;")]
+        for _ in range(100):
+            ship = Ship.random()
+            for component in (c for c in ship.components.values() if c is not None):
+                for upgrade in UPGRADE_BITS:
+                    component.upgrades[upgrade] = random.random() > 0.5
+            self.ships.append(ship)
+
+    def test_round_trip(self):
+        for ship in self.ships:
+            string = ship.encode()
+            self.assertTrue(string.startswith(ENCODING_PREFIX))
+            self.assertLess(len(string), len(ship.serialize()))
+            decoded = Ship.deserialize(string)
+            self.assertEqual(decoded.serialize(), ship.serialize())
+            self.assertEqual(decoded.crew, ship.crew)
+            for key, component in ship.components.items():
+                if component is None:
+                    self.assertIsNone(decoded[key])
+                    continue
+                self.assertEqual(decoded[key].index, component.index)
+                self.assertEqual({u for u, v in decoded[key] if v is True}, {u for u, v in component if v is True})
+
+    def test_slot_order(self):
+        """The order of the encoded values is fixed, so stored builds always decode the same"""
+        self.assertEqual(COMPONENT_KEYS_ORDERED, (
+            "primary", "primary2", "secondary", "secondary2", "engine", "shields", "systems",
+            "armor", "reactor", "magazine", "sensors", "thrusters", "capacitor"))
+        self.assertEqual(list(Ship("Imperial_S-SC4_Bloodmark").components), list(COMPONENT_KEYS_ORDERED))
+        ships, _, crew, _ = get_encoding_tables()
+        self.assertEqual(ships, sorted(ships))
+        self.assertEqual(crew, sorted(crew))
+
+    def test_legacy_fallback(self):
+        ship = Ship.deserialize(TEST_BUILD)
+        self.assertEqual(Ship.deserialize(ship.serialize()).encode(), ship.encode())
+        self.assertRaises(ValueError, Ship.decode, TEST_BUILD)
+        self.assertRaises(ValueError, Ship.decode, ENCODING_PREFIX + "AAAA")
+
+
+class TestShipSlots(TestCase):
+    def setUp(self):
+        self.ship = Ship.deserialize(TEST_BUILD + "crew/Engineering/Risha;")
+
+    def test_slots(self):
+        self.assertFalse(hasattr(self.ship, "__dict__"))
+        self.assertFalse(hasattr(self.ship["primary"], "__dict__"))
+        encoded = self.ship.encode()
+        tracemalloc.start()
+        try:
+            ships = [Ship.decode(encoded) for _ in range(100)]
+            size = tracemalloc.get_traced_memory()[0] / len(ships)
+        finally:
+            tracemalloc.stop()
+        self.assertLess(size, 2048)
+
+    def test_upgrades(self):
+        component = self.ship["shields"]
+        self.assertEqual(component.mask, 1)
+        self.assertTrue(component[(0, 0)])
+        self.assertEqual(list(component.upgrades), [(0, 0), (1, 0), (2, 0), (2, 1), (3, 0), (3, 1), (4, 0), (4, 1)])
+        component[(2, 0)] = True
+        component[(2, 1)] = True
+        self.assertFalse(component[(2, 0)])
+        self.assertTrue(component.upgrades[(2, 1)])
+        component.upgrades.update({(3, 0): True, (2, 1): False})
+        self.assertEqual({u for u, v in component if v}, {(0, 0), (3, 0)})
+        self.assertEqual(Ship.build_upgrade_string(component.upgrades, component.type),
+                         Ship.build_upgrade_string(component.mask, component.type))
+        self.assertRaises(ValueError, component.__setitem__, (1, 2), True)
+
+    def test_crew(self):
+        self.assertEqual(self.ship.crew["Engineering"], ("Republic", "Engineering", "Risha"))
+        self.assertIsNone(self.ship["Offensive"])
+        self.ship.crew = {"Offensive": ("Republic", "Offensive", "Kira Carsen")}
+        self.assertIsNone(self.ship.crew["Engineering"])
+        self.assertEqual(dict(self.ship.crew)["Offensive"][2], "Kira Carsen")
+        self.assertIn("crew/Offensive/Kira Carsen;", self.ship.serialize())
+
+
+class TestRandomBatch(TestCase):
+    def test_seed(self):
+        builds = [[ship.encode() for ship in Ship.random_batch(50, seed=1234)] for _ in range(2)]
+        self.assertEqual(builds[0], builds[1])
+        self.assertNotEqual(builds[0], [ship.encode() for ship in Ship.random_batch(50, seed=4321)])
+
+    def test_seed_literal(self):
+        """A seed gives the same builds in every process, whatever the order of dicts"""
+        ships = Ship.random_batch(4, seed=1234)
+        self.assertEqual([ship.ship_name for ship in ships], [
+            "Republic_SGS-45_Quarrel", "Imperial_S-13_Sting", "Imperial_GSS-3_Mangler", "Republic_FT-6_Pike"])
+        self.assertEqual([ship["primary"].name for ship in ships], [
+            "Burst Laser Cannon", "Light Laser Cannon", "Light Laser Cannon", "Heavy Laser Cannon"])
+
+    def test_builds(self):
+        data = load_ship_data()
+        for ship in Ship.random_batch(200, seed=42):
+            names = [c.name for c in ship.components.values() if c is not None]
+            self.assertEqual(len(names), len(set(names)))
+            self.assertNotIn("Empty", names)
+            for key, component in ship.components.items():
+                if component is None:
+                    continue
+                category = COMP_SHORT_HAND[SHIP_KEY_TO_SH[key]]
+                self.assertIn(component.name, [c["Name"] for c in data[ship.ship_name][category]])
+            self.assertEqual(Ship.decode(ship.encode()).serialize(), ship.serialize())